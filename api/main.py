@@ -5,9 +5,12 @@ from pydantic import BaseModel
 
 from application.use_cases import SyncAllEntitiesUseCase, SyncDynamicsEntityUseCase
 from application.bidirectional_sync_use_case import BidirectionalSyncUseCase
+from application.sync_context import SyncContext
+from application.entity_scheduler import EntityScheduler
 from application.employee_modifications_use_case import SyncEmployeeModificationsUseCase
 from config.logging_config import setup_logging
-from domain.constants import ENTITIES
+from config.settings import settings
+from domain.constants import ENTITIES, BIDIRECTIONAL_ENTITIES, ENTITY_DEPENDENCIES
 from infrastructure.database_adapter import MySQLDatabaseAdapter
 from infrastructure.dynamics_api_adapter import DynamicsAPIAdapter
 from infrastructure.employee_modifications_adapter import EmployeeModificationsAdapter
@@ -26,23 +29,9 @@ logger = setup_logging()
 app = FastAPI(title="Interbus Integration API", version="1.0.0")
 
 
-BIDIRECTIONAL_ENTITIES = [
-    'CompanyATISAs',
-    'WorkerPlaces',
-    'ContributionAccountCodeCCs',
-    'HolidaysAbsencesGroupATISAs',
-    'VacationBalances',
-    'IncidentGroupATISAs',
-    'AdvanceGroupATISAs',
-    'LibrariesGroupATISAs',
-    'LeaveGroupATISAs',
-    'HighsLowsChanges',
-    'VacationCalenders'
-]
-
-
 class SyncLimitRequest(BaseModel):
     limit: Optional[int] = None
+    full_reconcile: bool = False
 
 
 class SyncTrabajadoresRequest(BaseModel):
@@ -70,15 +59,21 @@ def sync_all() -> Dict[str, Any]:
 
     results: List[Dict[str, Any]] = []
 
-    # 1) Bidireccional
-    for entity in BIDIRECTIONAL_ENTITIES:
-        if entity in ENTITIES:
+    # 1) Bidireccional (datos compartidos entre entidades durante la petición)
+    # en paralelo según dependencias (WorkerPlaces antes que ContributionAccountCodeCCs)
+    with SyncContext("/sync/all") as context:
+        def sync_bidirectional(entity: str) -> Dict[str, Any]:
             bidirectional_use_case = BidirectionalSyncUseCase(
                 token_service,
                 dynamics_api,
-                database_adapter
+                database_adapter,
+                context=context
             )
-            results.append(bidirectional_use_case.execute(entity))
+            return bidirectional_use_case.execute(entity)
+
+        scheduler = EntityScheduler(settings.sync_max_parallel_entities, ENTITY_DEPENDENCIES)
+        report = scheduler.run([e for e in BIDIRECTIONAL_ENTITIES if e in ENTITIES], sync_bidirectional)
+        results.extend(report["results"])
 
     # 2) Standard
     standard_entities = [e for e in ENTITIES if e not in BIDIRECTIONAL_ENTITIES]
@@ -90,7 +85,15 @@ def sync_all() -> Dict[str, Any]:
         )
         results.extend(sync_all_use_case.execute(standard_entities))
 
-    return {"results": results}
+    return {
+        "results": results,
+        "timings": {
+            "bidirectional_seconds": round(report["elapsed_seconds"], 3),
+            "entities": {entity: round(seconds, 3) for entity, seconds in report["timings"].items()},
+            "critical_path": report["critical_path"],
+            "critical_path_seconds": round(report["critical_path_seconds"], 3),
+        }
+    }
 
 
 @app.post("/sync/entity/{entity_name}")
@@ -128,7 +131,7 @@ def sync_employee_modifications(payload: SyncLimitRequest) -> Dict[str, Any]:
         e03800_adapter
     )
 
-    stats = use_case.sync(access_token, payload.limit)
+    stats = use_case.sync(access_token, payload.limit, full_reconcile=payload.full_reconcile)
     return stats
 
 
@@ -2,15 +2,26 @@
 Caso de uso para sincronización bidireccional entre e03800 y Dynamics 365.
 Compara datos y realiza las operaciones necesarias.
 """
-from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from domain.ports import TokenRepository, DynamicsAPIAdapter, DatabaseAdapter
+from application.sync_context import SyncContext
+from domain.constants import GRUPOSERVICIOS_SERVICE_IDS
 from infrastructure.e03800_database_adapter import E03800DatabaseAdapter
+from infrastructure.dynamics_write_executor import ConcurrentWriteExecutor
+from config.settings import settings
 import logging
 import json
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
 
+class SourceExtractionCancelled(Exception):
+    """La lectura de un origen se detuvo porque falló la del otro."""
+
+
 class BidirectionalSyncUseCase:
     """
     Caso de uso para sincronización bidireccional de HolidaysAbsencesGroupATISAs.
@@ -21,12 +32,20 @@ class BidirectionalSyncUseCase:
         self,
         token_repository: TokenRepository,
         dynamics_api: DynamicsAPIAdapter,
-        database_adapter: DatabaseAdapter
+        database_adapter: DatabaseAdapter,
+        context: Optional[SyncContext] = None
     ):
         self._token_repository = token_repository
         self._dynamics_api = dynamics_api
         self._database_adapter = database_adapter
         self._e03800_adapter = E03800DatabaseAdapter()
+        # Memo compartido por todas las entidades de la ejecución (opcional)
+        self._context = context
+        self._e03800_adapter.set_run_cache(context)
+        # Operaciones por petición $batch (0 = una petición HTTP por operación)
+        self._write_batch_size = settings.dynamics_batch_size
+        # Escrituras individuales en paralelo (DYNAMICS_WRITE_CONCURRENCY) con reintentos ante 429/503
+        self._write_executor = ConcurrentWriteExecutor(dynamics_api)
     
     def execute(self, entity_name: str = 'HolidaysAbsencesGroupATISAs') -> Dict[str, Any]:
         """
@@ -46,74 +65,33 @@ class BidirectionalSyncUseCase:
             # 1. Obtener token
             access_token = self._token_repository.get_access_token()
             
-            # 2. Obtener datos de e03800
-            # CompanyATISAs -> tabla especial empresas
-            # WorkerPlaces -> DBF contrcen.dbf
-            # VacationCalenders -> tabla especial vac_calendarios (año actual)
-            # Otras entidades -> tabla gruposervicios con id_servicios específico
-            if entity_name == 'CompanyATISAs':
-                e03800_data = self._e03800_adapter.get_empresas()
-                logger.info(f"✓ e03800: {len(e03800_data)} registros (empresas)")
-            elif entity_name == 'WorkerPlaces':
-                e03800_data = self._e03800_adapter.get_worker_places()
-                logger.info(f"✓ e03800: {len(e03800_data)} registros (contrcen.dbf FacilityCode)")
-            elif entity_name == 'ContributionAccountCodeCCs':
-                e03800_data = self._e03800_adapter.get_contribution_account_code_ccs()
-                logger.info(f"✓ e03800: {len(e03800_data)} registros (ccc + contrcen.dbf)")
-            elif entity_name == 'VacationBalances':
-                e03800_data = self._e03800_adapter.get_vacation_balances()
-                logger.info(f"✓ e03800: {len(e03800_data)} registros (convvacas)")
-            elif entity_name == 'VacationCalenders':
-                e03800_data = self._e03800_adapter.get_vacation_calendars_current_year()
-                logger.info(f"✓ e03800: {len(e03800_data)} registros (vac_calendarios, año actual)")
-            else:
-                # HolidaysAbsencesGroupATISAs -> id_servicios = 30
-                # IncidentGroupATISAs        -> id_servicios = 10
-                # AdvanceGroupATISAs         -> id_servicios = 20
-                # LibrariesGroupATISAs       -> id_servicios = 80
-                # LeaveGroupATISAs           -> id_servicios = 100
-                # HighsLowsChanges           -> id_servicios = 110
-                if entity_name == 'HolidaysAbsencesGroupATISAs':
-                    service_id = 30
-                elif entity_name == 'IncidentGroupATISAs':
-                    service_id = 10
-                elif entity_name == 'AdvanceGroupATISAs':
-                    service_id = 20
-                elif entity_name == 'LibrariesGroupATISAs':
-                    service_id = 80
-                elif entity_name == 'LeaveGroupATISAs':
-                    service_id = 100
-                elif entity_name == 'HighsLowsChanges':
-                    service_id = 110
-                else:
-                    service_id = 30
-                e03800_data = self._e03800_adapter.get_gruposervicios_by_service(service_id)
-                logger.info(f"✓ e03800: {len(e03800_data)} registros (id_servicios={service_id})")
-            
-            # 3. Obtener datos de Dynamics 365
-            # Filtrar por dataAreaId='itb' solo para las entidades que lo soportan
-            # ContributionAccountCodeCCs y VacationBalances no tienen dataAreaId
-            if entity_name not in ['ContributionAccountCodeCCs', 'VacationBalances']:
-                dynamics_data = self._dynamics_api.get_entity_data(entity_name, access_token, filter_expression="dataAreaId eq 'itb'")
-            else:
-                dynamics_data = self._dynamics_api.get_entity_data(entity_name, access_token)
+            # 2-3. Obtener datos de e03800 y de Dynamics 365 (en paralelo)
+            e03800_data, dynamics_snapshot, extraction_timings = self._extract_sources(entity_name, access_token)
             
+            # Se compara solo la empresa itb; la lectura completa sirve de base para la instantánea
+            dynamics_data = self._company_records(entity_name, dynamics_snapshot)
             logger.info(f"✓ Dynamics 365: {len(dynamics_data)} registros")
             
             # 4. Comparar y determinar acciones
-            sync_result = self._compare_and_sync(
+            sync_result, applied_writes = self._compare_and_sync(
                 e03800_data,
                 dynamics_data,
                 access_token,
                 entity_name
             )
             
-            # 5. Obtener datos actualizados de Dynamics después de los cambios
-            updated_dynamics_data = self._dynamics_api.get_entity_data(entity_name, access_token)
+            # 5. Estado de Dynamics después de los cambios: lectura inicial + escrituras confirmadas.
+            # Solo se vuelve a descargar la entidad si se pide verificación o alguna escritura falló
+            failed_writes = sum(1 for _, write_result in applied_writes if write_result.get('error'))
+            if settings.sync_verify_after_write or failed_writes:
+                if failed_writes:
+                    logger.info(f"   {failed_writes} escrituras fallidas: se relee {entity_name} de Dynamics")
+                updated_dynamics_data = self._read_dynamics(entity_name, access_token)
+            else:
+                updated_dynamics_data = self._apply_writes(dynamics_snapshot, applied_writes)
             
             # 6. Actualizar base de datos interbus_365 con los datos actualizados
-            self._database_adapter.clear_entity_data(entity_name)
-            records_saved = self._database_adapter.save_entity_data(entity_name, updated_dynamics_data)
+            records_saved = self._database_adapter.replace_entity_data(entity_name, updated_dynamics_data)
             
             # Mostrar resumen
             logger.info(f"\n📊 Resumen de acciones:")
@@ -130,7 +108,8 @@ class BidirectionalSyncUseCase:
                 "dynamics_initial_count": len(dynamics_data),
                 "dynamics_final_count": len(updated_dynamics_data),
                 "records_saved": records_saved,
-                "actions_taken": sync_result
+                "actions_taken": sync_result,
+                "timings": extraction_timings
             }
             
         except Exception as e:
@@ -141,13 +120,212 @@ class BidirectionalSyncUseCase:
                 "error": str(e)
             }
     
+    def _extract_sources(
+        self,
+        entity_name: str,
+        access_token: str
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, float]]:
+        """
+        Obtiene los datos de e03800 y de Dynamics 365.
+        
+        Con SYNC_PARALLEL_EXTRACTION ambos orígenes se leen a la vez en dos
+        hilos. Si uno falla se avisa al otro: la lectura de Dynamics se
+        detiene en la siguiente página y la de e03800 (consulta MySQL o DBF,
+        no interrumpible) se descarta al terminar. Se propaga el primer error.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            
+        Returns:
+            Tupla (datos e03800, datos Dynamics, segundos de cada lectura)
+        """
+        timings: Dict[str, float] = {}
+        cancel_event = threading.Event()
+        
+        def timed(side: str, read: Callable[[], List[Dict[str, Any]]]) -> Callable[[], List[Dict[str, Any]]]:
+            def run() -> List[Dict[str, Any]]:
+                started = time.monotonic()
+                try:
+                    return read()
+                except Exception:
+                    cancel_event.set()
+                    raise
+                finally:
+                    timings[f"{side}_seconds"] = round(time.monotonic() - started, 3)
+            return run
+        
+        read_e03800 = timed("e03800", lambda: self._read_e03800(entity_name))
+        read_dynamics = timed("dynamics", lambda: self._read_dynamics_source(entity_name, access_token, cancel_event))
+        
+        started = time.monotonic()
+        if not settings.sync_parallel_extraction:
+            e03800_data = read_e03800()
+            dynamics_data = read_dynamics()
+        else:
+            pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"extract-{entity_name}")
+            errors: List[BaseException] = []
+            try:
+                futures = [pool.submit(read_e03800), pool.submit(read_dynamics)]
+                wait(futures, return_when=FIRST_EXCEPTION)
+                # El error original tiene prioridad sobre la cancelación que provoca
+                errors = [f.exception() for f in futures if f.done() and f.exception() is not None]
+                errors.sort(key=lambda error: isinstance(error, SourceExtractionCancelled))
+                if errors:
+                    raise errors[0]
+                e03800_data, dynamics_data = (future.result() for future in futures)
+            finally:
+                # Tras un error no se espera al otro origen: termina en segundo plano
+                pool.shutdown(wait=not errors, cancel_futures=True)
+        timings["extraction_seconds"] = round(time.monotonic() - started, 3)
+        
+        logger.info(
+            f"⏱ Lectura de orígenes {entity_name}: e03800 {timings['e03800_seconds']}s, "
+            f"Dynamics {timings['dynamics_seconds']}s, total {timings['extraction_seconds']}s"
+        )
+        return e03800_data, dynamics_data, timings
+    
+    def _read_e03800(self, entity_name: str) -> List[Dict[str, Any]]:
+        """
+        Obtiene los datos de e03800 de la entidad.
+        
+        CompanyATISAs -> tabla especial empresas
+        WorkerPlaces -> DBF contrcen.dbf
+        VacationCalenders -> tabla especial vac_calendarios (año actual)
+        Otras entidades -> tabla gruposervicios con id_servicios específico
+        
+        Args:
+            entity_name: Nombre de la entidad
+            
+        Returns:
+            Lista de registros de e03800
+        """
+        if entity_name == 'CompanyATISAs':
+            e03800_data = self._e03800_adapter.get_empresas()
+            logger.info(f"✓ e03800: {len(e03800_data)} registros (empresas)")
+        elif entity_name == 'WorkerPlaces':
+            e03800_data = self._e03800_adapter.get_worker_places()
+            logger.info(f"✓ e03800: {len(e03800_data)} registros (contrcen.dbf FacilityCode)")
+        elif entity_name == 'ContributionAccountCodeCCs':
+            e03800_data = self._e03800_adapter.get_contribution_account_code_ccs()
+            logger.info(f"✓ e03800: {len(e03800_data)} registros (ccc + contrcen.dbf)")
+        elif entity_name == 'VacationBalances':
+            e03800_data = self._e03800_adapter.get_vacation_balances()
+            logger.info(f"✓ e03800: {len(e03800_data)} registros (convvacas)")
+        elif entity_name == 'VacationCalenders':
+            e03800_data = self._e03800_adapter.get_vacation_calendars_current_year()
+            logger.info(f"✓ e03800: {len(e03800_data)} registros (vac_calendarios, año actual)")
+        else:
+            # HolidaysAbsencesGroupATISAs, IncidentGroupATISAs, AdvanceGroupATISAs,
+            # LibrariesGroupATISAs, LeaveGroupATISAs, HighsLowsChanges (ver GRUPOSERVICIOS_SERVICE_IDS)
+            service_id = GRUPOSERVICIOS_SERVICE_IDS.get(entity_name, 30)
+            e03800_data = self._e03800_adapter.get_gruposervicios_by_service(service_id)
+            logger.info(f"✓ e03800: {len(e03800_data)} registros (id_servicios={service_id})")
+        return e03800_data
+    
+    def _read_dynamics_source(
+        self,
+        entity_name: str,
+        access_token: str,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtiene la entidad completa de Dynamics 365 (sin filtrar por empresa).
+        
+        Una sola descarga sirve para comparar (ver _company_records) y como
+        base de la instantánea que se guarda después de las escrituras.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            cancel_event: Evento que detiene la lectura entre páginas
+            
+        Returns:
+            Lista de registros de Dynamics
+        """
+        return self._read_dynamics(entity_name, access_token, cancel_event=cancel_event)
+    
+    def _company_records(self, entity_name: str, dynamics_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Registros de Dynamics que se comparan con e03800.
+        
+        Equivale al filtro OData dataAreaId eq 'itb' (sin distinguir
+        mayúsculas), aplicado solo a las entidades que lo soportan
+        (ContributionAccountCodeCCs y VacationBalances no tienen dataAreaId).
+        
+        Args:
+            entity_name: Nombre de la entidad
+            dynamics_data: Lectura completa de la entidad
+            
+        Returns:
+            Lista de registros (los mismos objetos de dynamics_data)
+        """
+        if entity_name in ['ContributionAccountCodeCCs', 'VacationBalances']:
+            return dynamics_data
+        return [record for record in dynamics_data if str(record.get('dataAreaId') or '').lower() == 'itb']
+    
+    def _apply_writes(
+        self,
+        dynamics_data: List[Dict[str, Any]],
+        applied_writes: List[Tuple[Dict[str, Any], Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Deriva el estado de Dynamics después de las escrituras sin volver a descargarlo.
+        
+        Los borrados quitan el registro leído, las actualizaciones le aplican
+        los datos del PATCH (y la respuesta, con su ETag, si la hay) y las
+        altas añaden el registro devuelto por el POST (o los datos enviados si
+        la respuesta no trae cuerpo). No se modifican los registros
+        originales, que pueden estar memorizados.
+        
+        Args:
+            dynamics_data: Lectura completa de la entidad antes de las escrituras
+            applied_writes: Pares (escritura, resultado) devueltos por _compare_and_sync
+            
+        Returns:
+            Lista de registros de Dynamics tras los cambios
+        """
+        removed = set()
+        replaced: Dict[int, Dict[str, Any]] = {}
+        created: List[Dict[str, Any]] = []
+        
+        for write, write_result in applied_writes:
+            if write_result.get('error'):
+                continue
+            action = write['action']
+            response = write_result.get('result')
+            if action in ('delete', 'duplicate'):
+                removed.add(id(write['record']))
+            elif action == 'update':
+                # Se conserva el @odata.etag leído (o el que devuelva el PATCH) para que el
+                # registro tenga la misma forma que en una descarga real; si se quitara, con
+                # SNAPSHOT_MODE=incremental su hash cambiaría de nuevo en la siguiente lectura
+                record = dict(write['record'])
+                record.update(write['request']['data'])
+                if isinstance(response, dict):
+                    record.update(response)
+                record.pop('@odata.context', None)
+                replaced[id(write['record'])] = record
+            elif action == 'create':
+                record = dict(write['request']['data'])
+                if isinstance(response, dict):
+                    record.update(response)
+                record.pop('@odata.context', None)
+                created.append(record)
+        
+        return [
+            replaced.get(id(record), record)
+            for record in dynamics_data
+            if id(record) not in removed
+        ] + created
+    
     def _compare_and_sync(
         self,
         e03800_data: List[Dict[str, Any]],
         dynamics_data: List[Dict[str, Any]],
         access_token: str,
         entity_name: str
-    ) -> Dict[str, Any]:
+    ) -> Tuple[Dict[str, Any], List[Tuple[Dict[str, Any], Dict[str, Any]]]]:
         """
         Compara los datos y realiza las acciones necesarias.
         
@@ -155,6 +333,7 @@ class BidirectionalSyncUseCase:
         1. Por cada registro de Dynamics, buscar su dataAreaId en e03800
         2. Comparar Description (Dynamics) con nombre (e03800)
         3. Decidir acción: ELIMINAR, ACTUALIZAR, CREAR o SIN CAMBIOS
+        4. Ejecutar las escrituras pendientes (en lotes $batch si está configurado)
         
         Args:
             e03800_data: Datos de e03800 (tabla gruposervicios)
@@ -163,7 +342,7 @@ class BidirectionalSyncUseCase:
             entity_name: Nombre de la entidad
             
         Returns:
-            Resumen de acciones realizadas
+            Tupla (resumen de acciones realizadas, pares (escritura, resultado) ejecutados)
         """
         actions_taken = {
             "created": [],
@@ -187,6 +366,9 @@ class BidirectionalSyncUseCase:
                         e03800_by_eqmccc[eqmccc] = []
                     e03800_by_eqmccc[eqmccc].append(item)
         
+        # Escrituras pendientes, en el orden en que se decidieron
+        pending_writes: List[Dict[str, Any]] = []
+        
         # 1. Iterar sobre cada registro de Dynamics y comparar
         seen_dynamics_ids = set()
         
@@ -225,10 +407,12 @@ class BidirectionalSyncUseCase:
                     else:
                         key_field = 'EQMHolidaysAbsencesGroupATISAId'
                     
-                    self._delete_from_dynamics(entity_name, dynamics_record, data_area_id, access_token, key_field)
-                    if "duplicates_removed" not in actions_taken:
-                        actions_taken["duplicates_removed"] = []
-                    actions_taken["duplicates_removed"].append(data_area_id)
+                    pending_writes.append({
+                        'action': 'duplicate',
+                        'item_id': data_area_id,
+                        'record': dynamics_record,
+                        'request': self._build_delete_request(entity_name, data_area_id, key_field)
+                    })
                     continue # Pasar al siguiente registro de Dynamics
                 except Exception as e:
                     logger.error(f"   ✗ Error al eliminar duplicado: {e}")
@@ -288,9 +472,13 @@ class BidirectionalSyncUseCase:
                         # Nombre o CIF diferente, ACTUALIZAR
                         try:
                             key_field = 'EQMCompanyIdATISA'
-                            # Pasar el item completo para que _update_in_dynamics pueda extraer el CIF
-                            self._update_in_dynamics(entity_name, dynamics_record, data_area_id, e03800_nombre, access_token, key_field, e03800_item)
-                            actions_taken["updated"].append(data_area_id)
+                            # Pasar el item completo para que _build_update_request pueda extraer el CIF
+                            pending_writes.append({
+                                'action': 'update',
+                                'item_id': data_area_id,
+                                'record': dynamics_record,
+                                'request': self._build_update_request(entity_name, data_area_id, e03800_nombre, key_field, e03800_item)
+                            })
                         except Exception as e:
                             logger.error(f"   ✗ Error al actualizar {data_area_id}: {e}")
                 elif dynamics_description == e03800_nombre:
@@ -319,8 +507,12 @@ class BidirectionalSyncUseCase:
                             key_field = 'EQMVacationBalanceId'
                         else:
                             key_field = 'EQMHolidaysAbsencesGroupATISAId'
-                        self._update_in_dynamics(entity_name, dynamics_record, data_area_id, e03800_nombre, access_token, key_field)
-                        actions_taken["updated"].append(data_area_id)
+                        pending_writes.append({
+                            'action': 'update',
+                            'item_id': data_area_id,
+                            'record': dynamics_record,
+                            'request': self._build_update_request(entity_name, data_area_id, e03800_nombre, key_field)
+                        })
                     except Exception as e:
                         logger.error(f"   ✗ Error al actualizar {data_area_id}: {e}")
             else:
@@ -352,8 +544,12 @@ class BidirectionalSyncUseCase:
                     else:
                         key_field = 'EQMHolidaysAbsencesGroupATISAId'
                     
-                    self._delete_from_dynamics(entity_name, dynamics_record, data_area_id, access_token, key_field)
-                    actions_taken["deleted"].append(data_area_id)
+                    pending_writes.append({
+                        'action': 'delete',
+                        'item_id': data_area_id,
+                        'record': dynamics_record,
+                        'request': self._build_delete_request(entity_name, data_area_id, key_field)
+                    })
                 except Exception as e:
                     # Solo logear errores reales, no errores esperados
                     error_str = str(e)
@@ -453,28 +649,54 @@ class BidirectionalSyncUseCase:
                         "Description": item_nombre
                     }
                 
-                try:
-                    logger.debug(f"   Intentando crear registro ID: {item_id}")
-                    logger.debug(f"   Datos a enviar: {data_to_create}")
-                    self._dynamics_api.create_entity_data(entity_name, access_token, data_to_create)
-                    logger.info(f"   ✓ Creado registro ID: {item_id}")
-                    actions_taken["created"].append(item_id)
-                except Exception as e:
-                    error_message = str(e)
-                    # Si el registro ya existe, registrarlo pero continuar
-                    if "already exists" in error_message or "ya existe" in error_message:
-                        logger.warning(f"   ⚠ Registro ya existe en Dynamics: {item_id}")
-                        actions_taken["unchanged"].append(item_id)
-                    else:
-                        logger.error(f"   ✗ Error al crear registro ID {item_id}: {e}")
-                        logger.error(f"   Datos que causaron el error: {data_to_create}")
-                        # Agregar a una lista de errores para tracking
-                        if "errors" not in actions_taken:
-                            actions_taken["errors"] = []
-                        actions_taken["errors"].append({"id": item_id, "error": error_message})
-                        # No hacer raise para continuar con otros registros
-        
-        return actions_taken
+                logger.debug(f"   Datos a enviar para crear registro ID {item_id}: {data_to_create}")
+                pending_writes.append({
+                    'action': 'create',
+                    'item_id': item_id,
+                    'record': None,
+                    'request': self._dynamics_api.build_create_request(entity_name, data_to_create)
+                })
+        
+        # 3. Ejecutar escrituras y anotar resultados en el mismo orden en que se decidieron
+        write_results = self._execute_writes(pending_writes, access_token)
+        if pending_writes and self._context is not None:
+            # Las lecturas memorizadas de la entidad ya no reflejan Dynamics
+            self._context.invalidate(('dynamics', entity_name))
+        for write, write_result in zip(pending_writes, write_results):
+            self._record_write_result(actions_taken, write, write_result)
+        
+        return actions_taken, list(zip(pending_writes, write_results))
+    
+    def _read_dynamics(
+        self,
+        entity_name: str,
+        access_token: str,
+        filter_expression: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Lee una entidad de Dynamics 365, memorizada en el contexto de la ejecución si lo hay.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            filter_expression: Filtro OData opcional
+            cancel_event: Evento que detiene la lectura entre páginas
+            
+        Returns:
+            Lista de registros de Dynamics
+        """
+        def load() -> List[Dict[str, Any]]:
+            records: List[Dict[str, Any]] = []
+            for page in self._dynamics_api.iter_entity_pages(entity_name, access_token, filter_expression=filter_expression):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise SourceExtractionCancelled(f"Lectura de {entity_name} en Dynamics cancelada")
+                records.extend(page)
+            return records
+        
+        if self._context is None:
+            return load()
+        return self._context.memoize(('dynamics', entity_name, filter_expression), load)
     
     def _extract_data_area_id_from_dynamics(self, dynamics_item: Dict[str, Any], entity_name: str) -> str:
         """
@@ -580,25 +802,23 @@ class BidirectionalSyncUseCase:
             "Description": e03800_item['nombre']
         }
     
-    def _update_in_dynamics(
+    def _build_update_request(
         self, 
         entity_name: str, 
-        item: Dict[str, Any], 
         item_id: str, 
         new_description: str, 
-        access_token: str,
         key_field: str,
         e03800_item: Optional[Dict[str, Any]] = None
-    ):
+    ) -> Dict[str, Any]:
         """
-        Actualiza un registro en Dynamics 365.
+        Construye la petición de actualización de un registro en Dynamics 365.
         
         Args:
             entity_name: Nombre de la entidad
-            item: Item a actualizar
             item_id: ID del registro
             new_description: Nueva descripción
-            access_token: Token de acceso
+            key_field: Campo clave de la entidad
+            e03800_item: Item de e03800 (para campos adicionales de CompanyATISAs)
         """
         # Actualizar la descripción en Dynamics 365
         update_data = {"Description": new_description}
@@ -608,31 +828,110 @@ class BidirectionalSyncUseCase:
             update_data["VATNum"] = str(e03800_item.get('cif') or '').strip()
             update_data["QuotationAccount"] = str(e03800_item.get('quotation_account') or '').strip()
         
-        self._dynamics_api.update_entity_data(
+        return self._dynamics_api.build_update_request(
             entity_name=entity_name,
-            access_token=access_token,
             item_id=item_id,
             data=update_data,
             key_field=key_field
         )
     
-    def _delete_from_dynamics(
+    def _build_delete_request(
         self, 
         entity_name: str, 
-        item: Dict[str, Any], 
         item_id: str, 
-        access_token: str,
         key_field: str
-    ):
+    ) -> Dict[str, Any]:
         """
-        Elimina un registro de Dynamics 365.
+        Construye la petición de borrado de un registro en Dynamics 365.
         
         Args:
             entity_name: Nombre de la entidad
-            item: Item a eliminar
             item_id: ID del registro
+            key_field: Campo clave de la entidad
+        """
+        return self._dynamics_api.build_delete_request(entity_name, item_id, key_field=key_field)
+    
+    def _execute_writes(
+        self,
+        pending_writes: List[Dict[str, Any]],
+        access_token: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Ejecuta las escrituras pendientes contra Dynamics 365.
+        
+        Con _write_batch_size > 0 se agrupan en peticiones $batch; si no,
+        se envía una petición HTTP por operación a través del ejecutor
+        concurrente, que reintenta las llamadas limitadas (429/503). Las
+        operaciones sobre el mismo registro (item_id) se ejecutan en su
+        orden original aunque haya varios workers.
+        
+        Args:
+            pending_writes: Escrituras pendientes
             access_token: Token de acceso
+            
+        Returns:
+            Lista alineada con pending_writes de diccionarios con 'result' y 'error'
         """
-        # Usar el método del adaptador de Dynamics API
-        self._dynamics_api.delete_entity_data(entity_name, access_token, item_id, key_field=key_field)
-
+        if not pending_writes:
+            return []
+        
+        requests = [write['request'] for write in pending_writes]
+        
+        if self._write_batch_size > 0:
+            return self._dynamics_api.execute_batch(access_token, requests, self._write_batch_size)
+        
+        keys = [write['item_id'] for write in pending_writes]
+        return self._write_executor.execute(access_token, requests, keys)
+    
+    def _record_write_result(
+        self,
+        actions_taken: Dict[str, Any],
+        write: Dict[str, Any],
+        write_result: Dict[str, Any]
+    ):
+        """
+        Anota el resultado de una escritura en el resumen de acciones.
+        
+        Args:
+            actions_taken: Resumen de acciones
+            write: Escritura ejecutada
+            write_result: Resultado ('result' y 'error') devuelto por _execute_writes
+        """
+        action = write['action']
+        item_id = write['item_id']
+        error = write_result.get('error')
+        
+        if action == 'duplicate':
+            if error:
+                logger.error(f"   ✗ Error al eliminar duplicado: {error}")
+                return
+            if "duplicates_removed" not in actions_taken:
+                actions_taken["duplicates_removed"] = []
+            actions_taken["duplicates_removed"].append(item_id)
+        elif action == 'update':
+            if error:
+                logger.error(f"   ✗ Error al actualizar {item_id}: {error}")
+                return
+            actions_taken["updated"].append(item_id)
+        elif action == 'delete':
+            if error:
+                # Solo logear errores reales, no errores esperados
+                if "No route data was found" not in error and "No HTTP resource was found" not in error:
+                    logger.error(f"   ✗ Error al eliminar: {error}")
+                return
+            actions_taken["deleted"].append(item_id)
+        elif action == 'create':
+            if not error:
+                logger.info(f"   ✓ Creado registro ID: {item_id}")
+                actions_taken["created"].append(item_id)
+            elif "already exists" in error or "ya existe" in error:
+                # Si el registro ya existe, registrarlo pero continuar
+                logger.warning(f"   ⚠ Registro ya existe en Dynamics: {item_id}")
+                actions_taken["unchanged"].append(item_id)
+            else:
+                logger.error(f"   ✗ Error al crear registro ID {item_id}: {error}")
+                logger.error(f"   Datos que causaron el error: {write['request'].get('data')}")
+                # Agregar a una lista de errores para tracking
+                if "errors" not in actions_taken:
+                    actions_taken["errors"] = []
+                actions_taken["errors"].append({"id": item_id, "error": error})
@@ -2,13 +2,16 @@
 Caso de uso para sincronizar EmployeeModifications desde Dynamics 365.
 Implementa la lógica de negocio para procesar altas y modificaciones.
 """
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from typing import Dict, Any, Optional, List, Set, Tuple
+from datetime import datetime, timedelta, timezone
 import logging
 
+from config.settings import settings
 from infrastructure.dynamics_api_adapter import DynamicsAPIAdapter
 from infrastructure.employee_modifications_adapter import EmployeeModificationsAdapter
 from infrastructure.e03800_database_adapter import E03800DatabaseAdapter
+from infrastructure.trabajador_index import TrabajadorIndex
+from infrastructure.com_altas_index import ComAltasStatusIndex, LastCreatedDateIndex
 from utils.data_transformers import (
     map_employee_to_com_altas,
     encode_etag_base64,
@@ -18,6 +21,10 @@ from utils.data_transformers import (
 
 logger = logging.getLogger(__name__)
 
+# Errores de validación del propio registro: reintentarlo no cambia el resultado,
+# así que no impiden avanzar la marca de agua de su empresa
+PERMANENT_ERROR_REASONS = {'missing_etag', 'missing_vatnum', 'missing_created_date', 'invalid_created_date_format'}
+
 
 class SyncEmployeeModificationsUseCase:
     """Caso de uso para sincronizar EmployeeModifications."""
@@ -31,6 +38,13 @@ class SyncEmployeeModificationsUseCase:
         self.dynamics_api = dynamics_api
         self.employee_adapter = employee_adapter
         self.e03800_adapter = e03800_adapter
+        # ETags ya registrados sin procesar, precargados por sync (None = consultar uno a uno)
+        self._pending_etags: Optional[Set[str]] = None
+        # Trabajadores y estado de com_altas de las empresas de la ejecución, precargados por sync
+        self._trabajador_index: Optional[TrabajadorIndex] = None
+        self._com_altas_index: Optional[ComAltasStatusIndex] = None
+        # Último created_date por trabajador y tipo, precargado por sync y avanzado en memoria
+        self._created_date_index: Optional[LastCreatedDateIndex] = None
     
     def _is_in_range(
         self, 
@@ -140,14 +154,14 @@ class SyncEmployeeModificationsUseCase:
             logger.warning("Faltan campos de identificación del trabajador")
             return {'status': 'skipped', 'reason': 'missing_fields'}
 
-        has_alta_liquidada = self.employee_adapter.has_com_altas_record(
+        has_alta_liquidada = self._com_altas().has_com_altas_record(
             codiemp,
             nass,
             vatnum_normalized,
             tipo='A',
             estados=('L',)
         )
-        has_baja_pendiente = self.employee_adapter.has_com_altas_record(
+        has_baja_pendiente = self._com_altas().has_com_altas_record(
             codiemp,
             nass,
             vatnum_normalized,
@@ -156,15 +170,15 @@ class SyncEmployeeModificationsUseCase:
         )
         
         # Buscar trabajador en tabla trabajadores
-        trabajador_info = self.e03800_adapter.find_trabajador(
+        trabajador_info = self._trabajadores().find_trabajador(
             codiemp, nombre, apellido1, apellido2 or ''
         )
         if trabajador_info is None and nass:
-            trabajador_info = self.e03800_adapter.find_trabajador_by_nass(
+            trabajador_info = self._trabajadores().find_trabajador_by_nass(
                 codiemp, str(nass).strip()
             )
         if trabajador_info is None and vatnum_normalized:
-            trabajador_info = self.e03800_adapter.find_trabajador_by_nif(
+            trabajador_info = self._trabajadores().find_trabajador_by_nif(
                 codiemp, vatnum_normalized
             )
 
@@ -264,15 +278,15 @@ class SyncEmployeeModificationsUseCase:
                     'status': 'ok'
                 }
             if nass:
-                ultima_fechabaja = self.e03800_adapter.get_last_fechabaja_by_nass(
+                ultima_fechabaja = self._trabajadores().get_last_fechabaja_by_nass(
                     codiemp, str(nass).strip()
                 )
             elif vatnum_normalized:
-                ultima_fechabaja = self.e03800_adapter.get_last_fechabaja_by_nif(
+                ultima_fechabaja = self._trabajadores().get_last_fechabaja_by_nif(
                     codiemp, vatnum_normalized
                 )
             else:
-                ultima_fechabaja = self.e03800_adapter.get_last_fechabaja(
+                ultima_fechabaja = self._trabajadores().get_last_fechabaja(
                     codiemp, nombre, apellido1, apellido2 or ''
                 )
             
@@ -356,7 +370,7 @@ class SyncEmployeeModificationsUseCase:
         Returns:
             True si está en orden cronológico, False si no
         """
-        last_created_date = self.employee_adapter.get_last_created_date_by_type(
+        last_created_date = self._chronology().get_last_created_date_by_type(
             codiemp, nombre, apellido1, apellido2 or '', tipo, coditraba
         )
         
@@ -405,6 +419,30 @@ class SyncEmployeeModificationsUseCase:
             logger.warning(f"Error comparando fechas cronológicas: {e}")
             return False
     
+    def _trabajadores(self):
+        """Búsquedas de trabajadores: índice precargado o, si no lo hay, consultas a e03800."""
+        if self._trabajador_index is not None:
+            return self._trabajador_index
+        return self.e03800_adapter
+    
+    def _com_altas(self):
+        """Consultas de estado de com_altas: índice precargado o, si no lo hay, consultas a e03800."""
+        if self._com_altas_index is not None:
+            return self._com_altas_index
+        return self.employee_adapter
+    
+    def _chronology(self):
+        """Último created_date por tipo: índice precargado o, si no lo hay, consulta a la base de datos."""
+        if self._created_date_index is not None:
+            return self._created_date_index
+        return self.employee_adapter
+    
+    def _etag_exists(self, etag_encoded: str) -> bool:
+        """Comprueba el ETag en el conjunto precargado o, si no lo hay, en la base de datos."""
+        if self._pending_etags is not None:
+            return etag_encoded in self._pending_etags
+        return self.employee_adapter.etag_exists(etag_encoded)
+    
     def process_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
         """
         Procesa un registro del endpoint EmployeeModifications.
@@ -422,7 +460,7 @@ class SyncEmployeeModificationsUseCase:
                 return {'status': 'error', 'reason': 'missing_etag'}
             
             etag_encoded = encode_etag_base64(etag)
-            if self.employee_adapter.etag_exists(etag_encoded):
+            if self._etag_exists(etag_encoded):
                 return {'status': 'skipped', 'reason': 'etag_exists'}
             
             # PASO 2: Validar VATNum (DNI/NIF obligatorio)
@@ -502,6 +540,8 @@ class SyncEmployeeModificationsUseCase:
             # PASO 6: Crear registros
             # 6.1: Insertar en com_altas
             com_altas_id = self.employee_adapter.insert_com_altas(mapped_data)
+            if self._com_altas_index is not None:
+                self._com_altas_index.add(com_altas_id, mapped_data)
 
             # 6.1.1: Si es ALTA, denegar otras altas pendientes del mismo trabajador
             if tipo == 'A':
@@ -513,6 +553,8 @@ class SyncEmployeeModificationsUseCase:
                     nif,
                     exclude_id=com_altas_id
                 )
+                if self._com_altas_index is not None:
+                    self._com_altas_index.mark_pending_altas_denegadas(codiemp, nass, nif, exclude_id=com_altas_id)
                 if updated:
                     logger.info(f"Altas pendientes denegadas: {updated}")
 
@@ -526,6 +568,18 @@ class SyncEmployeeModificationsUseCase:
             self.employee_adapter.insert_dfo_com_altas(
                 com_altas_id, etag_encoded, personnel_number, created_date_mysql
             )
+            if self._pending_etags is not None:
+                self._pending_etags.add(etag_encoded)
+            if self._created_date_index is not None:
+                self._created_date_index.record(
+                    mapped_data.get('codiemp'),
+                    mapped_data.get('nombre'),
+                    mapped_data.get('apellido1'),
+                    mapped_data.get('apellido2'),
+                    mapped_data.get('tipo'),
+                    mapped_data.get('coditraba'),
+                    datetime.strptime(created_date_mysql, '%Y-%m-%d %H:%M:%S')
+                )
             
             return {
                 'status': 'success',
@@ -538,24 +592,60 @@ class SyncEmployeeModificationsUseCase:
             logger.error(f"Error procesando registro: {e}", exc_info=True)
             return {'status': 'error', 'reason': str(e)}
     
-    def sync(self, access_token: str, limit: Optional[int] = None) -> Dict[str, Any]:
+    def sync(
+        self,
+        access_token: str,
+        limit: Optional[int] = None,
+        full_reconcile: bool = False
+    ) -> Dict[str, Any]:
         """
         Sincroniza registros de EmployeeModifications.
         
+        Con EMPLOYEE_MODIFICATIONS_INCREMENTAL solo se piden a Dynamics los
+        registros posteriores a la marca de agua guardada (menos el solape
+        configurado). Se descarga la entidad completa si se pide
+        full_reconcile, si no hay marcas, si la descarga incremental trae
+        una empresa sin marca o si la última descarga completa es más
+        antigua que EMPLOYEE_MODIFICATIONS_FULL_SYNC_HOURS.
+        
         Args:
             access_token: Token de acceso de Azure AD
             limit: Límite de registros a procesar (None para todos)
+            full_reconcile: Forzar la descarga completa de la entidad
             
         Returns:
             Dict con estadísticas del procesamiento
         """
         try:
+            window = None if full_reconcile else self._incremental_window()
+            mode = 'full' if window is None else 'incremental'
+            
             # Obtener datos del endpoint
-            logger.info("Obteniendo datos de EmployeeModifications...")
+            filter_expression = None
+            if window is not None:
+                since, thresholds = window
+                field = settings.employee_modifications_watermark_field
+                filter_expression = f"{field} ge {since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+                logger.info(f"Obteniendo datos de EmployeeModifications desde {since} UTC ({field})...")
+            else:
+                logger.info("Obteniendo datos de EmployeeModifications...")
             records = self.dynamics_api.get_entity_data(
                 "EmployeeModifications",
-                access_token
+                access_token,
+                filter_expression=filter_expression
             )
+            if window is not None:
+                unmarked = self._companies_without_watermark(records, thresholds)
+                if unmarked:
+                    # Su historial anterior a la ventana no ha llegado: descarga completa
+                    logger.info(
+                        f"Empresas sin marca de agua ({', '.join(sorted(unmarked))}): descarga completa"
+                    )
+                    window = None
+                    mode = 'full'
+                    records = self.dynamics_api.get_entity_data("EmployeeModifications", access_token)
+                else:
+                    records = self._drop_below_watermark(records, thresholds)
             
             if not records:
                 logger.warning("No se obtuvieron registros del endpoint")
@@ -563,9 +653,14 @@ class SyncEmployeeModificationsUseCase:
                     'total': 0,
                     'processed': 0,
                     'skipped': 0,
-                    'errors': 0
+                    'errors': 0,
+                    'mode': mode
                 }
             
+            # En orden de CreatedDate, para que la validación cronológica no
+            # descarte un registro por otro posterior de la misma descarga
+            records = self._sort_by_created_date(records)
+            
             # Limitar si se especifica
             if limit:
                 records = records[:limit]
@@ -577,9 +672,20 @@ class SyncEmployeeModificationsUseCase:
                 'processed': 0,
                 'skipped': 0,
                 'errors': 0,
+                'mode': mode,
                 'details': []
             }
             
+            # Una consulta por bloques en lugar de una por registro
+            self._pending_etags = self.employee_adapter.get_pending_etags(
+                encode_etag_base64(record['@odata.etag']) for record in records if record.get('@odata.etag')
+            )
+            logger.info(f"{len(self._pending_etags)} ETags ya registrados en dfo_com_altas")
+            codiemps = {normalize_null_or_empty(record.get('CompanyIdATISA')) for record in records}
+            self._trabajador_index = self.e03800_adapter.load_trabajador_index(codiemps)
+            self._com_altas_index = self.employee_adapter.load_com_altas_index(codiemps)
+            self._created_date_index = self.employee_adapter.load_last_created_dates(codiemps)
+            
             for idx, record in enumerate(records, 1):
                 logger.info(f"Procesando registro {idx}/{len(records)}")
                 result = self.process_record(record)
@@ -600,9 +706,173 @@ class SyncEmployeeModificationsUseCase:
                 })
             
             logger.info(f"Procesamiento completado: {stats['processed']} procesados, {stats['skipped']} omitidos, {stats['errors']} errores")
+            if self._trabajador_index.fallback_hits:
+                logger.warning(
+                    f"{self._trabajador_index.fallback_hits} búsquedas de trabajadores resueltas por SQL "
+                    f"y no por el índice en memoria"
+                )
+            
+            # Con límite quedan registros sin procesar: la marca de agua no avanza
+            if settings.employee_modifications_incremental and not limit:
+                self._advance_watermarks(records, stats['details'], full_sync=window is None)
             return stats
             
         except Exception as e:
             logger.error(f"Error en sincronización: {e}", exc_info=True)
             raise
+        finally:
+            self._pending_etags = None
+            self._trabajador_index = None
+            self._com_altas_index = None
+            self._created_date_index = None
+    
+    @staticmethod
+    def _sort_by_created_date(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Ordena los registros por CreatedDate (UTC), manteniendo el orden de
+        llegada en los empates. Los registros sin fecha válida van al final,
+        donde process_record los rechaza.
+        """
+        def sort_key(record: Dict[str, Any]) -> Tuple[int, datetime]:
+            value = record.get('CreatedDate')
+            try:
+                moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            except ValueError:
+                return (1, datetime.min)
+            if moment.tzinfo is not None:
+                moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+            return (0, moment)
+        
+        return sorted(records, key=sort_key)
+    
+    def _incremental_window(self) -> Optional[Tuple[datetime, Dict[str, datetime]]]:
+        """
+        Calcula la ventana de la sincronización incremental.
+        
+        La consulta OData usa la marca más antigua de todas las empresas,
+        para no perder empresas retrasadas; los umbrales por empresa
+        descartan después lo ya procesado. Una empresa sin marca solo
+        recibiría sus registros posteriores a esa fecha, así que si aparece
+        alguna en la descarga incremental se repite completa (ver
+        _companies_without_watermark).
+        
+        Returns:
+            Tupla (fecha UTC desde la que pedir registros, CompanyIdATISA -> umbral),
+            o None si corresponde una descarga completa
+        """
+        if not settings.employee_modifications_incremental:
+            return None
+        
+        try:
+            watermarks, last_full_sync = self.employee_adapter.get_sync_watermarks()
+        except Exception as e:
+            logger.warning(f"No se pudieron leer las marcas de agua ({e}); se descarga la entidad completa")
+            return None
+        
+        if not watermarks:
+            logger.info("Sin marcas de agua de EmployeeModifications: descarga completa")
+            return None
+        
+        full_sync_hours = settings.employee_modifications_full_sync_hours
+        if full_sync_hours > 0 and (
+            last_full_sync is None
+            or datetime.utcnow() - last_full_sync >= timedelta(hours=full_sync_hours)
+        ):
+            logger.info(f"Última descarga completa: {last_full_sync or 'nunca'}. Reconciliación completa")
+            return None
+        
+        overlap = timedelta(minutes=settings.employee_modifications_overlap_minutes)
+        thresholds = {company_id: mark - overlap for company_id, mark in watermarks.items()}
+        return min(thresholds.values()), thresholds
+    
+    @staticmethod
+    def _companies_without_watermark(
+        records: List[Dict[str, Any]],
+        thresholds: Dict[str, datetime]
+    ) -> Set[str]:
+        """CompanyIdATISA de los registros cuya empresa no tiene marca de agua."""
+        companies = set()
+        for record in records:
+            company_id = normalize_null_or_empty(record.get('CompanyIdATISA'))
+            if company_id and str(company_id).strip() not in thresholds:
+                companies.add(str(company_id).strip())
+        return companies
+    
+    def _record_watermark(self, record: Dict[str, Any]) -> Optional[datetime]:
+        """Fecha UTC (naive) del campo de marca de agua de un registro, o None si no es válida."""
+        value = record.get(settings.employee_modifications_watermark_field)
+        if not value:
+            return None
+        try:
+            moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+    
+    def _drop_below_watermark(
+        self,
+        records: List[Dict[str, Any]],
+        thresholds: Dict[str, datetime]
+    ) -> List[Dict[str, Any]]:
+        """
+        Descarta los registros anteriores al umbral de su empresa.
+        
+        Se conservan los de empresas sin marca y los que no tienen fecha válida.
+        """
+        kept = []
+        for record in records:
+            company_id = normalize_null_or_empty(record.get('CompanyIdATISA'))
+            threshold = thresholds.get(str(company_id).strip()) if company_id else None
+            moment = self._record_watermark(record)
+            if threshold is None or moment is None or moment >= threshold:
+                kept.append(record)
+        
+        if len(kept) < len(records):
+            logger.info(f"Descartados {len(records) - len(kept)} registros anteriores a la marca de agua de su empresa")
+        return kept
+    
+    def _advance_watermarks(
+        self,
+        records: List[Dict[str, Any]],
+        details: List[Dict[str, Any]],
+        full_sync: bool
+    ) -> None:
+        """
+        Avanza la marca de agua de cada empresa con los registros ya tratados.
+        
+        Un error recuperable (p.ej. de base de datos) frena la marca de su
+        empresa justo antes del registro fallido para que se vuelva a pedir
+        en la siguiente ejecución.
+        
+        Args:
+            records: Registros procesados
+            details: Resultados alineados con records (stats['details'])
+            full_sync: Si la ejecución descargó la entidad completa
+        """
+        watermarks: Dict[str, datetime] = {}
+        first_failure: Dict[str, datetime] = {}
+        
+        for record, detail in zip(records, details):
+            company_id = normalize_null_or_empty(record.get('CompanyIdATISA'))
+            moment = self._record_watermark(record)
+            if not company_id or moment is None:
+                continue
+            company_id = str(company_id).strip()
+            result = detail['result']
+            if result.get('status') == 'error' and result.get('reason') not in PERMANENT_ERROR_REASONS:
+                first_failure[company_id] = min(first_failure.get(company_id, moment), moment)
+            else:
+                watermarks[company_id] = max(watermarks.get(company_id, moment), moment)
+        
+        for company_id, failed_at in first_failure.items():
+            if company_id in watermarks and watermarks[company_id] >= failed_at:
+                watermarks[company_id] = failed_at - timedelta(seconds=1)
+        
+        try:
+            self.employee_adapter.save_sync_watermarks(watermarks, full_sync=full_sync)
+            logger.info(f"Marcas de agua actualizadas para {len(watermarks)} empresas")
+        except Exception as e:
+            logger.warning(f"No se pudieron guardar las marcas de agua: {e}")
 
@@ -0,0 +1,126 @@
+"""
+Planificador de sincronización de entidades según sus dependencias.
+Ejecuta en paralelo las entidades independientes y respeta el orden de
+las que dependen de otras (p.ej. WorkerPlaces antes que
+ContributionAccountCodeCCs).
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Mapping, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class EntityScheduler:
+    """
+    Ejecuta una tarea por entidad sobre un pool acotado de hilos.
+
+    Una entidad solo arranca cuando han terminado todas sus dependencias
+    presentes en la ejecución. El fallo de una dependencia no impide
+    sincronizar las entidades que dependen de ella (igual que la ejecución
+    secuencial, que continúa tras un error).
+    """
+
+    def __init__(self, max_workers: int, dependencies: Mapping[str, Sequence[str]]):
+        self._max_workers = max(1, max_workers)
+        self._dependencies = dependencies
+
+    def run(self, entities: Sequence[str], task: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Sincroniza las entidades respetando dependencias.
+
+        Args:
+            entities: Entidades a sincronizar (el orden se usa para desempatar)
+            task: Función que sincroniza una entidad y devuelve su resultado
+
+        Returns:
+            Diccionario con:
+            - results: resultados en el mismo orden que entities
+            - timings: entidad -> segundos de ejecución
+            - critical_path: cadena de dependencias que determina la duración total
+            - critical_path_seconds: duración de esa cadena
+            - elapsed_seconds: duración total de la ejecución
+        """
+        pending = list(dict.fromkeys(entities))
+        blockers = {
+            entity: {dep for dep in self._dependencies.get(entity, ()) if dep in pending}
+            for entity in pending
+        }
+        for entity in blockers:
+            if entity in self._closure(entity, blockers):
+                raise ValueError(f"Dependencia circular en la sincronización de {entity}")
+
+        results: Dict[str, Dict[str, Any]] = {}
+        timings: Dict[str, float] = {}
+        finished_at: Dict[str, float] = {}
+        started = time.monotonic()
+
+        def timed(entity: str) -> Dict[str, Any]:
+            entity_started = time.monotonic()
+            try:
+                return task(entity)
+            finally:
+                timings[entity] = time.monotonic() - entity_started
+                finished_at[entity] = time.monotonic() - started
+
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="entity-sync") as pool:
+            running = {}
+            while pending or running:
+                for entity in [e for e in pending if not blockers[e]]:
+                    if len(running) >= self._max_workers:
+                        break
+                    pending.remove(entity)
+                    running[pool.submit(timed, entity)] = entity
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entity = running.pop(future)
+                    try:
+                        results[entity] = future.result()
+                    except Exception as e:
+                        logger.error(f"Error sincronizando {entity}: {e}", exc_info=True)
+                        results[entity] = {"success": False, "entity": entity, "error": str(e)}
+                    for deps in blockers.values():
+                        deps.discard(entity)
+
+        elapsed = time.monotonic() - started
+        critical_path = self._critical_path(entities, finished_at)
+
+        return {
+            "results": [results[entity] for entity in dict.fromkeys(entities)],
+            "timings": timings,
+            "critical_path": critical_path,
+            "critical_path_seconds": sum(timings[entity] for entity in critical_path),
+            "elapsed_seconds": elapsed,
+        }
+
+    def _closure(self, entity: str, blockers: Mapping[str, set]) -> set:
+        """Dependencias directas e indirectas de una entidad."""
+        seen: set = set()
+        stack = list(blockers.get(entity, ()))
+        while stack:
+            dep = stack.pop()
+            if dep not in seen:
+                seen.add(dep)
+                stack.extend(blockers.get(dep, ()))
+        return seen
+
+    def _critical_path(self, entities: Sequence[str], finished_at: Mapping[str, float]) -> List[str]:
+        """
+        Reconstruye la cadena que terminó más tarde.
+
+        Parte de la entidad que terminó la última y retrocede por la
+        dependencia que terminó más tarde en cada paso.
+        """
+        if not finished_at:
+            return []
+        current = max(finished_at, key=finished_at.get)
+        path = [current]
+        while True:
+            deps = [dep for dep in self._dependencies.get(current, ()) if dep in finished_at and dep in entities]
+            if not deps:
+                break
+            current = max(deps, key=finished_at.get)
+            path.append(current)
+        return list(reversed(path))
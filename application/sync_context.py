@@ -0,0 +1,97 @@
+"""
+Contexto de una ejecución de sincronización.
+Memoriza los datos intermedios que comparten varias entidades de la misma
+ejecución (empresas, DBF procesados, lecturas de Dynamics...) y los
+descarta al terminar.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SyncContext:
+    """
+    Memo thread-safe con alcance de una ejecución.
+
+    Se usa como gestor de contexto: al salir del bloque `with` se vacía,
+    de modo que la siguiente ejecución vuelve a leer datos frescos.
+    Si varios hilos piden la misma clave a la vez, solo uno ejecuta la carga.
+    """
+
+    def __init__(self, name: str = "sync"):
+        self._name = name
+        self._lock = threading.Lock()
+        self._values: Dict[Hashable, Any] = {}
+        self._loading: Dict[Hashable, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def memoize(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor memorizado para la clave o lo carga una sola vez.
+
+        Los valores se comparten entre entidades y no deben modificarse.
+
+        Args:
+            key: Clave del dato (tupla, p.ej. ('e03800', 'empresas_codiemp'))
+            loader: Función que obtiene el dato si no está memorizado
+
+        Returns:
+            Valor memorizado
+        """
+        with self._lock:
+            if key in self._values:
+                self._hits += 1
+                return self._values[key]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    self._hits += 1
+                    return self._values[key]
+                self._misses += 1
+
+            value = loader()
+
+            with self._lock:
+                self._values[key] = value
+                self._loading.pop(key, None)
+            return value
+
+    def invalidate(self, prefix: Optional[tuple] = None) -> None:
+        """
+        Descarta valores memorizados.
+
+        Args:
+            prefix: Solo las claves tupla que empiecen por este prefijo (None = todas)
+        """
+        with self._lock:
+            if prefix is None:
+                self._values.clear()
+                return
+            for key in [k for k in self._values if isinstance(k, tuple) and k[:len(prefix)] == prefix]:
+                del self._values[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Devuelve los contadores del memo.
+
+        Returns:
+            Diccionario con hits, misses y entradas
+        """
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'entries': len(self._values)}
+
+    def __enter__(self) -> "SyncContext":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        stats = self.get_stats()
+        logger.info(
+            f"Contexto {self._name}: {stats['hits']} reutilizaciones, "
+            f"{stats['misses']} cargas, {stats['entries']} datos descartados"
+        )
+        self.invalidate()
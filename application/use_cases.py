@@ -36,11 +36,8 @@ class SyncDynamicsEntityUseCase:
             # Obtener datos de la entidad
             entity_data = self._dynamics_api.get_entity_data(entity_name, access_token)
             
-            # Limpiar datos antiguos
-            self._database_adapter.clear_entity_data(entity_name)
-            
-            # Guardar datos nuevos
-            records_saved = self._database_adapter.save_entity_data(entity_name, entity_data)
+            # Sustituir datos antiguos por los nuevos en una sola transacción
+            records_saved = self._database_adapter.replace_entity_data(entity_name, entity_data)
             
             return {
                 "success": True,
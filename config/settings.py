@@ -23,6 +23,63 @@ class Settings(BaseSettings):
     
     # API Configuration
     api_base_url: str
+    # Tamaño de página solicitado a Dynamics (Prefer: odata.maxpagesize). 0 = sin cabecera
+    dynamics_page_size: int = 5000
+    # Pool de conexiones HTTPS keep-alive (conexiones inactivas por host y timeout de socket)
+    http_pool_max_size: int = 10
+    http_timeout_seconds: float = 120
+    # Inactividad máxima de una conexión keep-alive antes de descartarla (menor que el timeout del servidor)
+    http_keepalive_seconds: float = 30
+    # Operaciones de escritura por petición OData $batch (0 = una petición por operación)
+    dynamics_batch_size: int = 0
+    # Escrituras individuales concurrentes y reintentos ante limitación (HTTP 429/503)
+    dynamics_write_concurrency: int = 1
+    dynamics_write_max_retries: int = 5
+    dynamics_retry_backoff_seconds: float = 1.0
+    dynamics_retry_backoff_max_seconds: float = 60.0
+    # Caché de tokens de Azure AD: margen de renovación anticipada y tabla token_cache compartida
+    token_refresh_margin_seconds: int = 300
+    token_db_cache_enabled: bool = True
+    token_db_lock_timeout_seconds: int = 30
+    # Escritura de instantáneas en dynamic_entities: filas por bloque y modo (executemany | infile)
+    snapshot_chunk_size: int = 1000
+    snapshot_load_mode: str = "executemany"
+    # Sustitución de instantáneas: transaction (DELETE + INSERT) | exchange (staging + EXCHANGE PARTITION)
+    # | incremental (solo cambios según hash de contenido)
+    snapshot_mode: str = "transaction"
+    # Pool de conexiones MySQL por esquema: inactivas, extra bajo carga, espera máxima y
+    # segundos de inactividad tras los que se comprueba la conexión con un ping
+    mysql_pool_size: int = 5
+    mysql_pool_max_overflow: int = 5
+    mysql_pool_timeout_seconds: float = 30
+    mysql_pool_ping_after_seconds: float = 30
+    # Caché de DBF decodificados: límite en memoria (MB de archivo) y copia local opcional
+    dbf_cache_max_mb: int = 512
+    dbf_cache_dir: str = ""
+    # Decodificador DBF columnar con NumPy (si está instalado)
+    dbf_numpy_enabled: bool = True
+    # Lectura DBF en paralelo por rangos de registros (1 = sin procesos adicionales)
+    dbf_scan_workers: int = 1
+    dbf_parallel_min_records: int = 100000
+    # Entidades bidireccionales sincronizadas a la vez en una ejecución completa (1 = secuencial)
+    sync_max_parallel_entities: int = 1
+    # Leer e03800 y Dynamics 365 a la vez dentro de cada sincronización bidireccional
+    sync_parallel_extraction: bool = True
+    # Volver a descargar la entidad tras las escrituras en lugar de aplicar los cambios a la lectura inicial
+    # (se relee siempre que alguna escritura falla)
+    sync_verify_after_write: bool = False
+    # EmployeeModifications incremental: campo fecha de la marca de agua, solape de la ventana
+    # y horas entre descargas completas de reconciliación (0 = solo bajo petición).
+    # Con CreatedDate, un registro modificado después de crearse no se vuelve a pedir
+    # hasta la siguiente descarga completa
+    employee_modifications_incremental: bool = False
+    employee_modifications_watermark_field: str = "CreatedDate"
+    employee_modifications_overlap_minutes: int = 60
+    employee_modifications_full_sync_hours: int = 24
+    # Catálogos de referencia en memoria (provincias, países, puestos): antigüedad máxima y
+    # segundos entre comprobaciones de CHECKSUM TABLE para recargarlos antes (0 = solo TTL)
+    reference_cache_ttl_seconds: int = 3600
+    reference_cache_checksum_seconds: int = 60
     
     class Config:
         env_file = ".env"
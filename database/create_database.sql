@@ -13,9 +13,12 @@ USE interbus_365;
 CREATE TABLE IF NOT EXISTS dynamic_entities (
     id INT AUTO_INCREMENT PRIMARY KEY,
     entity_name VARCHAR(100) NOT NULL,
+    record_key VARCHAR(255) NULL,
+    content_hash CHAR(32) NULL,
     json_data TEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_entity_record (entity_name, record_key),
     INDEX idx_entity_name (entity_name),
     INDEX idx_created_at (created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -35,9 +38,11 @@ CREATE TABLE IF NOT EXISTS sync_logs (
 -- Tabla para tokens (opcional, para cache)
 CREATE TABLE IF NOT EXISTS token_cache (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    cache_key CHAR(64) NOT NULL,
     token TEXT NOT NULL,
     expires_at TIMESTAMP NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_cache_key_expires_at (cache_key, expires_at),
     INDEX idx_expires_at (expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -58,4 +63,11 @@ CREATE TABLE IF NOT EXISTS dfo_com_altas (
     FOREIGN KEY (id) REFERENCES e03800.com_altas(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
-
+-- Marcas de agua de la sincronización incremental de EmployeeModifications
+-- (fecha más reciente procesada por empresa y última descarga completa)
+CREATE TABLE IF NOT EXISTS employee_modifications_watermarks (
+    company_id VARCHAR(20) NOT NULL PRIMARY KEY COMMENT 'CompanyIdATISA del endpoint',
+    high_water_mark DATETIME NOT NULL COMMENT 'Fecha (UTC) más reciente procesada de la empresa',
+    last_full_sync DATETIME NULL COMMENT 'Fecha (UTC) de la última descarga completa',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha de actualización'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
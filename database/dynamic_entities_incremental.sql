@@ -0,0 +1,16 @@
+-- =====================================================
+-- MIGRACIÓN: clave natural y hash de contenido en dynamic_entities
+-- =====================================================
+-- Necesaria para SNAPSHOT_MODE=incremental: cada fila guarda la
+-- clave natural del registro (record_key) y un hash BLAKE2b de su
+-- JSON canónico (content_hash) para escribir solo los cambios.
+-- Las filas existentes quedan con record_key NULL y se recargan
+-- en la primera sincronización incremental de cada entidad.
+-- =====================================================
+
+USE interbus_365;
+
+ALTER TABLE dynamic_entities
+    ADD COLUMN record_key VARCHAR(255) NULL COMMENT 'Clave natural del registro en Dynamics 365' AFTER entity_name,
+    ADD COLUMN content_hash CHAR(32) NULL COMMENT 'Hash BLAKE2b del JSON canónico' AFTER record_key,
+    ADD UNIQUE KEY uk_entity_record (entity_name, record_key);
@@ -0,0 +1,36 @@
+-- =====================================================
+-- MIGRACIÓN: particionado de dynamic_entities por entidad
+-- =====================================================
+-- Necesaria para SNAPSHOT_MODE=exchange: cada entidad vive en su
+-- propia partición LIST y la instantánea nueva se carga en una
+-- tabla de staging que se intercambia con EXCHANGE PARTITION.
+--
+-- La clave de particionado debe formar parte de la clave primaria,
+-- por eso la PK pasa a ser (id, entity_name). id sigue siendo único
+-- en toda la tabla: cada tabla de staging numera a partir del
+-- MAX(id) actual y los intercambios se hacen de uno en uno.
+-- Las entidades nuevas obtienen su partición automáticamente
+-- al sincronizarse por primera vez en modo exchange.
+-- Requiere MySQL 5.7.5 o superior (EXCHANGE ... WITHOUT VALIDATION).
+-- =====================================================
+
+USE interbus_365;
+
+ALTER TABLE dynamic_entities
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, entity_name);
+
+ALTER TABLE dynamic_entities
+PARTITION BY LIST COLUMNS (entity_name) (
+    PARTITION p_CompanyATISAs VALUES IN ('CompanyATISAs'),
+    PARTITION p_WorkerPlaces VALUES IN ('WorkerPlaces'),
+    PARTITION p_ContributionAccountCodeCCs VALUES IN ('ContributionAccountCodeCCs'),
+    PARTITION p_HolidaysAbsencesGroupATISAs VALUES IN ('HolidaysAbsencesGroupATISAs'),
+    PARTITION p_VacationBalances VALUES IN ('VacationBalances'),
+    PARTITION p_IncidentGroupATISAs VALUES IN ('IncidentGroupATISAs'),
+    PARTITION p_AdvanceGroupATISAs VALUES IN ('AdvanceGroupATISAs'),
+    PARTITION p_LibrariesGroupATISAs VALUES IN ('LibrariesGroupATISAs'),
+    PARTITION p_LeaveGroupATISAs VALUES IN ('LeaveGroupATISAs'),
+    PARTITION p_VacationCalenders VALUES IN ('VacationCalenders'),
+    PARTITION p_HighsLowsChanges VALUES IN ('HighsLowsChanges')
+);
@@ -0,0 +1,17 @@
+-- =====================================================
+-- MIGRACIÓN: marcas de agua de EmployeeModifications
+-- =====================================================
+-- Necesaria para EMPLOYEE_MODIFICATIONS_INCREMENTAL=true: guarda por
+-- empresa la fecha más reciente procesada para pedir a Dynamics solo
+-- los registros posteriores, y la fecha de la última descarga completa.
+-- =====================================================
+
+USE interbus_365;
+
+CREATE TABLE IF NOT EXISTS employee_modifications_watermarks (
+    company_id VARCHAR(20) NOT NULL PRIMARY KEY COMMENT 'CompanyIdATISA del endpoint',
+    high_water_mark DATETIME NOT NULL COMMENT 'Fecha (UTC) más reciente procesada de la empresa',
+    last_full_sync DATETIME NULL COMMENT 'Fecha (UTC) de la última descarga completa',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha de actualización'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+COMMENT='Marcas de agua de la sincronización incremental de EmployeeModifications';
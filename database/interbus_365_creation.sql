@@ -21,9 +21,12 @@ USE interbus_365;
 CREATE TABLE IF NOT EXISTS dynamic_entities (
     id INT AUTO_INCREMENT PRIMARY KEY,
     entity_name VARCHAR(100) NOT NULL COMMENT 'Nombre de la entidad de Dynamics 365',
+    record_key VARCHAR(255) NULL COMMENT 'Clave natural del registro en Dynamics 365',
+    content_hash CHAR(32) NULL COMMENT 'Hash BLAKE2b del JSON canónico',
     json_data TEXT NOT NULL COMMENT 'Datos JSON de la entidad',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Fecha de creación',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Fecha de actualización',
+    UNIQUE KEY uk_entity_record (entity_name, record_key),
     INDEX idx_entity_name (entity_name),
     INDEX idx_created_at (created_at),
     INDEX idx_updated_at (updated_at)
@@ -53,9 +56,11 @@ COMMENT='Log de sincronizaciones';
 -- =====================================================
 CREATE TABLE IF NOT EXISTS token_cache (
     id INT AUTO_INCREMENT PRIMARY KEY,
+    cache_key CHAR(64) NOT NULL COMMENT 'SHA-256 de tenant, cliente y recurso del token',
     token TEXT NOT NULL COMMENT 'Token de acceso',
     expires_at TIMESTAMP NOT NULL COMMENT 'Fecha de expiración',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Fecha de creación',
+    INDEX idx_cache_key_expires_at (cache_key, expires_at),
     INDEX idx_expires_at (expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
 COMMENT='Cache de tokens de autenticación';
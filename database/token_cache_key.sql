@@ -0,0 +1,16 @@
+-- =====================================================
+-- MIGRACIÓN: clave de credenciales en token_cache
+-- =====================================================
+-- Cada token se guarda con el SHA-256 de tenant, cliente y recurso
+-- (cache_key) para que procesos configurados con otras credenciales
+-- sobre el mismo esquema no reutilicen un token ajeno. Los tokens
+-- existentes no tienen clave: se borran y se vuelven a pedir.
+-- =====================================================
+
+USE interbus_365;
+
+DELETE FROM token_cache;
+
+ALTER TABLE token_cache
+    ADD COLUMN cache_key CHAR(64) NOT NULL COMMENT 'SHA-256 de tenant, cliente y recurso del token' AFTER id,
+    ADD INDEX idx_cache_key_expires_at (cache_key, expires_at);
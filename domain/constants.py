@@ -36,3 +36,52 @@ ENTITY_NAMES: dict[str, str] = {
 }
 
 
+# Entidades con sincronización bidireccional (e03800 -> Dynamics 365)
+BIDIRECTIONAL_ENTITIES: List[str] = [
+    'CompanyATISAs',
+    'WorkerPlaces',
+    'ContributionAccountCodeCCs',
+    'HolidaysAbsencesGroupATISAs',
+    'VacationBalances',
+    'IncidentGroupATISAs',
+    'AdvanceGroupATISAs',
+    'LibrariesGroupATISAs',
+    'LeaveGroupATISAs',
+    'HighsLowsChanges',
+    'VacationCalenders'
+]
+
+
+# id_servicios de gruposervicios del que se obtiene cada entidad bidireccional
+GRUPOSERVICIOS_SERVICE_IDS: dict[str, int] = {
+    'HolidaysAbsencesGroupATISAs': 30,
+    'IncidentGroupATISAs': 10,
+    'AdvanceGroupATISAs': 20,
+    'LibrariesGroupATISAs': 80,
+    'LeaveGroupATISAs': 100,
+    'HighsLowsChanges': 110
+}
+
+
+# Entidades que deben sincronizarse antes que otra en una ejecución completa
+# (los CCC se asocian a lugares de trabajo que ya deben existir en Dynamics)
+ENTITY_DEPENDENCIES: dict[str, List[str]] = {
+    'ContributionAccountCodeCCs': ['WorkerPlaces']
+}
+
+
+# Campos que identifican un registro de cada entidad (clave natural de la
+# instantánea en dynamic_entities; se antepone dataAreaId cuando existe)
+ENTITY_KEY_FIELDS: dict[str, tuple] = {
+    'CompanyATISAs': ('EQMCompanyIdATISA',),
+    'WorkerPlaces': ('EQMWorkerPlaceID',),
+    'ContributionAccountCodeCCs': ('EQMCCC', 'EQMWorkerPlaceID'),
+    'HolidaysAbsencesGroupATISAs': ('EQMHolidaysAbsencesGroupATISAId',),
+    'VacationBalances': ('EQMVacationBalanceId',),
+    'IncidentGroupATISAs': ('EQMIncidentGroupATISAId',),
+    'AdvanceGroupATISAs': ('EQMAdvanceGroupATISAId',),
+    'LibrariesGroupATISAs': ('EQMLibrariesGroupATISAId',),
+    'LeaveGroupATISAs': ('EQMLeaveGroupATISAId',),
+    'VacationCalenders': ('EQMVacationCalenderId',),
+    'HighsLowsChanges': ('EQMHighsLowsChangesID',)
+}
@@ -3,7 +3,7 @@ Puertos (interfaces) que definen los contratos que deben cumplir los adaptadores
 Sigue el principio de inversión de dependencias (DIP) de SOLID.
 """
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from domain.entities import DynamicsEntity
 
 
@@ -38,6 +38,28 @@ class DynamicsAPIAdapter(ABC):
         """
         pass
     
+    @abstractmethod
+    def iter_entity_pages(
+        self,
+        entity_name: str,
+        access_token: str,
+        filter_expression: Optional[str] = None,
+        page_size: Optional[int] = None
+    ) -> Iterator[List[Dict[Any, Any]]]:
+        """
+        Recorre una entidad de Dynamics 365 página a página siguiendo @odata.nextLink.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            filter_expression: Expresión de filtro OData opcional
+            page_size: Tamaño máximo de página (Prefer: odata.maxpagesize)
+            
+        Yields:
+            Lista de registros de cada página
+        """
+        pass
+    
     @abstractmethod
     def create_entity_data(self, entity_name: str, access_token: str, data: Dict[Any, Any]) -> Dict[Any, Any]:
         """
@@ -90,6 +112,26 @@ class DynamicsAPIAdapter(ABC):
         """
         pass
 
+    @abstractmethod
+    def execute_batch(
+        self,
+        access_token: str,
+        requests: List[Dict[str, Any]],
+        batch_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ejecuta escrituras agrupadas en peticiones OData $batch.
+
+        Args:
+            access_token: Token de acceso
+            requests: Peticiones de escritura (crear, actualizar, eliminar)
+            batch_size: Operaciones por petición $batch
+
+        Returns:
+            Lista alineada con requests con el resultado o error de cada operación
+        """
+        pass
+
 
 class DatabaseAdapter(ABC):
     """Puerto para interactuar con la base de datos."""
@@ -108,6 +150,20 @@ class DatabaseAdapter(ABC):
         """
         pass
     
+    @abstractmethod
+    def replace_entity_data(self, entity_name: str, data: List[Dict[Any, Any]]) -> int:
+        """
+        Sustituye los datos de una entidad (borrado e inserción en una transacción).
+        
+        Args:
+            entity_name: Nombre de la entidad
+            data: Datos a guardar
+            
+        Returns:
+            Número de registros guardados
+        """
+        pass
+    
     @abstractmethod
     def clear_entity_data(self, entity_name: str) -> bool:
         """
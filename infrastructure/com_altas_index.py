@@ -0,0 +1,192 @@
+"""
+Índices en memoria de com_altas (e03800).
+Responden a has_com_altas_record y get_last_created_date_by_type sin una
+consulta por registro y se mantienen al día con las altas y denegaciones
+de la misma ejecución.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from infrastructure.trabajador_index import normalize_trabajador_key
+
+
+def _key(value: Any) -> Optional[str]:
+    """Normaliza un código como lo compara MySQL (sin mayúsculas ni espacios finales)."""
+    if value is None:
+        return None
+    return str(value).strip().casefold()
+
+
+class ComAltasStatusIndex:
+    """
+    Filas (id, codiemp, naf, nif, tipo, estado) de com_altas indexadas por
+    (codiemp, naf) y (codiemp, nif).
+
+    Expone has_com_altas_record y mark_pending_altas_denegadas con la misma
+    semántica que EmployeeModificationsAdapter; la segunda solo actualiza el
+    índice (la base de datos se actualiza con el adaptador).
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        self._by_naf: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._by_nif: Dict[tuple, List[Dict[str, Any]]] = {}
+        self._size = 0
+        for row in rows:
+            self.add(row.get('id'), row)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, com_altas_id: Optional[int], data: Dict[str, Any]) -> None:
+        """
+        Añade una fila (p.ej. tras insert_com_altas).
+
+        Args:
+            com_altas_id: ID de com_altas
+            data: Datos con codiemp, naf, nif, tipo y estado
+        """
+        codiemp = _key(data.get('codiemp'))
+        if codiemp is None:
+            return
+        row = {
+            'id': com_altas_id,
+            'tipo': _key(data.get('tipo')),
+            'estado': _key(data.get('estado'))
+        }
+        naf = _key(data.get('naf'))
+        nif = _key(data.get('nif'))
+        if naf is not None:
+            self._by_naf.setdefault((codiemp, naf), []).append(row)
+        if nif is not None:
+            self._by_nif.setdefault((codiemp, nif), []).append(row)
+        self._size += 1
+
+    def _matches(self, codiemp: Optional[str], nass: Optional[str], nif: Optional[str]) -> List[Dict[str, Any]]:
+        """Filas de la empresa que coinciden por naf o por nif (sin repetir)."""
+        codiemp = _key(codiemp)
+        rows: Dict[int, Dict[str, Any]] = {}
+        if nass:
+            for row in self._by_naf.get((codiemp, _key(nass)), []):
+                rows[id(row)] = row
+        if nif:
+            for row in self._by_nif.get((codiemp, _key(nif)), []):
+                rows[id(row)] = row
+        return list(rows.values())
+
+    def has_com_altas_record(
+        self,
+        codiemp: Optional[str],
+        nass: Optional[str],
+        nif: Optional[str],
+        tipo: str,
+        estados: tuple
+    ) -> bool:
+        """Verifica si existe un registro por codiemp + (naf/nif) + tipo + estado."""
+        if not codiemp or (not nass and not nif):
+            return False
+        tipo = _key(tipo)
+        estados = {_key(estado) for estado in estados}
+        return any(
+            row['tipo'] == tipo and row['estado'] in estados
+            for row in self._matches(codiemp, nass, nif)
+        )
+
+    def mark_pending_altas_denegadas(
+        self,
+        codiemp: Optional[str],
+        nass: Optional[str],
+        nif: Optional[str],
+        exclude_id: Optional[int] = None
+    ) -> int:
+        """Refleja en el índice el paso a estado 'N' de las altas pendientes de la persona."""
+        if not codiemp:
+            return 0
+        updated = 0
+        for row in self._matches(codiemp, nass, nif):
+            if row['tipo'] != 'a' or row['estado'] in ('l', 'n'):
+                continue
+            if exclude_id is not None and row['id'] == exclude_id:
+                continue
+            row['estado'] = 'n'
+            updated += 1
+        return updated
+
+
+class LastCreatedDateIndex:
+    """
+    Último created_date de dfo_com_altas por trabajador y tipo de com_altas.
+
+    Equivale a get_last_created_date_by_type: la clave es (codiemp, nombre,
+    apellido1, apellido2, tipo) y, para las modificaciones, también
+    coditraba. Los nombres se comparan como en trabajadores (ver
+    normalize_trabajador_key).
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        """
+        Args:
+            rows: Filas con codiemp, nombre, apellido1, apellido2, tipo, coditraba y last_date
+        """
+        self._by_type: Dict[tuple, datetime] = {}
+        self._by_coditraba: Dict[tuple, datetime] = {}
+        for row in rows:
+            self.record(
+                row.get('codiemp'), row.get('nombre'), row.get('apellido1'), row.get('apellido2'),
+                row.get('tipo'), row.get('coditraba'), row.get('last_date')
+            )
+
+    def __len__(self) -> int:
+        return len(self._by_type)
+
+    @staticmethod
+    def _key(codiemp: Any, nombre: Any, apellido1: Any, apellido2: Any, tipo: Any) -> tuple:
+        return (
+            _key(codiemp),
+            normalize_trabajador_key(nombre),
+            normalize_trabajador_key(apellido1),
+            normalize_trabajador_key(apellido2),
+            _key(tipo)
+        )
+
+    @staticmethod
+    def _advance(target: Dict[tuple, datetime], key: tuple, created_date: datetime) -> None:
+        if key not in target or created_date > target[key]:
+            target[key] = created_date
+
+    def record(
+        self,
+        codiemp: Any,
+        nombre: Any,
+        apellido1: Any,
+        apellido2: Any,
+        tipo: Any,
+        coditraba: Any,
+        created_date: Optional[datetime]
+    ) -> None:
+        """
+        Anota un created_date (p.ej. tras insertar en com_altas y dfo_com_altas).
+
+        Las filas con algún campo de la clave a NULL no se anotan, porque en
+        MySQL nunca coinciden con '='.
+        """
+        key = self._key(codiemp, nombre, apellido1, apellido2, tipo)
+        if created_date is None or None in key:
+            return
+        self._advance(self._by_type, key, created_date)
+        if coditraba is not None:
+            self._advance(self._by_coditraba, key + (_key(coditraba),), created_date)
+
+    def get_last_created_date_by_type(
+        self,
+        codiemp: str,
+        nombre: str,
+        apellido1: str,
+        apellido2: str,
+        tipo: str,
+        coditraba: Optional[str] = None
+    ) -> Optional[datetime]:
+        """Último created_date del trabajador y tipo (y coditraba si es MODIFICACIÓN)."""
+        key = self._key(codiemp, nombre, apellido1, apellido2, tipo)
+        if tipo == 'M' and coditraba:
+            return self._by_coditraba.get(key + (_key(coditraba),))
+        return self._by_type.get(key)
@@ -2,11 +2,17 @@
 Adaptador para la base de datos MySQL.
 Implementa el puerto DatabaseAdapter.
 """
-import mysql.connector
 from mysql.connector import Error
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from config.settings import settings
+from domain.constants import ENTITY_KEY_FIELDS
+from infrastructure.mysql_pool import get_mysql_pool
+import hashlib
+import json
 import logging
+import os
+import re
+import tempfile
 
 logger = logging.getLogger(__name__)
 
@@ -15,24 +21,18 @@ class MySQLDatabaseAdapter:
     """Adaptador para interactuar con la base de datos MySQL."""
     
     def __init__(self):
-        self._host = settings.db_host
-        self._port = settings.db_port
-        self._user = settings.db_user
-        self._password = settings.db_password
         self._database = settings.db_name
+        self._chunk_size = max(1, settings.snapshot_chunk_size)
+        self._load_mode = settings.snapshot_load_mode
+        self._snapshot_mode = settings.snapshot_mode
+        self._is_partitioned = None
     
     def _get_connection(self):
-        """Obtiene una conexión a la base de datos."""
+        """Obtiene una conexión del pool compartido (close() la devuelve al pool)."""
         try:
-            connection = mysql.connector.connect(
-                host=self._host,
-                port=self._port,
-                user=self._user,
-                password=self._password,
-                database=self._database,
-                autocommit=False
-            )
-            return connection
+            if self._load_mode == "infile":
+                return get_mysql_pool(self._database, allow_local_infile=True).get_connection()
+            return get_mysql_pool(self._database).get_connection()
         except Error as e:
             logger.error(f"Error conectando a MySQL: {e}")
             raise
@@ -86,21 +86,7 @@ class MySQLDatabaseAdapter:
             connection = self._get_connection()
             cursor = connection.cursor()
             
-            records_saved = 0
-            
-            for record in data:
-                # Convertir el registro a JSON para guardarlo
-                import json
-                json_data = json.dumps(record)
-                
-                # Insertar en la tabla (estructura genérica con id, entity_name, json_data)
-                insert_query = """
-                    INSERT INTO dynamic_entities (entity_name, json_data) 
-                    VALUES (%s, %s)
-                """
-                
-                cursor.execute(insert_query, (entity_name, json_data))
-                records_saved += 1
+            records_saved = self._insert_rows(cursor, entity_name, data)
             
             connection.commit()
             logger.info(f"Guardados {records_saved} registros en {table_name}")
@@ -118,6 +104,383 @@ class MySQLDatabaseAdapter:
             if connection:
                 connection.close()
     
+    def replace_entity_data(self, entity_name: str, data: List[Dict[Any, Any]]) -> int:
+        """
+        Sustituye la instantánea de una entidad en una única transacción.
+        
+        Borra los registros anteriores e inserta los nuevos en bloque, de modo
+        que otros lectores nunca ven la entidad vacía o a medio cargar. Según
+        SNAPSHOT_MODE se intercambia una partición (exchange) o solo se
+        escriben los registros que cambian (incremental).
+        
+        Args:
+            entity_name: Nombre de la entidad
+            data: Datos a guardar
+            
+        Returns:
+            Número de registros guardados
+        """
+        if self._snapshot_mode == "incremental":
+            return self._replace_incrementally(entity_name, data)
+        if self._snapshot_mode == "exchange":
+            if self._dynamic_entities_partitioned():
+                return self._replace_by_partition_exchange(entity_name, data)
+            logger.warning(
+                "dynamic_entities no está particionada (ver database/dynamic_entities_partitioning.sql), "
+                "se usa sustitución transaccional"
+            )
+        return self._replace_in_transaction(entity_name, data)
+    
+    def _replace_in_transaction(self, entity_name: str, data: List[Dict[Any, Any]]) -> int:
+        """Borra e inserta los registros de la entidad en una única transacción."""
+        table_name = self._get_table_name(entity_name)
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            
+            cursor.execute("DELETE FROM dynamic_entities WHERE entity_name = %s", (entity_name,))
+            records_saved = self._insert_rows(cursor, entity_name, data)
+            
+            connection.commit()
+            logger.info(f"Instantánea de {table_name} sustituida: {records_saved} registros")
+            
+            return records_saved
+            
+        except Error as e:
+            if connection:
+                connection.rollback()
+            logger.error(f"Error sustituyendo datos de {entity_name}: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
+    def _replace_by_partition_exchange(self, entity_name: str, data: List[Dict[Any, Any]]) -> int:
+        """
+        Carga la entidad en una tabla de staging y la intercambia con su partición.
+        
+        EXCHANGE PARTITION solo cambia metadatos: los lectores pasan de la
+        instantánea anterior a la nueva de forma atómica, sin DELETE masivo.
+        
+        La tabla de staging empieza su AUTO_INCREMENT en el MAX(id) de
+        dynamic_entities, y tras el intercambio se adelanta el contador de la
+        tabla, para que id siga siendo único en toda la tabla aunque la PK sea
+        (id, entity_name). Por eso los intercambios de distintas entidades se
+        serializan con un único bloqueo.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            data: Datos a guardar
+            
+        Returns:
+            Número de registros guardados
+        """
+        table_name = self._get_table_name(entity_name)
+        suffix = re.sub(r'[^0-9A-Za-z_]', '_', entity_name)
+        partition = f"p_{suffix}"
+        staging_table = f"dynamic_entities_stage_{suffix}"
+        lock_name = "dynamic_entities_swap"
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            
+            # Un solo intercambio a la vez: protege la tabla de staging y el rango de ids que se le asigna
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (lock_name, 600))
+            if cursor.fetchone()[0] != 1:
+                raise Error(f"No se obtuvo el bloqueo {lock_name}")
+            
+            try:
+                self._ensure_partition(cursor, entity_name, partition)
+                
+                cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+                cursor.execute(f"CREATE TABLE {staging_table} LIKE dynamic_entities")
+                cursor.execute(f"ALTER TABLE {staging_table} REMOVE PARTITIONING")
+                cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM dynamic_entities")
+                next_id = int(cursor.fetchone()[0])
+                cursor.execute(f"ALTER TABLE {staging_table} AUTO_INCREMENT = {next_id}")
+                
+                records_saved = self._insert_rows(cursor, entity_name, data, staging_table)
+                connection.commit()
+                
+                cursor.execute(
+                    f"ALTER TABLE dynamic_entities EXCHANGE PARTITION {partition} "
+                    f"WITH TABLE {staging_table} WITHOUT VALIDATION"
+                )
+                # Tras el intercambio la tabla de staging contiene la instantánea anterior
+                cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+                # Los ids nuevos no pasaron por el contador de dynamic_entities: adelantarlo
+                cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM dynamic_entities")
+                cursor.execute(f"ALTER TABLE dynamic_entities AUTO_INCREMENT = {int(cursor.fetchone()[0])}")
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                cursor.fetchone()
+            
+            logger.info(f"Instantánea de {table_name} intercambiada: {records_saved} registros")
+            
+            return records_saved
+            
+        except Error as e:
+            if connection:
+                connection.rollback()
+            logger.error(f"Error intercambiando la partición de {entity_name}: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
+    def _replace_incrementally(self, entity_name: str, data: List[Dict[Any, Any]]) -> int:
+        """
+        Aplica solo la diferencia entre la instantánea guardada y la nueva.
+        
+        Cada fila guarda su clave natural (record_key) y un hash de su
+        contenido (content_hash); se insertan las claves nuevas, se actualizan
+        las que cambian de hash y se borran las que ya no existen, todo en
+        una transacción.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            data: Datos a guardar
+            
+        Returns:
+            Número de registros de la instantánea
+        """
+        table_name = self._get_table_name(entity_name)
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            
+            cursor.execute(
+                "SELECT record_key, content_hash FROM dynamic_entities WHERE entity_name = %s",
+                (entity_name,)
+            )
+            stored = dict(cursor.fetchall())
+            
+            incoming = self._keyed_records(entity_name, data)
+            upserts = [
+                (entity_name, key, content_hash, json_data)
+                for key, (content_hash, json_data) in incoming.items()
+                if stored.get(key) != content_hash
+            ]
+            stale_keys = [key for key in stored if key is not None and key not in incoming]
+            
+            # Las filas sin record_key son anteriores al modo incremental y se recargan
+            if None in stored:
+                cursor.execute(
+                    "DELETE FROM dynamic_entities WHERE entity_name = %s AND record_key IS NULL",
+                    (entity_name,)
+                )
+            for start in range(0, len(stale_keys), self._chunk_size):
+                chunk = stale_keys[start:start + self._chunk_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"DELETE FROM dynamic_entities WHERE entity_name = %s AND record_key IN ({placeholders})",
+                    (entity_name, *chunk)
+                )
+            
+            upsert_query = """
+                INSERT INTO dynamic_entities (entity_name, record_key, content_hash, json_data)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    content_hash = VALUES(content_hash),
+                    json_data = VALUES(json_data)
+            """
+            for start in range(0, len(upserts), self._chunk_size):
+                cursor.executemany(upsert_query, upserts[start:start + self._chunk_size])
+            
+            connection.commit()
+            inserted = sum(1 for _, key, _, _ in upserts if key not in stored)
+            logger.info(
+                f"Instantánea de {table_name}: {inserted} nuevos, {len(upserts) - inserted} modificados, "
+                f"{len(stale_keys)} eliminados, {len(incoming) - len(upserts)} sin cambios"
+            )
+            
+            return len(incoming)
+            
+        except Error as e:
+            if connection:
+                connection.rollback()
+            logger.error(f"Error actualizando incrementalmente {entity_name}: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
+    def _keyed_records(self, entity_name: str, data: List[Dict[Any, Any]]) -> Dict[str, Tuple[str, str]]:
+        """
+        Calcula clave natural, hash y JSON de cada registro.
+        
+        La clave se forma con dataAreaId y los campos de ENTITY_KEY_FIELDS; si
+        la entidad no tiene campos definidos se usa el propio hash. Las claves
+        repetidas se numeran en orden de hash de contenido y no de llegada,
+        para que el mismo conjunto de registros reciba siempre las mismas
+        claves aunque Dynamics los devuelva en otro orden.
+        
+        Returns:
+            Diccionario record_key -> (content_hash, json_data)
+        """
+        key_fields = ENTITY_KEY_FIELDS.get(entity_name)
+        groups: Dict[str, List[Tuple[str, str]]] = {}
+        
+        for record in data:
+            json_data = json.dumps(record)
+            canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+            content_hash = hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+            
+            if key_fields:
+                parts = [str(record.get('dataAreaId') or '')]
+                parts.extend(str(record.get(field) or '').strip() for field in key_fields)
+                key = "|".join(parts)
+            else:
+                key = content_hash
+            if len(key) > 200:
+                key = "h:" + hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+            
+            groups.setdefault(key, []).append((content_hash, json_data))
+        
+        keyed: Dict[str, Tuple[str, str]] = {}
+        for key, entries in groups.items():
+            entries.sort()
+            keyed[key] = entries[0]
+            for occurrence, entry in enumerate(entries[1:], 2):
+                keyed[f"{key}#{occurrence}"] = entry
+        
+        return keyed
+    
+    def _dynamic_entities_partitioned(self) -> bool:
+        """Indica si dynamic_entities está particionada por entity_name (se consulta una vez)."""
+        if self._is_partitioned is None:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            try:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.PARTITIONS
+                    WHERE TABLE_SCHEMA = DATABASE()
+                      AND TABLE_NAME = 'dynamic_entities'
+                      AND PARTITION_NAME IS NOT NULL
+                """)
+                self._is_partitioned = cursor.fetchone()[0] > 0
+            finally:
+                cursor.close()
+                connection.close()
+        return self._is_partitioned
+    
+    def _ensure_partition(self, cursor, entity_name: str, partition: str) -> None:
+        """Crea la partición LIST de la entidad si aún no existe."""
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE()
+              AND TABLE_NAME = 'dynamic_entities'
+              AND PARTITION_NAME = %s
+        """, (partition,))
+        if cursor.fetchone()[0] == 0:
+            logger.info(f"Creando partición {partition} en dynamic_entities")
+            cursor.execute(
+                f"ALTER TABLE dynamic_entities ADD PARTITION "
+                f"(PARTITION {partition} VALUES IN (%s))",
+                (entity_name,)
+            )
+    
+    def _insert_rows(
+        self,
+        cursor,
+        entity_name: str,
+        data: List[Dict[Any, Any]],
+        target_table: str = "dynamic_entities"
+    ) -> int:
+        """
+        Inserta registros en bloque, sin confirmar la transacción.
+        
+        Args:
+            cursor: Cursor de la conexión en curso
+            entity_name: Nombre de la entidad
+            data: Datos a insertar
+            target_table: Tabla destino (dynamic_entities o su tabla de staging)
+            
+        Returns:
+            Número de registros insertados
+        """
+        if not data:
+            return 0
+        if self._load_mode == "infile":
+            return self._load_rows_from_file(cursor, entity_name, data, target_table)
+        
+        # executemany reescribe el INSERT como VALUES multi-fila por cada bloque
+        insert_query = f"""
+            INSERT INTO {target_table} (entity_name, json_data) 
+            VALUES (%s, %s)
+        """
+        for start in range(0, len(data), self._chunk_size):
+            chunk = data[start:start + self._chunk_size]
+            cursor.executemany(insert_query, [(entity_name, json.dumps(record)) for record in chunk])
+        
+        return len(data)
+    
+    def _load_rows_from_file(
+        self,
+        cursor,
+        entity_name: str,
+        data: List[Dict[Any, Any]],
+        target_table: str = "dynamic_entities"
+    ) -> int:
+        """
+        Inserta registros con LOAD DATA LOCAL INFILE desde un fichero temporal.
+        
+        Requiere local_infile=1 en el servidor MySQL.
+        
+        Args:
+            cursor: Cursor de la conexión en curso
+            entity_name: Nombre de la entidad
+            data: Datos a insertar
+            target_table: Tabla destino
+            
+        Returns:
+            Número de registros insertados
+        """
+        escaped_entity = self._escape_infile_value(entity_name)
+        handle, path = tempfile.mkstemp(prefix="dynamic_entities_", suffix=".tsv")
+        
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8", newline="\n") as tsv:
+                for record in data:
+                    tsv.write(f"{escaped_entity}\t{self._escape_infile_value(json.dumps(record))}\n")
+            
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE '{path}'
+                INTO TABLE {target_table}
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                (entity_name, json_data)
+            """)
+            return cursor.rowcount
+        finally:
+            os.remove(path)
+    
+    @staticmethod
+    def _escape_infile_value(value: str) -> str:
+        """Escapa un valor para el formato por defecto de LOAD DATA (tabuladores y saltos de línea)."""
+        return (
+            value.replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+    
     def clear_entity_data(self, entity_name: str) -> bool:
         """
         Limpia los datos de una entidad de la base de datos.
@@ -174,8 +537,11 @@ class MySQLDatabaseAdapter:
             CREATE TABLE IF NOT EXISTS dynamic_entities (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 entity_name VARCHAR(100) NOT NULL,
+                record_key VARCHAR(255) NULL,
+                content_hash CHAR(32) NULL,
                 json_data TEXT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY uk_entity_record (entity_name, record_key),
                 INDEX idx_entity_name (entity_name),
                 INDEX idx_created_at (created_at)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
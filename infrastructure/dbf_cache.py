@@ -0,0 +1,201 @@
+"""
+Caché de tablas DBF decodificadas.
+Evita volver a leer y decodificar por el montaje de red un DBF que no ha
+cambiado: las entradas se identifican por ruta real, tamaño, mtime y la
+proyección/filtro con que se leyeron.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Mapping, Optional, Sequence, Tuple
+from config.settings import settings
+from infrastructure.dbf_reader import read_dbf_records
+
+logger = logging.getLogger(__name__)
+
+# (ruta real, tamaño en bytes, mtime en ns, variante de lectura)
+DBFCacheKey = Tuple[str, int, int, str]
+
+
+class DBFTableCache:
+    """
+    Caché LRU thread-safe de registros DBF ya decodificados.
+
+    Los registros devueltos se comparten entre llamantes y no deben
+    modificarse. Opcionalmente guarda una copia decodificada en disco local
+    para que otro proceso no tenga que volver a leer el montaje.
+    """
+
+    def __init__(self, max_bytes: int, persist_dir: Optional[str] = None):
+        self._max_bytes = max_bytes
+        self._persist_dir = Path(persist_dir) if persist_dir else None
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._entries: "OrderedDict[DBFCacheKey, List[Dict[str, Any]]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get_records(
+        self,
+        path: Path,
+        fields: Optional[Sequence[str]] = None,
+        where: Optional[Mapping[str, Collection[str]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Devuelve los registros decodificados del DBF.
+
+        Con `fields` solo se decodifican esos campos y con `where` se
+        descartan antes de decodificar los registros que no cumplen el
+        filtro (ver read_dbf_records). Cada combinación se cachea aparte.
+
+        Args:
+            path: Ruta del archivo DBF
+            fields: Campos a devolver (None = todos)
+            where: Campo -> valores admitidos
+
+        Returns:
+            Lista de registros (dict campo -> valor), compartida y de solo lectura
+        """
+        real_path = os.path.realpath(str(path))
+        variant = self._variant(fields, where)
+
+        # Una sola lectura en vuelo por archivo aunque haya varios llamantes
+        with self._lock:
+            load_lock = self._load_locks.setdefault(real_path, threading.Lock())
+
+        with load_lock:
+            stat = os.stat(real_path)
+            key = (real_path, stat.st_size, stat.st_mtime_ns, variant)
+
+            with self._lock:
+                records = self._entries.get(key)
+                if records is not None:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return records
+                self._misses += 1
+
+            records = self._load_persisted(key)
+            if records is None:
+                if fields is None and where is None:
+                    records = self._read_dbf(real_path)
+                else:
+                    records = read_dbf_records(Path(real_path), fields or [], where)
+                self._persist(key, records)
+
+            self._store(key, records)
+            return records
+
+    @staticmethod
+    def _variant(
+        fields: Optional[Sequence[str]],
+        where: Optional[Mapping[str, Collection[str]]]
+    ) -> str:
+        """Identificador estable de la proyección y el filtro ('' = tabla completa)."""
+        if fields is None and where is None:
+            return ""
+        description = repr((
+            [name.upper() for name in fields or []],
+            sorted((name.upper(), sorted(str(value) for value in values)) for name, values in (where or {}).items())
+        ))
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()[:12]
+
+    def _read_dbf(self, real_path: str) -> List[Dict[str, Any]]:
+        """Lee y decodifica el DBF completo."""
+        try:
+            from dbfread import DBF
+        except ImportError:
+            logger.error("dbfread no está instalado. Instálalo con: pip install dbfread")
+            raise
+
+        # char_decode_errors='ignore': ignora errores de codificación
+        table = DBF(real_path, load=False, char_decode_errors='ignore')
+        return [dict(record) for record in table]
+
+    def _store(self, key: DBFCacheKey, records: List[Dict[str, Any]]) -> None:
+        """Guarda la entrada, descarta versiones anteriores del archivo y aplica el límite LRU."""
+        with self._lock:
+            for old_key in [k for k in self._entries if (k[0], k[3]) == (key[0], key[3]) and k != key]:
+                del self._entries[old_key]
+            self._entries[key] = records
+
+            # El tamaño del archivo sirve de estimación del coste en memoria
+            while len(self._entries) > 1 and sum(k[1] for k in self._entries) > self._max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.debug(f"DBF {evicted[0]} expulsado de la caché")
+
+    def _persisted_path(self, key: DBFCacheKey) -> Path:
+        digest = hashlib.sha1(key[0].encode("utf-8")).hexdigest()[:16]
+        return self._persist_dir / f"{digest}-{key[3] or 'full'}-{key[1]}-{key[2]}.pickle"
+
+    def _load_persisted(self, key: DBFCacheKey) -> Optional[List[Dict[str, Any]]]:
+        """Carga la copia local decodificada si corresponde a la misma versión del archivo."""
+        if self._persist_dir is None:
+            return None
+        local_path = self._persisted_path(key)
+        if not local_path.exists():
+            return None
+        try:
+            with open(local_path, "rb") as handle:
+                records = pickle.load(handle)
+            logger.info(f"✓ DBF {Path(key[0]).name} cargado desde copia local {local_path}")
+            return records
+        except Exception as e:
+            logger.warning(f"Copia local de DBF ilegible ({local_path}): {e}")
+            return None
+
+    def _persist(self, key: DBFCacheKey, records: List[Dict[str, Any]]) -> None:
+        """Guarda una copia local decodificada y elimina las de versiones anteriores."""
+        if self._persist_dir is None:
+            return
+        try:
+            self._persist_dir.mkdir(parents=True, exist_ok=True)
+            local_path = self._persisted_path(key)
+            # Copias de versiones anteriores del mismo archivo (cualquier variante)
+            prefix = local_path.name.split("-", 1)[0]
+            version = f"-{key[1]}-{key[2]}.pickle"
+            for stale in self._persist_dir.glob(f"{prefix}-*.pickle"):
+                if not stale.name.endswith(version):
+                    stale.unlink(missing_ok=True)
+
+            tmp_path = local_path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as handle:
+                pickle.dump(records, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, local_path)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la copia local del DBF {key[0]}: {e}")
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Devuelve los contadores de la caché.
+
+        Returns:
+            Diccionario con hits, misses y tablas en memoria
+        """
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses, 'tables': len(self._entries)}
+
+
+_shared_cache: Optional[DBFTableCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_dbf_cache() -> DBFTableCache:
+    """
+    Devuelve la caché DBF compartida por todo el proceso.
+
+    Returns:
+        Instancia única de DBFTableCache
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = DBFTableCache(
+                max_bytes=settings.dbf_cache_max_mb * 1024 * 1024,
+                persist_dir=settings.dbf_cache_dir or None
+            )
+        return _shared_cache
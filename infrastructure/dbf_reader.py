@@ -0,0 +1,312 @@
+"""
+Lector DBF en streaming con proyección de campos y filtrado previo.
+Recorre el archivo por bloques, descarta registros por comparación de
+bytes antes de decodificarlos y solo decodifica los campos pedidos.
+
+Si NumPy está instalado, el archivo se mapea en memoria como una matriz
+de bytes (un registro por fila) y el filtrado se hace por columnas. Los
+archivos grandes pueden repartirse por rangos de registros entre varios
+procesos (read_dbf_records).
+"""
+import logging
+import multiprocessing
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+from config.settings import settings
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa el lector por bloques
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Registros leídos por cada lectura del archivo
+_RECORDS_PER_READ = 4096
+
+# Tipos de campo que dbfread resuelve leyendo el archivo de memo
+_MEMO_FIELD_TYPES = {'M', 'G', 'B', 'P'}
+
+
+def _open_table(path: Path):
+    """Abre la cabecera del DBF con dbfread (sin cargar registros)."""
+    try:
+        from dbfread import DBF
+    except ImportError:
+        logger.error("dbfread no está instalado. Instálalo con: pip install dbfread")
+        raise
+    # char_decode_errors='ignore': ignora errores de codificación
+    return DBF(str(path), load=False, char_decode_errors='ignore')
+
+
+def count_dbf_records(path: Path) -> int:
+    """
+    Devuelve el número de registros declarado en la cabecera del DBF.
+
+    Solo lee los primeros bytes del archivo.
+    """
+    with open(path, "rb") as handle:
+        header = handle.read(8)
+    return struct.unpack("<I", header[4:8])[0]
+
+
+def _field_layout(table, names: Sequence[str], required: bool = True) -> List[Tuple[str, Any, int, int]]:
+    """
+    Calcula posición y longitud de los campos pedidos dentro del registro.
+
+    Args:
+        table: Tabla dbfread abierta
+        names: Campos pedidos
+        required: Si es False, los campos inexistentes se devuelven con campo None
+
+    Returns:
+        Lista de (nombre pedido, campo dbfread, inicio, fin)
+    """
+    offsets: Dict[str, Tuple[Any, int, int]] = {}
+    position = 1  # el primer byte es la marca de borrado
+    for field in table.fields:
+        offsets[field.name.upper()] = (field, position, position + field.length)
+        position += field.length
+
+    layout = []
+    for name in names:
+        entry = offsets.get(name.upper())
+        if entry is None:
+            if not required:
+                layout.append((name, None, 0, 0))
+                continue
+            raise KeyError(f"Campo {name} no existe en {table.filename}")
+        field, start, end = entry
+        # En Visual FoxPro un campo B de 8 bytes es un double, no un memo
+        if field.type in _MEMO_FIELD_TYPES and not (field.type == 'B' and field.length == 8):
+            raise ValueError(f"Campo memo {name} no soportado por el lector proyectado")
+        layout.append((name, field, start, end))
+    return layout
+
+
+def read_dbf_records(
+    path: Path,
+    fields: Sequence[str],
+    where: Optional[Mapping[str, Collection[str]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Lee un DBF con proyección y filtro, en paralelo si el archivo es grande.
+
+    Con DBF_SCAN_WORKERS > 1 y al menos DBF_PARALLEL_MIN_RECORDS registros,
+    el archivo se divide en rangos contiguos de registros que decodifica y
+    filtra un pool de procesos; los resultados se unen en orden de registro.
+    Los procesos se crean con "spawn" y no con fork: el proceso principal
+    tiene otros hilos (scheduler, extracción en paralelo, renovación del
+    token) y un fork mientras uno de ellos retiene un lock (logging, pools
+    MySQL/HTTP) dejaría bloqueado al hijo. Por eso _read_range es una
+    función de módulo y sus argumentos son tipos básicos serializables.
+
+    Args:
+        path: Ruta del archivo DBF
+        fields: Campos a devolver
+        where: Campo -> valores admitidos
+
+    Returns:
+        Lista de registros en el orden del archivo
+    """
+    workers = settings.dbf_scan_workers
+    total = count_dbf_records(path)
+    if workers <= 1 or total < settings.dbf_parallel_min_records:
+        return list(iter_dbf_records(path, fields, where))
+
+    step = -(-total // workers)
+    ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+    logger.info(f"✓ Leyendo {Path(path).name} en {len(ranges)} rangos con {workers} procesos")
+
+    where_sets = {name: set(values) for name, values in (where or {}).items()}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_read_range, str(path), list(fields), where_sets, record_range)
+            for record_range in ranges
+        ]
+        records: List[Dict[str, Any]] = []
+        for future in futures:
+            records.extend(future.result())
+    return records
+
+
+def _read_range(
+    path: str,
+    fields: List[str],
+    where: Dict[str, set],
+    record_range: Tuple[int, int]
+) -> List[Dict[str, Any]]:
+    """Trabajo de un proceso del pool: lee un rango de registros."""
+    return list(iter_dbf_records(Path(path), fields, where, record_range))
+
+
+def iter_dbf_records(
+    path: Path,
+    fields: Sequence[str],
+    where: Optional[Mapping[str, Collection[str]]] = None,
+    record_range: Optional[Tuple[int, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre un DBF devolviendo solo los campos pedidos de los registros que cumplen el filtro.
+
+    Los registros borrados se omiten, igual que en dbfread. Los filtros de
+    campos de texto se comparan sobre los bytes sin espacios, antes de
+    decodificar; los de otros tipos se comparan con str(valor).strip().
+    Los campos proyectados que no existan en el archivo se devuelven como
+    None, igual que record.get().
+
+    Args:
+        path: Ruta del archivo DBF
+        fields: Campos a devolver (sin distinguir mayúsculas)
+        where: Campo -> valores admitidos (ya sin espacios)
+        record_range: Rango [inicio, fin) de registros a leer (None = todos)
+
+    Yields:
+        Diccionario campo pedido -> valor decodificado
+    """
+    from dbfread.field_parser import FieldParser
+
+    table = _open_table(path)
+    parser = FieldParser(table)
+    projection = _field_layout(table, fields, required=False)
+
+    filters = []
+    for name, allowed in (where or {}).items():
+        (_, field, start, end), = _field_layout(table, [name])
+        if field.type == 'C':
+            encoded = {str(value).encode(table.encoding, errors='ignore') for value in allowed}
+            filters.append((field, start, end, encoded, True))
+        else:
+            filters.append((field, start, end, {str(value) for value in allowed}, False))
+
+    # El decodificador columnar solo filtra campos de texto (comparación de bytes)
+    if np is not None and settings.dbf_numpy_enabled and all(raw for *_, raw in filters):
+        yield from _iter_columnar(path, table, parser, projection, filters, record_range)
+        return
+
+    first, last = record_range or (0, table.header.numrecords)
+    last = min(last, table.header.numrecords)
+    record_length = table.header.recordlen
+    remaining = last - first
+
+    with open(path, "rb") as handle:
+        handle.seek(table.header.headerlen + first * record_length)
+        while remaining > 0:
+            count = min(remaining, _RECORDS_PER_READ)
+            block = handle.read(record_length * count)
+            if not block:
+                break
+            remaining -= count
+
+            for offset in range(0, len(block) - record_length + 1, record_length):
+                record = block[offset:offset + record_length]
+                flag = record[:1]
+                if flag == b'\x1a':
+                    return
+                if flag == b'*':
+                    continue
+
+                matches = True
+                for field, start, end, allowed, raw in filters:
+                    if raw:
+                        value = record[start:end].strip(b'\0 ')
+                    else:
+                        value = str(parser.parse(field, record[start:end])).strip()
+                    if value not in allowed:
+                        matches = False
+                        break
+                if not matches:
+                    continue
+
+                yield {
+                    name: parser.parse(field, record[start:end]) if field is not None else None
+                    for name, field, start, end in projection
+                }
+
+
+def _iter_columnar(
+    path: Path,
+    table,
+    parser,
+    projection,
+    filters,
+    record_range: Optional[Tuple[int, int]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Variante de iter_dbf_records sobre numpy.memmap.
+
+    Cada registro es una fila de una matriz de bytes de ancho fijo: el
+    recorte y la pertenencia al filtro se calculan por columnas y solo se
+    crean objetos Python para los registros que sobreviven.
+    """
+    header = table.header
+    first, last = record_range or (0, header.numrecords)
+    available = max(0, (os.path.getsize(path) - header.headerlen) // header.recordlen)
+    count = min(last, header.numrecords, available) - first
+    if count <= 0:
+        return
+
+    rows = np.memmap(
+        path,
+        dtype=np.uint8,
+        mode='r',
+        offset=header.headerlen + first * header.recordlen,
+        shape=(count, header.recordlen)
+    )
+    try:
+        flags = rows[:, 0]
+        # 0x1A marca el fin de datos; '*' los registros borrados
+        end_marks = np.flatnonzero(flags == 0x1A)
+        if end_marks.size:
+            count = int(end_marks[0])
+            rows, flags = rows[:count], flags[:count]
+        mask = flags != ord('*')
+
+        for _, start, end, allowed, _ in filters:
+            column = _bytes_column(rows[:, start:end])
+            column = np.char.strip(column, b'\0 ')
+            # Un valor más largo que el campo no puede coincidir; convertirlo al ancho del campo lo truncaría
+            candidates = sorted(value for value in allowed if len(value) <= end - start)
+            if not candidates:
+                mask[:] = False
+                break
+            mask &= np.isin(column, np.array(candidates, dtype=column.dtype))
+
+        selected = np.flatnonzero(mask)
+        if selected.size == 0:
+            return
+
+        columns = []
+        for name, field, start, end in projection:
+            if field is None:
+                columns.append((name, None, None))
+            elif field.type == 'C':
+                values = _bytes_column(rows[selected, start:end]).tolist()
+                columns.append((name, field, values))
+            else:
+                # El resto de tipos (binarios I/B/Y/T...) se pasan con todos sus bytes, como en el lector
+                # por bloques: la vista S{ancho} quitaría los NUL finales
+                block = np.ascontiguousarray(rows[selected, start:end])
+                columns.append((name, field, [row.tobytes() for row in block]))
+    finally:
+        del rows
+
+    for index in range(selected.size):
+        yield {
+            name: parser.parse(field, values[index]) if field is not None else None
+            for name, field, values in columns
+        }
+
+
+def _bytes_column(block) -> "np.ndarray":
+    """
+    Convierte un bloque (filas x ancho) de bytes en un vector de cadenas de bytes fijas.
+
+    NumPy descarta los NUL finales de cada cadena, así que solo sirve para
+    campos C (cuyo parser también los descarta).
+    """
+    width = block.shape[1]
+    return np.ascontiguousarray(block).view(f'S{width}').ravel()
@@ -2,42 +2,84 @@
 Adaptador para la API de Dynamics 365.
 Implementa el puerto DynamicsAPIAdapter.
 """
-import http.client
+import email
+import email.utils
 import json
 import logging
+import re
+import time
 import urllib.parse
-from typing import List, Dict, Any
+import uuid
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from config.settings import settings
+from infrastructure.http_connection_pool import get_https_pool, PooledResponse
 
 logger = logging.getLogger(__name__)
 
 
+class DynamicsAPIError(Exception):
+    """Error HTTP devuelto por Dynamics 365, con el estado y el Retry-After si lo hay."""
+    
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Convierte la cabecera Retry-After (segundos o fecha HTTP) a segundos de espera.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
 class DynamicsAPIAdapter:
     """Adaptador para interactuar con la API de Dynamics 365."""
     
     def __init__(self):
         self._base_url = settings.api_base_url
+        self._pool = get_https_pool()
+
+    def _send(self, method: str, url: str, body: Any, headers: Dict[str, str]) -> PooledResponse:
+        """
+        Envía una petición a Dynamics 365 usando el pool de conexiones compartido.
+        """
+        return self._pool.request(self._base_url, method, url, body, headers)
     
-    def get_entity_data(
+    def iter_entity_pages(
         self,
         entity_name: str,
         access_token: str,
         filter_expression: str = None,
-        metadata: str = "minimal"
-    ) -> List[Dict[Any, Any]]:
+        metadata: str = "minimal",
+        page_size: Optional[int] = None
+    ) -> Iterator[List[Dict[Any, Any]]]:
         """
-        Obtiene todos los datos de una entidad de Dynamics 365.
+        Recorre una entidad de Dynamics 365 página a página.
+        
+        Envía la cabecera Prefer: odata.maxpagesize y sigue @odata.nextLink
+        hasta agotar los resultados, entregando cada página en cuanto llega.
         
         Args:
             entity_name: Nombre de la entidad
             access_token: Token de acceso
             filter_expression: Expresión de filtro OData opcional (ej: "anio eq 2024")
+            metadata: Nivel de metadatos OData (minimal, full, none)
+            page_size: Tamaño máximo de página solicitado al servidor
+                (por defecto settings.dynamics_page_size)
             
-        Returns:
-            Lista de registros de la entidad
+        Yields:
+            Lista de registros de cada página
         """
-        conn = http.client.HTTPSConnection(self._base_url)
-        
         accept_header = 'application/json'
         if metadata:
             accept_header = f"application/json;odata.metadata={metadata}"
@@ -47,101 +89,130 @@ class DynamicsAPIAdapter:
             'Accept': accept_header
         }
         
+        if page_size is None:
+            page_size = settings.dynamics_page_size
+        if page_size:
+            headers['Prefer'] = f"odata.maxpagesize={int(page_size)}"
+        
         # Construir URL con filtro si se proporciona
         url = f"/data/{entity_name}"
         if filter_expression:
-            import urllib.parse
             url = f"{url}?$filter={urllib.parse.quote(filter_expression)}"
         
-        # Realizar petición GET
-        full_url = f"https://{self._base_url}{url}"
-        logger.info(f"🌐 API REQUEST [GET]: {full_url}")
-        conn.request("GET", url, '', headers)
-        
-        response = conn.getresponse()
-        data = response.read().decode("utf-8")
-        
-        if response.status != 200:
-            raise Exception(f"Error obteniendo datos de {entity_name}: {data}")
-        
-        # Parsear respuesta JSON
-        response_data = json.loads(data)
+        page_number = 0
+        while url:
+            page_number += 1
+            # Realizar petición GET
+            full_url = f"https://{self._base_url}{url}"
+            logger.info(f"🌐 API REQUEST [GET]: {full_url}")
+            response = self._send("GET", url, '', headers)
+            data = response.body
+            
+            if response.status != 200:
+                raise Exception(f"Error obteniendo datos de {entity_name}: {data}")
+            
+            # Parsear respuesta JSON
+            response_data = json.loads(data)
+            
+            # OData devuelve los datos en el campo 'value'
+            next_link = response_data.get('@odata.nextLink')
+            page = response_data.get('value') or []
+            
+            if next_link:
+                logger.info(f"   Página {page_number}: {len(page)} registros (hay más páginas)")
+            
+            yield page
+            
+            url = self._relative_url(next_link) if next_link else None
+
+    def get_entity_data(
+        self,
+        entity_name: str,
+        access_token: str,
+        filter_expression: str = None,
+        metadata: str = "minimal",
+        page_size: Optional[int] = None
+    ) -> List[Dict[Any, Any]]:
+        """
+        Obtiene todos los datos de una entidad de Dynamics 365.
         
-        # OData devuelve los datos en el campo 'value'
-        if 'value' in response_data:
-            return response_data['value']
+        Recorre todas las páginas de la respuesta (ver iter_entity_pages).
         
-        return []
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            filter_expression: Expresión de filtro OData opcional (ej: "anio eq 2024")
+            page_size: Tamaño máximo de página solicitado al servidor
+            
+        Returns:
+            Lista de registros de la entidad
+        """
+        records: List[Dict[Any, Any]] = []
+        for page in self.iter_entity_pages(
+            entity_name,
+            access_token,
+            filter_expression=filter_expression,
+            metadata=metadata,
+            page_size=page_size
+        ):
+            records.extend(page)
+        return records
+
+    def _relative_url(self, url: str) -> str:
+        """
+        Convierte una URL absoluta de Dynamics (p.ej. @odata.nextLink) en path + query.
+        """
+        if not url.startswith("http"):
+            return url
+        parsed = urllib.parse.urlparse(url)
+        relative = parsed.path
+        if parsed.query:
+            relative = f"{relative}?{parsed.query}"
+        return relative
     
-    def create_entity_data(self, entity_name: str, access_token: str, data: Dict[Any, Any]) -> Dict[Any, Any]:
+    def build_create_request(self, entity_name: str, data: Dict[Any, Any]) -> Dict[str, Any]:
         """
-        Crea un nuevo registro en una entidad de Dynamics 365.
+        Construye la petición de creación de un registro (POST).
         
         Args:
             entity_name: Nombre de la entidad
-            access_token: Token de acceso
             data: Datos del nuevo registro
             
         Returns:
-            Datos del registro creado
+            Diccionario con method, url, data y el estado HTTP esperado
         """
-        conn = http.client.HTTPSConnection(self._base_url)
-        
-        payload = json.dumps(data)
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
-        
-        # Realizar petición POST
         # Añadir company=itb para asegurar el contexto de la empresa
-        url = f"/data/{entity_name}?company=itb"
-        conn.request("POST", url, payload, headers)
-        
-        response = conn.getresponse()
-        result_data = response.read().decode("utf-8")
-        
-        if response.status not in [200, 201]:
-            raise Exception(f"Error creando registro en {entity_name}: {result_data}")
-        
-        return json.loads(result_data)
+        return {
+            'method': 'POST',
+            'url': f"/data/{entity_name}?company=itb",
+            'data': data,
+            'success_status': (200, 201),
+            'error_prefix': f"Error creando registro en {entity_name}"
+        }
     
-    def update_entity_data(
+    def build_update_request(
         self,
         entity_name: str,
-        access_token: str,
         item_id: str,
         data: Dict[Any, Any],
         key_field: str = 'EQMHolidaysAbsencesGroupATISAId',
         data_area_id: str = 'itb',
         if_match: str = None
-    ) -> Dict[Any, Any]:
+    ) -> Dict[str, Any]:
         """
-        Actualiza un registro existente en una entidad de Dynamics 365.
+        Construye la petición de actualización de un registro (PATCH).
         
         Args:
             entity_name: Nombre de la entidad
-            access_token: Token de acceso
             item_id: ID del registro a actualizar
             data: Datos a actualizar
+            key_field: Campo clave de la entidad
+            data_area_id: Empresa (dataAreaId)
+            if_match: ETag para concurrencia optimista
             
         Returns:
-            Datos del registro actualizado
+            Diccionario con method, url, data y el estado HTTP esperado
         """
-        conn = http.client.HTTPSConnection(self._base_url)
-        
-        payload = json.dumps(data)
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
-        if if_match:
-            headers['If-Match'] = if_match
-        
         # Dynamics 365 requiere clave compuesta con dataAreaId para la mayoría de entidades
         # Pero para entidades globales (como ContributionAccountCodeCCs) no se usa
         quoted_id = urllib.parse.quote(item_id)
@@ -151,85 +222,34 @@ class DynamicsAPIAdapter:
         else:
             url = f"/data/{entity_name}(dataAreaId='{data_area_id}',{key_field}='{quoted_id}')?company={data_area_id}"
         
-        # Realizar petición PATCH
-        full_url = f"https://{self._base_url}{url}"
-        logger.info(f"🌐 API REQUEST [PATCH]: {full_url}")
-        conn.request("PATCH", url, payload, headers)
-        
-        response = conn.getresponse()
-        result_data = response.read().decode("utf-8")
-        
-        if response.status not in [200, 204]:
-            raise Exception(f"Error actualizando registro en {entity_name}: {result_data}")
-        
-        # Si la respuesta está vacía (status 204), devolver los datos enviados
-        if response.status == 204:
-            return data
-        
-        return json.loads(result_data) if result_data else data
-
-    def update_entity_data_by_url(
-        self,
-        entity_url: str,
-        access_token: str,
-        data: Dict[Any, Any],
-        if_match: str = None
-    ) -> Dict[Any, Any]:
-        """
-        Actualiza un registro usando la URL completa o el path OData.
-        """
-        conn = http.client.HTTPSConnection(self._base_url)
-        payload = json.dumps(data)
-
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
+        return {
+            'method': 'PATCH',
+            'url': url,
+            'data': data,
+            'if_match': if_match,
+            'success_status': (200, 204),
+            'error_prefix': f"Error actualizando registro en {entity_name}"
         }
-        if if_match:
-            headers['If-Match'] = if_match
-
-        url = entity_url
-        if entity_url.startswith("http"):
-            parsed = urllib.parse.urlparse(entity_url)
-            url = parsed.path
-            if parsed.query:
-                url = f"{url}?{parsed.query}"
-
-        full_url = f"https://{self._base_url}{url}"
-        logger.info(f"🌐 API REQUEST [PATCH]: {full_url}")
-        conn.request("PATCH", url, payload, headers)
-
-        response = conn.getresponse()
-        result_data = response.read().decode("utf-8")
-
-        if response.status not in [200, 204]:
-            raise Exception(f"Error actualizando registro: {result_data}")
-
-        if response.status == 204:
-            return data
-
-        return json.loads(result_data) if result_data else data
     
-    def delete_entity_data(self, entity_name: str, access_token: str, item_id: str, key_field: str = 'EQMHolidaysAbsencesGroupATISAId', data_area_id: str = 'itb') -> bool:
+    def build_delete_request(
+        self,
+        entity_name: str,
+        item_id: str,
+        key_field: str = 'EQMHolidaysAbsencesGroupATISAId',
+        data_area_id: str = 'itb'
+    ) -> Dict[str, Any]:
         """
-        Elimina un registro de una entidad de Dynamics 365.
+        Construye la petición de borrado de un registro (DELETE).
         
         Args:
             entity_name: Nombre de la entidad
-            access_token: Token de acceso
             item_id: ID del registro a eliminar
+            key_field: Campo clave de la entidad
+            data_area_id: Empresa (dataAreaId)
             
         Returns:
-            True si se eliminó correctamente
+            Diccionario con method, url y el estado HTTP esperado
         """
-        conn = http.client.HTTPSConnection(self._base_url)
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
-        
         # Dynamics 365 requiere clave compuesta con dataAreaId
         # Formato: /data/Entity(dataAreaId='itb',PrimaryKey='value')
         # Para ContributionAccountCodeCCs: usar solo EQMCCC
@@ -256,16 +276,268 @@ class DynamicsAPIAdapter:
             quoted_id = urllib.parse.quote(str(item_id))
             url = f"/data/{entity_name}(dataAreaId='{data_area_id}',{key_field}='{quoted_id}')?company={data_area_id}"
         
-        # Realizar petición DELETE
+        return {
+            'method': 'DELETE',
+            'url': url,
+            'data': None,
+            'success_status': (200, 204),
+            'error_prefix': f"Error eliminando registro de {entity_name}"
+        }
+    
+    def send_write_request(self, access_token: str, request: Dict[str, Any]) -> Optional[Dict[Any, Any]]:
+        """
+        Envía una petición de escritura construida con build_*_request.
+        
+        Args:
+            access_token: Token de acceso
+            request: Petición a enviar
+            
+        Returns:
+            Cuerpo JSON de la respuesta, o None si la respuesta está vacía
+            
+        Raises:
+            DynamicsAPIError: Si Dynamics responde con un estado no esperado
+        """
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json'
+        }
+        payload = ''
+        if request.get('data') is not None:
+            headers['Content-Type'] = 'application/json'
+            payload = json.dumps(request['data'])
+        if request.get('if_match'):
+            headers['If-Match'] = request['if_match']
+        
+        url = request['url']
         full_url = f"https://{self._base_url}{url}"
-        logger.info(f"🌐 API REQUEST [DELETE]: {full_url}")
-        conn.request("DELETE", url, '', headers)
+        logger.info(f"🌐 API REQUEST [{request['method']}]: {full_url}")
+        response = self._send(request['method'], url, payload, headers)
+        result_data = response.body
         
-        response = conn.getresponse()
-        result_data = response.read().decode("utf-8")
+        if response.status not in request['success_status']:
+            raise DynamicsAPIError(
+                f"{request['error_prefix']}: {result_data}",
+                status=response.status,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+            )
         
-        if response.status not in [200, 204]:
-            raise Exception(f"Error eliminando registro de {entity_name}: {result_data}")
+        # Si la respuesta está vacía (status 204) no hay cuerpo que devolver
+        if response.status == 204 or not result_data:
+            return None
         
-        return True
+        return json.loads(result_data)
+    
+    def execute_batch(
+        self,
+        access_token: str,
+        requests: List[Dict[str, Any]],
+        batch_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ejecuta peticiones de escritura agrupadas en peticiones OData $batch.
+        
+        Cada operación viaja en su propio changeset para que el fallo de una
+        no deshaga las demás (Prefer: odata.continue-on-error).
+        
+        Args:
+            access_token: Token de acceso
+            requests: Peticiones construidas con build_*_request
+            batch_size: Operaciones por petición $batch (por defecto settings.dynamics_batch_size)
+            
+        Returns:
+            Lista alineada con requests de diccionarios con 'status', 'result' y 'error'
+        """
+        batch_size = batch_size or settings.dynamics_batch_size or 100
+        results: List[Dict[str, Any]] = []
+        
+        for start in range(0, len(requests), batch_size):
+            chunk = requests[start:start + batch_size]
+            logger.info(
+                f"🌐 API REQUEST [POST $batch]: {len(chunk)} operaciones "
+                f"({start + 1}-{start + len(chunk)} de {len(requests)})"
+            )
+            results.extend(self._send_batch(access_token, chunk))
+        
+        return results
+    
+    def _send_batch(self, access_token: str, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Envía una única petición $batch y asocia cada respuesta a su operación.
+        """
+        batch_boundary = f"batch_{uuid.uuid4().hex}"
+        lines = []
+        
+        for content_id, request in enumerate(requests, 1):
+            changeset_boundary = f"changeset_{uuid.uuid4().hex}"
+            lines.extend([
+                f"--{batch_boundary}",
+                f"Content-Type: multipart/mixed; boundary={changeset_boundary}",
+                "",
+                f"--{changeset_boundary}",
+                "Content-Type: application/http",
+                "Content-Transfer-Encoding: binary",
+                f"Content-ID: {content_id}",
+                "",
+                f"{request['method']} https://{self._base_url}{request['url']} HTTP/1.1",
+                "Content-Type: application/json",
+                "Accept: application/json"
+            ])
+            if request.get('if_match'):
+                lines.append(f"If-Match: {request['if_match']}")
+            lines.append("")
+            lines.append(json.dumps(request['data']) if request.get('data') is not None else "")
+            lines.append(f"--{changeset_boundary}--")
+        lines.append(f"--{batch_boundary}--")
+        
+        payload = ("\r\n".join(lines) + "\r\n").encode("utf-8")
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': f'multipart/mixed; boundary={batch_boundary}',
+            'Accept': 'application/json',
+            'OData-Version': '4.0',
+            'Prefer': 'odata.continue-on-error'
+        }
+        
+        response = self._send("POST", "/data/$batch", payload, headers)
+        
+        if response.status != 200:
+            return [
+                {'status': response.status, 'result': None, 'error': f"{request['error_prefix']}: {response.body}"}
+                for request in requests
+            ]
+        
+        operation_responses = self._parse_batch_response(
+            response.headers.get('Content-Type', ''),
+            response.body
+        )
+        
+        results = []
+        for index, request in enumerate(requests):
+            if index >= len(operation_responses):
+                results.append({
+                    'status': None,
+                    'result': None,
+                    'error': f"{request['error_prefix']}: respuesta $batch sin resultado para la operación"
+                })
+                continue
+            
+            status, body = operation_responses[index]
+            if status in request['success_status']:
+                result = json.loads(body) if status != 204 and body.strip() else None
+                results.append({'status': status, 'result': result, 'error': None})
+            else:
+                results.append({'status': status, 'result': None, 'error': f"{request['error_prefix']}: {body}"})
+        
+        return results
+    
+    def _parse_batch_response(self, content_type: str, body: str) -> List[Tuple[int, str]]:
+        """
+        Extrae (estado, cuerpo) de cada operación de una respuesta multipart $batch.
+        
+        Cada parte de primer nivel corresponde a un changeset (o a su error).
+        """
+        message = email.message_from_string(f"Content-Type: {content_type}\r\n\r\n{body}")
+        if not message.is_multipart():
+            return []
+        
+        operation_responses = []
+        for part in message.get_payload():
+            http_parts = part.get_payload() if part.is_multipart() else [part]
+            if not http_parts:
+                continue
+            # Un changeset por operación: basta con la primera respuesta HTTP
+            http_text = http_parts[0].get_payload()
+            separator = re.search(r"\r?\n\r?\n", http_text)
+            head = http_text[:separator.start()] if separator else http_text
+            response_body = http_text[separator.end():] if separator else ''
+            status_line = head.splitlines()[0] if head else ''
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                status = None
+            operation_responses.append((status, response_body.strip()))
+        
+        return operation_responses
+    
+    def create_entity_data(self, entity_name: str, access_token: str, data: Dict[Any, Any]) -> Dict[Any, Any]:
+        """
+        Crea un nuevo registro en una entidad de Dynamics 365.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            data: Datos del nuevo registro
+            
+        Returns:
+            Datos del registro creado
+        """
+        request = self.build_create_request(entity_name, data)
+        return self.send_write_request(access_token, request)
+    
+    def update_entity_data(
+        self,
+        entity_name: str,
+        access_token: str,
+        item_id: str,
+        data: Dict[Any, Any],
+        key_field: str = 'EQMHolidaysAbsencesGroupATISAId',
+        data_area_id: str = 'itb',
+        if_match: str = None
+    ) -> Dict[Any, Any]:
+        """
+        Actualiza un registro existente en una entidad de Dynamics 365.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            item_id: ID del registro a actualizar
+            data: Datos a actualizar
+            
+        Returns:
+            Datos del registro actualizado
+        """
+        request = self.build_update_request(
+            entity_name, item_id, data,
+            key_field=key_field,
+            data_area_id=data_area_id,
+            if_match=if_match
+        )
+        # Si la respuesta está vacía (status 204), devolver los datos enviados
+        return self.send_write_request(access_token, request) or data
 
+    def update_entity_data_by_url(
+        self,
+        entity_url: str,
+        access_token: str,
+        data: Dict[Any, Any],
+        if_match: str = None
+    ) -> Dict[Any, Any]:
+        """
+        Actualiza un registro usando la URL completa o el path OData.
+        """
+        request = {
+            'method': 'PATCH',
+            'url': self._relative_url(entity_url),
+            'data': data,
+            'if_match': if_match,
+            'success_status': (200, 204),
+            'error_prefix': "Error actualizando registro"
+        }
+        return self.send_write_request(access_token, request) or data
+    
+    def delete_entity_data(self, entity_name: str, access_token: str, item_id: str, key_field: str = 'EQMHolidaysAbsencesGroupATISAId', data_area_id: str = 'itb') -> bool:
+        """
+        Elimina un registro de una entidad de Dynamics 365.
+        
+        Args:
+            entity_name: Nombre de la entidad
+            access_token: Token de acceso
+            item_id: ID del registro a eliminar
+            
+        Returns:
+            True si se eliminó correctamente
+        """
+        request = self.build_delete_request(entity_name, item_id, key_field=key_field, data_area_id=data_area_id)
+        self.send_write_request(access_token, request)
+        return True
@@ -0,0 +1,146 @@
+"""
+Ejecutor concurrente de escrituras contra Dynamics 365.
+Reparte las operaciones en un pool de hilos acotado y respeta los límites
+de peticiones del servicio (HTTP 429/503 con Retry-After).
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Hashable, Optional
+from config.settings import settings
+from infrastructure.dynamics_api_adapter import DynamicsAPIAdapter, DynamicsAPIError
+
+logger = logging.getLogger(__name__)
+
+# Estados HTTP que indican limitación temporal del servicio
+THROTTLED_STATUSES = (429, 503)
+
+
+class WriteThrottle:
+    """
+    Pausa compartida entre workers.
+
+    Cuando una llamada es limitada, todos los workers esperan hasta que
+    venza la pausa antes de enviar su siguiente petición.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self) -> None:
+        """Bloquea hasta que no haya pausa activa."""
+        while True:
+            with self._lock:
+                delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Extiende la pausa compartida al menos `seconds` segundos desde ahora."""
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+
+# Una única pausa por proceso: todas las escrituras van contra el mismo servicio
+_shared_throttle = WriteThrottle()
+
+
+class ConcurrentWriteExecutor:
+    """Ejecuta peticiones de escritura en paralelo con reintentos ante limitación."""
+
+    def __init__(
+        self,
+        dynamics_api: DynamicsAPIAdapter,
+        max_workers: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_seconds: Optional[float] = None,
+        backoff_max_seconds: Optional[float] = None,
+        throttle: Optional[WriteThrottle] = None
+    ):
+        self._dynamics_api = dynamics_api
+        self._max_workers = max(1, max_workers or settings.dynamics_write_concurrency)
+        self._max_retries = settings.dynamics_write_max_retries if max_retries is None else max_retries
+        self._backoff_seconds = backoff_seconds or settings.dynamics_retry_backoff_seconds
+        self._backoff_max_seconds = backoff_max_seconds or settings.dynamics_retry_backoff_max_seconds
+        self._throttle = throttle or _shared_throttle
+
+    def execute(
+        self,
+        access_token: str,
+        requests: List[Dict[str, Any]],
+        keys: Optional[List[Hashable]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ejecuta las peticiones y devuelve sus resultados en el mismo orden.
+
+        Las peticiones con la misma clave (p.ej. un borrado y una
+        actualización del mismo registro) se envían una tras otra en el
+        orden de la lista; solo las de claves distintas van en paralelo.
+
+        Args:
+            access_token: Token de acceso
+            requests: Peticiones construidas con DynamicsAPIAdapter.build_*_request
+            keys: Clave del registro de cada petición (None = independiente)
+
+        Returns:
+            Lista alineada con requests de diccionarios con 'result' y 'error'
+        """
+        if not requests:
+            return []
+
+        if self._max_workers == 1:
+            return [self._execute_one(access_token, request) for request in requests]
+
+        groups: Dict[Hashable, List[int]] = {}
+        for position, key in enumerate(keys if keys is not None else [None] * len(requests)):
+            groups.setdefault(('key', key) if key is not None else ('position', position), []).append(position)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+
+        def run_group(positions: List[int]) -> None:
+            for position in positions:
+                results[position] = self._execute_one(access_token, requests[position])
+
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="dynamics-write") as pool:
+            futures = [pool.submit(run_group, positions) for positions in groups.values()]
+            for future in futures:
+                future.result()
+        return results
+
+    def _execute_one(self, access_token: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Envía una petición reintentando mientras el servicio la limite."""
+        attempt = 0
+        while True:
+            self._throttle.wait()
+            try:
+                result = self._dynamics_api.send_write_request(access_token, request)
+                return {'result': result, 'error': None}
+            except DynamicsAPIError as e:
+                if e.status not in THROTTLED_STATUSES or attempt >= self._max_retries:
+                    return {'result': None, 'error': str(e)}
+                delay = self._retry_delay(attempt, e.retry_after)
+                logger.warning(
+                    f"   ⏳ Dynamics limitó la petición ({e.status}), reintento "
+                    f"{attempt + 1}/{self._max_retries} en {delay:.1f}s"
+                )
+                self._throttle.pause(delay)
+                attempt += 1
+            except Exception as e:
+                return {'result': None, 'error': str(e)}
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """
+        Calcula la espera antes del siguiente intento.
+
+        Respeta Retry-After si el servicio lo envía; si no, aplica backoff
+        exponencial con jitter para que los workers no reintenten a la vez.
+        """
+        jitter = random.uniform(0, self._backoff_seconds)
+        if retry_after is not None:
+            return retry_after + jitter
+        backoff = min(self._backoff_max_seconds, self._backoff_seconds * (2 ** attempt))
+        return backoff / 2 + random.uniform(0, backoff / 2) + jitter
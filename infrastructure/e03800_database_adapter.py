@@ -2,44 +2,78 @@
 Adaptador para la base de datos e03800.
 Implementa las operaciones necesarias para obtener datos de gruposervicios y archivos DBF.
 """
-import mysql.connector
 from mysql.connector import Error
-from typing import List, Dict, Any, Optional
-from config.settings import settings
+from typing import List, Dict, Any, Optional, Callable, Hashable, Iterable, Set, Tuple
+from domain.constants import GRUPOSERVICIOS_SERVICE_IDS
+from infrastructure.mysql_pool import get_mysql_pool
+from infrastructure.dbf_cache import get_dbf_cache
+from infrastructure.dbf_reader import count_dbf_records
+from infrastructure.trabajador_index import TrabajadorIndex
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Campos de contrcen.dbf usados por WorkerPlaces y ContributionAccountCodeCCs
+CONTRCEN_FIELDS = ['CODIGOP', 'CODIGODOM', 'VIA', 'CALLE', 'CPOSTAL', 'MUNICIPIO', 'PROVINCIA']
+# Campos de convvaca.dbf usados por VacationBalances
+CONVVACA_FIELDS = ['CODIGOP', 'DIAS', 'TIPO', 'AD_DIAS1', 'AD_MOD1', 'ID']
+
 
 class E03800DatabaseAdapter:
     """Adaptador para interactuar con la base de datos e03800 y archivos DBF."""
     
     def __init__(self):
-        self._host = settings.db_host
-        self._port = settings.db_port
-        self._user = settings.db_user
-        self._password = settings.db_password
         self._database = "e03800"  # Base de datos específica
         self._dbf_base_path = "/mnt/tierra_laboral_atinomi/"  # Ruta base para archivos DBF
         self._trabajadores_nif_column = None
+        self._run_cache = None
+    
+    def set_run_cache(self, run_cache) -> None:
+        """
+        Asocia el memo de la ejecución en curso (p.ej. application.sync_context.SyncContext).
+        
+        Con memo, los datos de e03800 y DBF se obtienen una sola vez por
+        ejecución aunque varias entidades los pidan.
+        
+        Args:
+            run_cache: Objeto con memoize(key, loader), o None para desactivarlo
+        """
+        self._run_cache = run_cache
+    
+    def _memo(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Obtiene un dato a través del memo de la ejecución, si lo hay."""
+        if self._run_cache is None:
+            return loader()
+        return self._run_cache.memoize(('e03800',) + key, loader)
     
     def _get_connection(self):
-        """Obtiene una conexión a la base de datos e03800."""
+        """Obtiene una conexión a la base de datos e03800 del pool compartido."""
         try:
-            connection = mysql.connector.connect(
-                host=self._host,
-                port=self._port,
-                user=self._user,
-                password=self._password,
-                database=self._database,
-                autocommit=False
-            )
-            return connection
+            return get_mysql_pool(self._database).get_connection()
         except Error as e:
             logger.error(f"Error conectando a MySQL e03800: {e}")
             raise
 
+    def _resolve_dbf_path(self, *names: str) -> Path:
+        """
+        Localiza un archivo DBF en la ruta base probando variantes del nombre.
+        
+        Args:
+            names: Nombres candidatos en orden de preferencia
+            
+        Returns:
+            Ruta del primer candidato existente
+            
+        Raises:
+            FileNotFoundError: Si no existe ninguno
+        """
+        for name in names:
+            path = Path(self._dbf_base_path) / name
+            if path.exists():
+                return path
+        raise FileNotFoundError(f"Archivo {names[0]} no encontrado en {self._dbf_base_path}")
+
     def _resolve_trabajadores_nif_column(self, connection) -> str:
         """
         Resuelve el nombre de columna de NIF/DNI en trabajadores.
@@ -73,17 +107,74 @@ class E03800DatabaseAdapter:
 
         return self._trabajadores_nif_column
     
+    def _get_codigos_empresas(self) -> Set[str]:
+        """
+        Obtiene los codiemp de la tabla empresas (filtro común de los extractores DBF).
+        
+        Returns:
+            Conjunto de codiemp sin espacios
+        """
+        return self._memo(('empresas_codiemp',), self._load_codigos_empresas)
+    
+    def _load_codigos_empresas(self) -> Set[str]:
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor(dictionary=True)
+            
+            # El campo correcto en empresas es 'codiemp'
+            query = "SELECT DISTINCT codiemp FROM empresas WHERE codiemp IS NOT NULL AND codiemp != ''"
+            cursor.execute(query)
+            return {str(row['codiemp']).strip() for row in cursor.fetchall() if row.get('codiemp')}
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
     def get_gruposervicios_by_service(self, id_servicios: int) -> List[Dict[str, Any]]:
         """
         Obtiene todos los registros de gruposervicios filtrando por id_servicios.
         Retorna lista con id y nombre.
         
+        Con memo de ejecución se cargan de una vez todos los servicios de
+        GRUPOSERVICIOS_SERVICE_IDS, de modo que una sincronización completa
+        consulta gruposervicios una sola vez.
+        
         Args:
             id_servicios: Identificador del servicio (p.ej., 30 vacaciones, 10 incidencias)
         
         Returns:
             Lista de diccionarios con 'id' y 'nombre'
         """
+        if self._run_cache is None:
+            service_ids = [id_servicios]
+        else:
+            service_ids = set(GRUPOSERVICIOS_SERVICE_IDS.values()) | {id_servicios}
+        gruposervicios = self.get_gruposervicios_by_services(service_ids)[id_servicios]
+        logger.info(f"Obtenidos {len(gruposervicios)} registros de gruposervicios (id_servicios={id_servicios})")
+        return gruposervicios
+    
+    def get_gruposervicios_by_services(self, service_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Obtiene los registros de gruposervicios de varios servicios en una sola consulta.
+        
+        Args:
+            service_ids: Identificadores de servicio
+        
+        Returns:
+            Diccionario id_servicios -> lista de {'id', 'nombre'} ordenada por id
+            (lista vacía para los servicios sin registros)
+        """
+        service_ids = tuple(sorted({int(service_id) for service_id in service_ids}))
+        return self._memo(
+            ('gruposervicios', service_ids),
+            lambda: self._load_gruposervicios_by_services(service_ids)
+        )
+    
+    def _load_gruposervicios_by_services(self, service_ids: tuple) -> Dict[int, List[Dict[str, Any]]]:
         connection = None
         cursor = None
         
@@ -91,26 +182,24 @@ class E03800DatabaseAdapter:
             connection = self._get_connection()
             cursor = connection.cursor(dictionary=True)
             
-            query = """
-                SELECT id, nombre
+            placeholders = ", ".join(["%s"] * len(service_ids))
+            query = f"""
+                SELECT id_servicios, id, nombre
                 FROM gruposervicios
-                WHERE id_servicios = %s
-                ORDER BY id
+                WHERE id_servicios IN ({placeholders})
+                ORDER BY id_servicios, id
             """
             
-            cursor.execute(query, (id_servicios,))
-            results = cursor.fetchall()
+            cursor.execute(query, service_ids)
             
-            # Convertir a formato estándar
-            gruposervicios = []
-            for row in results:
-                gruposervicios.append({
+            # Repartir por servicio en formato estándar
+            gruposervicios: Dict[int, List[Dict[str, Any]]] = {service_id: [] for service_id in service_ids}
+            for row in cursor.fetchall():
+                gruposervicios.setdefault(int(row['id_servicios']), []).append({
                     'id': str(row['id']),
                     'nombre': row['nombre']
                 })
             
-            logger.info(f"Obtenidos {len(gruposervicios)} registros de gruposervicios (id_servicios={id_servicios})")
-            
             return gruposervicios
             
         except Error as e:
@@ -239,27 +328,14 @@ class E03800DatabaseAdapter:
         Returns:
             Lista de diccionarios con 'id' (codigop+codigodom) y 'nombre' (description)
         """
-        try:
-            from dbfread import DBF
-        except ImportError:
-            logger.error("dbfread no está instalado. Instálalo con: pip install dbfread")
-            raise
-        
+        return self._memo(('worker_places',), self._load_worker_places)
+    
+    def _load_worker_places(self) -> List[Dict[str, Any]]:
         worker_places = []
         
         try:
             # 1. Obtener códigos de empresas
-            connection = self._get_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # El campo correcto en empresas es 'codiemp'
-            query = "SELECT DISTINCT codiemp FROM empresas WHERE codiemp IS NOT NULL AND codiemp != ''"
-            cursor.execute(query)
-            codigos_result = cursor.fetchall()
-            codigos_validos = {str(row['codiemp']).strip() for row in codigos_result if row.get('codiemp')}
-            
-            cursor.close()
-            connection.close()
+            codigos_validos = self._get_codigos_empresas()
             
             if not codigos_validos:
                 return []
@@ -267,44 +343,26 @@ class E03800DatabaseAdapter:
             logger.info(f"✓ Códigos de empresas válidos: {len(codigos_validos)}")
             
             # 2. Leer contrcen.dbf
-            dbf_path = Path(self._dbf_base_path) / "contrcen.dbf"
-            
-            # Buscar archivo con diferentes casos
-            if not dbf_path.exists():
-                candidates = []
-                for name in ["CONTRCEN.DBF", "Contrcen.dbf", "CONTRcen.dbf"]:
-                    p = Path(self._dbf_base_path) / name
-                    if p.exists():
-                        candidates.append(p)
-                        break
-                if not candidates:
-                    raise FileNotFoundError(f"Archivo contrcen.dbf no encontrado en {self._dbf_base_path}")
-                dbf_path = candidates[0]
+            dbf_path = self._resolve_dbf_path("contrcen.dbf", "CONTRCEN.DBF", "Contrcen.dbf", "CONTRcen.dbf")
             
             logger.info(f"✓ Leyendo DBF: {dbf_path}")
             
-            # 3. Leer DBF en modo lectura
-            # load=True: carga todos los registros en memoria para mayor velocidad
-            # char_decode_errors='ignore': ignora errores de codificación
-            table = DBF(str(dbf_path), load=True, char_decode_errors='ignore')
+            # 3. Leer DBF: solo los campos usados y solo los codigop de empresas
+            # (filtrados antes de decodificar; ver infrastructure/dbf_reader.py)
+            total_records = count_dbf_records(dbf_path)
+            table = get_dbf_cache().get_records(
+                dbf_path,
+                fields=CONTRCEN_FIELDS,
+                where={'CODIGOP': codigos_validos}
+            )
             
-            logger.info(f"✓ Total registros en DBF: {len(table)}")
+            logger.info(f"✓ Total registros en DBF: {total_records}")
             
-            # DEBUG: Verificar campos disponibles en el DBF
-            first_record = None
-            for rec in table:
-                first_record = rec
-                break
+            # DEBUG: Verificar el primer registro leído
+            first_record = table[0] if table else None
             
             if first_record:
-                available_fields = list(first_record.keys())
-                logger.info(f"🔍 DEBUG: Campos disponibles en DBF: {available_fields}")
-                
-                # Verificar algunos valores del primer registro
-                logger.info(f"🔍 DEBUG: Primer registro completo: {dict(first_record)}")
-            
-            # Reiniciar la iteración del DBF para procesar todos los registros
-            table = DBF(str(dbf_path), load=True, char_decode_errors='ignore')
+                logger.info(f"🔍 DEBUG: Primer registro (campos proyectados): {dict(first_record)}")
             
             # 4. Procesar registros
             sample_codigops = set()
@@ -354,7 +412,7 @@ class E03800DatabaseAdapter:
                     continue
             
             # Logs de debugging
-            logger.info(f"\n🔍 DEBUG: Primeros 20 codigop del DBF: {sorted(sample_codigops)}")
+            logger.info(f"\n🔍 DEBUG: Primeros 20 codigop leídos del DBF: {sorted(sample_codigops)}")
             logger.info(f"🔍 DEBUG: Todos los codiemp de empresas ({len(codigos_validos)}): {sorted(list(codigos_validos))}")
             logger.info(f"🔍 DEBUG: Coincidencias encontradas: {matching_count}")
             
@@ -367,7 +425,7 @@ class E03800DatabaseAdapter:
                 pass
             
             logger.info(f"✓ Obtenidos {len(worker_places)} registros de WorkerPlaces válidos")
-            logger.info(f"  Filtrados {len(table) - len(worker_places)} registros (codigop no está en empresas)")
+            logger.info(f"  Filtrados {total_records - len(worker_places)} registros (codigop no está en empresas)")
             
             return worker_places
             
@@ -435,28 +493,21 @@ class E03800DatabaseAdapter:
         Returns:
             Lista de diccionarios con 'id', 'nombre', 'eqmccc', 'eqmworkerplaceid'
         """
-        try:
-            from dbfread import DBF
-        except ImportError:
-            logger.error("dbfread no está instalado. Instálalo con: pip install dbfread")
-            raise
-        
+        return self._memo(('contribution_account_code_ccs',), self._load_contribution_account_code_ccs)
+    
+    def _load_contribution_account_code_ccs(self) -> List[Dict[str, Any]]:
         contribution_codes = []
         
         try:
-            # 1. Obtener todos los ccc de la tabla ccc
-            connection = self._get_connection()
-            cursor = connection.cursor(dictionary=True)
-            
-            # Obtener codiemp que están en empresas (mismo filtro que WorkerPlaces)
-            query = "SELECT DISTINCT codiemp FROM empresas WHERE codiemp IS NOT NULL AND codiemp != ''"
-            cursor.execute(query)
-            empresas_result = cursor.fetchall()
-            codigos_empresas = {str(row['codiemp']).strip() for row in empresas_result if row.get('codiemp')}
+            # 1. Obtener codiemp que están en empresas (mismo filtro que WorkerPlaces)
+            codigos_empresas = self._get_codigos_empresas()
             
             logger.info(f"✓ Códigos de empresas válidos: {len(codigos_empresas)}")
             
-            # Obtener todos los CCC con su CIF de empresa
+            # Obtener todos los CCC de la tabla ccc con su CIF de empresa
+            connection = self._get_connection()
+            cursor = connection.cursor(dictionary=True)
+            
             query = """
                 SELECT c.codiemp, c.ccc, e.cif 
                 FROM ccc c
@@ -485,26 +536,18 @@ class E03800DatabaseAdapter:
                 return []
             
             # 2. Leer contrcen.dbf
-            dbf_path = Path(self._dbf_base_path) / "contrcen.dbf"
-            
-            # Buscar archivo con diferentes casos
-            if not dbf_path.exists():
-                candidates = []
-                for name in ["CONTRCEN.DBF", "Contrcen.dbf", "CONTRcen.dbf"]:
-                    p = Path(self._dbf_base_path) / name
-                    if p.exists():
-                        candidates.append(p)
-                        break
-                if not candidates:
-                    raise FileNotFoundError(f"Archivo contrcen.dbf no encontrado en {self._dbf_base_path}")
-                dbf_path = candidates[0]
+            dbf_path = self._resolve_dbf_path("contrcen.dbf", "CONTRCEN.DBF", "Contrcen.dbf", "CONTRcen.dbf")
             
             logger.info(f"✓ Leyendo DBF: {dbf_path}")
             
-            # 3. Leer DBF
-            table = DBF(str(dbf_path), load=True, char_decode_errors='ignore')
+            # 3. Leer DBF (misma proyección y filtro que WorkerPlaces: se reutiliza la caché)
+            table = get_dbf_cache().get_records(
+                dbf_path,
+                fields=CONTRCEN_FIELDS,
+                where={'CODIGOP': codigos_empresas}
+            )
             
-            logger.info(f"✓ Total registros en DBF: {len(table)}")
+            logger.info(f"✓ Total registros en DBF: {count_dbf_records(dbf_path)} ({len(table)} de empresas válidas)")
             
             # 4. Procesar registros
             matching_count = 0
@@ -571,56 +614,36 @@ class E03800DatabaseAdapter:
         Returns:
             Lista de diccionarios con 'id' y 'nombre' (se usa el mismo valor que id)
         """
-        try:
-            from dbfread import DBF
-        except ImportError:
-            logger.error("dbfread no está instalado. Instálalo con: pip install dbfread")
-            raise
+        return self._memo(('vacation_balances',), self._load_vacation_balances)
 
-        connection = None
-        cursor = None
+    def _load_vacation_balances(self) -> List[Dict[str, Any]]:
         try:
             # 1. Obtener todas las empresas válidas de MySQL
-            connection = self._get_connection()
-            cursor = connection.cursor(dictionary=True)
-
-            cursor.execute("""
-                SELECT DISTINCT codiemp
-                FROM empresas
-                WHERE codiemp IS NOT NULL AND codiemp <> ''
-            """)
-            empresas = {str(r['codiemp']).strip() for r in cursor.fetchall() if r.get('codiemp')}
+            empresas = self._get_codigos_empresas()
 
             if not empresas:
                 logger.warning("No se encontraron empresas válidas en MySQL para filtrar VacationBalances")
                 return []
 
             # 2. Localizar el archivo DBF
-            dbf_path = Path(self._dbf_base_path) / "convvaca.dbf"
-            if not dbf_path.exists():
-                candidates = []
-                for name in ["CONVVACA.DBF", "Convvaca.dbf", "CONVvaca.dbf"]:
-                    p = Path(self._dbf_base_path) / name
-                    if p.exists():
-                        candidates.append(p)
-                        break
-                if not candidates:
-                    # Intentar con la versión en plural por si acaso
-                    for name in ["CONVVACAS.DBF", "Convvacas.dbf", "convvacas.dbf"]:
-                        p = Path(self._dbf_base_path) / name
-                        if p.exists():
-                            candidates.append(p)
-                            break
-                
-                if not candidates:
-                    raise FileNotFoundError(f"Archivo convvaca.dbf no encontrado en {self._dbf_base_path}")
-                dbf_path = candidates[0]
+            # Se prueba también la versión en plural por si acaso
+            dbf_path = self._resolve_dbf_path(
+                "convvaca.dbf", "CONVVACA.DBF", "Convvaca.dbf", "CONVvaca.dbf",
+                "CONVVACAS.DBF", "Convvacas.dbf", "convvacas.dbf"
+            )
 
             logger.info(f"✓ Leyendo VacationBalances desde DBF: {dbf_path}")
 
-            # 3. Leer el archivo DBF
-            table = DBF(str(dbf_path), load=True, char_decode_errors='ignore')
-            logger.info(f"✓ Total registros en DBF {dbf_path.name}: {len(table)}")
+            # 3. Leer el archivo DBF (solo campos usados y empresas válidas)
+            table = get_dbf_cache().get_records(
+                dbf_path,
+                fields=CONVVACA_FIELDS,
+                where={'CODIGOP': empresas}
+            )
+            logger.info(
+                f"✓ Total registros en DBF {dbf_path.name}: {count_dbf_records(dbf_path)} "
+                f"({len(table)} de empresas válidas)"
+            )
 
             results: List[Dict[str, Any]] = []
             for row in table:
@@ -655,11 +678,6 @@ class E03800DatabaseAdapter:
         except Exception as e:
             logger.error(f"Error obteniendo VacationBalances desde DBF: {e}")
             raise
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
     def _fetch_trabajador_records(
         self,
@@ -705,6 +723,86 @@ class E03800DatabaseAdapter:
             'all_records': records
         }
     
+    def _load_trabajadores_columns(self, connection, nif_column: str) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        Lee intercalación y tipo de las columnas de búsqueda de trabajadores.
+        
+        Returns:
+            Columna -> (COLLATION_NAME, DATA_TYPE); la columna de NIF se devuelve como 'nif'
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT COLUMN_NAME, COLLATION_NAME, DATA_TYPE
+                FROM information_schema.COLUMNS
+                WHERE table_schema = %s
+                  AND table_name = 'trabajadores'
+                  AND column_name IN ('codiemp', 'nombre', 'apellido1', 'apellido2', 'numeross', %s)
+                """,
+                (self._database, nif_column)
+            )
+            columns = {}
+            for column_name, collation, data_type in cursor.fetchall():
+                column_name = column_name.lower()
+                columns['nif' if column_name == nif_column else column_name] = (collation, data_type)
+            return columns
+        finally:
+            cursor.close()
+    
+    def load_trabajador_index(self, codiemps: Iterable[str]) -> TrabajadorIndex:
+        """
+        Carga de una vez los trabajadores de varias empresas en un índice en memoria.
+        
+        El índice responde a find_trabajador*, get_last_fechabaja* igual que
+        este adaptador, sin una consulta por búsqueda: compara con la
+        intercalación y el tipo reales de cada columna y confirma con una
+        consulta las búsquedas que no encuentra.
+        
+        Args:
+            codiemps: Códigos de empresa
+        
+        Returns:
+            TrabajadorIndex con los registros de esas empresas
+        """
+        codiemps = sorted({str(codiemp).strip() for codiemp in codiemps if codiemp})
+        if not codiemps:
+            return TrabajadorIndex([], fallback=self)
+        
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection()
+            nif_column = self._resolve_trabajadores_nif_column(connection)
+            columns = self._load_trabajadores_columns(connection, nif_column)
+            cursor = connection.cursor(dictionary=True)
+            placeholders = ", ".join(["%s"] * len(codiemps))
+            query = f"""
+                SELECT codiemp, nombre, apellido1, apellido2,
+                       coditraba, fechaalta, fechabaja, telefono, numeross, {nif_column} AS nif
+                FROM trabajadores
+                WHERE codiemp IN ({placeholders})
+                ORDER BY fechaalta DESC
+            """
+            cursor.execute(query, tuple(codiemps))
+            index = TrabajadorIndex(cursor.fetchall(), columns=columns, fallback=self)
+            collations = sorted({collation for collation, _ in columns.values() if collation})
+            logger.info(
+                f"Índice de trabajadores: {len(index)} registros de {len(codiemps)} empresas "
+                f"(intercalación {', '.join(collations) or 'desconocida'})"
+            )
+            return index
+            
+        except Error as e:
+            logger.error(f"Error cargando trabajadores: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
     def find_trabajador(self, codiemp: str, nombre: str, apellido1: str, apellido2: str) -> Optional[Dict[str, Any]]:
         """
         Busca un trabajador en la tabla trabajadores.
@@ -2,24 +2,24 @@
 Adaptador para operaciones de base de datos relacionadas con EmployeeModifications.
 Maneja operaciones en dfo_com_altas (interbus_365) y com_altas (e03800).
 """
-import mysql.connector
 from mysql.connector import Error
-from typing import Dict, Any, Optional
-from config.settings import settings
+from datetime import datetime
+from typing import Dict, Any, Iterable, Optional, Set, Tuple
+from infrastructure.mysql_pool import get_mysql_pool
+from infrastructure.com_altas_index import ComAltasStatusIndex, LastCreatedDateIndex
+from infrastructure.reference_catalog import get_reference_catalog
 import logging
-import unicodedata
 
 logger = logging.getLogger(__name__)
 
+# ETags por consulta IN al precargar los existentes en dfo_com_altas
+ETAG_QUERY_CHUNK_SIZE = 1000
+
 
 class EmployeeModificationsAdapter:
     """Adaptador para interactuar con las tablas relacionadas con EmployeeModifications."""
     
     def __init__(self):
-        self._host = settings.db_host
-        self._port = settings.db_port
-        self._user = settings.db_user
-        self._password = settings.db_password
         self._database_interbus = "interbus_365"
         self._database_e03800 = "e03800"
         self._database_acceso = "acceso"
@@ -27,14 +27,6 @@ class EmployeeModificationsAdapter:
         self._provincias_integracion_db = None
         self._puestos_tables = {"lista_puestos", "lista_subpuestos", "lista_categorias"}
 
-    def _normalize_lookup_text(self, value: str) -> str:
-        """
-        Normaliza texto para comparaciones tolerantes (sin acentos y en minúsculas).
-        """
-        normalized = unicodedata.normalize("NFKD", value)
-        stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-        return " ".join(stripped.lower().split())
-
     def _truncate_str(self, value: Any, max_len: int) -> Optional[str]:
         """
         Trunca strings para ajustarse a los limites de columnas.
@@ -47,49 +39,25 @@ class EmployeeModificationsAdapter:
         return value_str[:max_len]
     
     def _get_connection_interbus_365(self):
-        """Obtiene una conexión a la base de datos interbus_365."""
+        """Obtiene una conexión a la base de datos interbus_365 del pool compartido."""
         try:
-            connection = mysql.connector.connect(
-                host=self._host,
-                port=self._port,
-                user=self._user,
-                password=self._password,
-                database=self._database_interbus,
-                autocommit=False
-            )
-            return connection
+            return get_mysql_pool(self._database_interbus).get_connection()
         except Error as e:
             logger.error(f"Error conectando a MySQL interbus_365: {e}")
             raise
     
     def _get_connection_e03800(self):
-        """Obtiene una conexión a la base de datos e03800."""
+        """Obtiene una conexión a la base de datos e03800 del pool compartido."""
         try:
-            connection = mysql.connector.connect(
-                host=self._host,
-                port=self._port,
-                user=self._user,
-                password=self._password,
-                database=self._database_e03800,
-                autocommit=False
-            )
-            return connection
+            return get_mysql_pool(self._database_e03800).get_connection()
         except Error as e:
             logger.error(f"Error conectando a MySQL e03800: {e}")
             raise
 
     def _get_connection_acceso(self):
-        """Obtiene una conexión a la base de datos acceso."""
+        """Obtiene una conexión a la base de datos acceso del pool compartido."""
         try:
-            connection = mysql.connector.connect(
-                host=self._host,
-                port=self._port,
-                user=self._user,
-                password=self._password,
-                database=self._database_acceso,
-                autocommit=False
-            )
-            return connection
+            return get_mysql_pool(self._database_acceso).get_connection()
         except Error as e:
             logger.error(f"Error conectando a MySQL acceso: {e}")
             raise
@@ -131,6 +99,137 @@ class EmployeeModificationsAdapter:
             if connection:
                 connection.close()
     
+    def get_pending_etags(self, etags_encoded: Iterable[str]) -> Set[str]:
+        """
+        Devuelve cuáles de los ETags ya existen en dfo_com_altas sin procesar.
+        
+        Equivale a llamar a etag_exists por cada ETag, pero con una consulta
+        IN por bloques y una sola conexión.
+        
+        Args:
+            etags_encoded: ETags codificados en base64
+            
+        Returns:
+            Conjunto de ETags existentes con procesado = 0
+        """
+        etags = list(dict.fromkeys(etag for etag in etags_encoded if etag))
+        if not etags:
+            return set()
+        
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection_interbus_365()
+            cursor = connection.cursor()
+            
+            existing: Set[str] = set()
+            for start in range(0, len(etags), ETAG_QUERY_CHUNK_SIZE):
+                chunk = etags[start:start + ETAG_QUERY_CHUNK_SIZE]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"""
+                    SELECT etag
+                    FROM dfo_com_altas
+                    WHERE etag IN ({placeholders})
+                      AND procesado = 0
+                    """,
+                    chunk
+                )
+                existing.update(row[0] for row in cursor.fetchall())
+            
+            return existing
+            
+        except Error as e:
+            logger.error(f"Error verificando ETags: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
+    def get_sync_watermarks(self) -> Tuple[Dict[str, datetime], Optional[datetime]]:
+        """
+        Obtiene las marcas de agua de EmployeeModifications por empresa.
+        
+        Returns:
+            Tupla (CompanyIdATISA -> fecha UTC más reciente procesada,
+            fecha UTC de la última sincronización completa o None)
+        """
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection_interbus_365()
+            cursor = connection.cursor()
+            
+            cursor.execute(
+                """
+                SELECT company_id, high_water_mark, last_full_sync
+                FROM employee_modifications_watermarks
+                """
+            )
+            watermarks: Dict[str, datetime] = {}
+            last_full_sync = None
+            for company_id, high_water_mark, full_sync in cursor.fetchall():
+                watermarks[company_id] = high_water_mark
+                if full_sync and (last_full_sync is None or full_sync > last_full_sync):
+                    last_full_sync = full_sync
+            
+            return watermarks, last_full_sync
+            
+        except Error as e:
+            logger.error(f"Error obteniendo marcas de agua de EmployeeModifications: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
+    def save_sync_watermarks(self, watermarks: Dict[str, datetime], full_sync: bool = False) -> None:
+        """
+        Guarda las marcas de agua por empresa (nunca retroceden).
+        
+        Args:
+            watermarks: CompanyIdATISA -> fecha UTC más reciente procesada
+            full_sync: Si la ejecución descargó la entidad completa
+        """
+        if not watermarks:
+            return
+        
+        connection = None
+        cursor = None
+        
+        try:
+            connection = self._get_connection_interbus_365()
+            cursor = connection.cursor()
+            
+            full_sync_at = datetime.utcnow().replace(microsecond=0) if full_sync else None
+            cursor.executemany(
+                """
+                INSERT INTO employee_modifications_watermarks (company_id, high_water_mark, last_full_sync)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    high_water_mark = GREATEST(high_water_mark, VALUES(high_water_mark)),
+                    last_full_sync = COALESCE(VALUES(last_full_sync), last_full_sync)
+                """,
+                [(company_id, mark, full_sync_at) for company_id, mark in watermarks.items()]
+            )
+            connection.commit()
+            
+        except Error as e:
+            if connection:
+                connection.rollback()
+            logger.error(f"Error guardando marcas de agua de EmployeeModifications: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
     def get_last_created_date_by_type(
         self, 
         codiemp: str, 
@@ -195,6 +294,55 @@ class EmployeeModificationsAdapter:
             if connection:
                 connection.close()
     
+    def load_last_created_dates(self, codiemps: Iterable[str]) -> LastCreatedDateIndex:
+        """
+        Carga de una vez el último created_date por trabajador, tipo y coditraba de varias empresas.
+        
+        Sustituye a una llamada a get_last_created_date_by_type por registro:
+        el índice devuelto responde igual.
+        
+        Args:
+            codiemps: Códigos de empresa
+            
+        Returns:
+            LastCreatedDateIndex con las fechas de esas empresas
+        """
+        codiemps = sorted({str(codiemp).strip() for codiemp in codiemps if codiemp})
+        if not codiemps:
+            return LastCreatedDateIndex([])
+        
+        connection = None
+        cursor = None
+        
+        try:
+            # Usar conexión a interbus_365 (mismo servidor, puede hacer JOIN cruzado)
+            connection = self._get_connection_interbus_365()
+            cursor = connection.cursor(dictionary=True)
+            placeholders = ", ".join(["%s"] * len(codiemps))
+            cursor.execute(
+                f"""
+                SELECT ca.codiemp, ca.nombre, ca.apellido1, ca.apellido2, ca.tipo, ca.coditraba,
+                       MAX(dfo.created_date) AS last_date
+                FROM interbus_365.dfo_com_altas dfo
+                JOIN e03800.com_altas ca ON dfo.id = ca.id
+                WHERE ca.codiemp IN ({placeholders})
+                GROUP BY ca.codiemp, ca.nombre, ca.apellido1, ca.apellido2, ca.tipo, ca.coditraba
+                """,
+                tuple(codiemps)
+            )
+            index = LastCreatedDateIndex(cursor.fetchall())
+            logger.info(f"Índice de created_date: {len(index)} trabajadores y tipos de {len(codiemps)} empresas")
+            return index
+            
+        except Error as e:
+            logger.error(f"Error cargando últimos created_date: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+    
     def insert_com_altas(self, data: Dict[str, Any]) -> int:
         """
         Inserta un registro en com_altas (base e03800).
@@ -430,6 +578,48 @@ class EmployeeModificationsAdapter:
             if connection:
                 connection.close()
 
+    def load_com_altas_index(self, codiemps: Iterable[str]) -> ComAltasStatusIndex:
+        """
+        Carga de una vez el estado de com_altas de varias empresas en un índice en memoria.
+        
+        El índice responde a has_com_altas_record igual que este adaptador.
+        
+        Args:
+            codiemps: Códigos de empresa
+        
+        Returns:
+            ComAltasStatusIndex con las filas de esas empresas
+        """
+        codiemps = sorted({str(codiemp).strip() for codiemp in codiemps if codiemp})
+        if not codiemps:
+            return ComAltasStatusIndex([])
+        
+        connection = None
+        cursor = None
+        try:
+            connection = self._get_connection_e03800()
+            cursor = connection.cursor(dictionary=True)
+            placeholders = ", ".join(["%s"] * len(codiemps))
+            cursor.execute(
+                f"""
+                SELECT id, codiemp, naf, nif, tipo, estado
+                FROM com_altas
+                WHERE codiemp IN ({placeholders})
+                """,
+                tuple(codiemps)
+            )
+            index = ComAltasStatusIndex(cursor.fetchall())
+            logger.info(f"Índice de com_altas: {len(index)} registros de {len(codiemps)} empresas")
+            return index
+        except Error as e:
+            logger.error(f"Error cargando com_altas: {e}")
+            raise
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
     def has_com_altas_record(
         self,
         codiemp: Optional[str],
@@ -530,7 +720,7 @@ class EmployeeModificationsAdapter:
 
     def resolve_provincia_descripcion(self, provincia_value: Optional[Any]) -> Optional[str]:
         """
-        Resuelve provincia por ID usando provincias_integracion.
+        Resuelve provincia por ID usando provincias_integracion (catálogo en memoria).
         """
         if provincia_value is None:
             return None
@@ -546,34 +736,18 @@ class EmployeeModificationsAdapter:
         if not db_name:
             return value_str
 
-        connection = None
-        cursor = None
         try:
-            if db_name == self._database_e03800:
-                connection = self._get_connection_e03800()
-            else:
-                connection = self._get_connection_interbus_365()
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT descripcion FROM provincias_integracion WHERE id = %s LIMIT 1",
-                (int(value_str),)
-            )
-            row = cursor.fetchone()
-            if row:
-                return row[0]
+            descripcion = get_reference_catalog(db_name, 'provincias_integracion').descripcion_by_id(value_str)
+            if descripcion is not None:
+                return descripcion
         except Error as e:
             logger.warning(f"Error resolviendo provincia {value_str}: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
         return value_str
 
     def resolve_provincia_id(self, provincia_value: Optional[Any]) -> Optional[Any]:
         """
-        Resuelve provincia por descripción usando provincias_integracion.
+        Resuelve provincia por descripción usando provincias_integracion (catálogo en memoria).
         """
         if provincia_value is None:
             return None
@@ -589,44 +763,18 @@ class EmployeeModificationsAdapter:
         if not db_name:
             return value_str
 
-        connection = None
-        cursor = None
         try:
-            if db_name == self._database_e03800:
-                connection = self._get_connection_e03800()
-            else:
-                connection = self._get_connection_interbus_365()
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT id FROM provincias_integracion WHERE LOWER(descripcion) = LOWER(%s) LIMIT 1",
-                (value_str,)
-            )
-            row = cursor.fetchone()
-            if row:
-                return row[0]
-            cursor.execute(
-                "SELECT id, descripcion FROM provincias_integracion"
-            )
-            rows = cursor.fetchall() or []
-            target = self._normalize_lookup_text(value_str)
-            for prov_id, descripcion in rows:
-                if not descripcion:
-                    continue
-                if self._normalize_lookup_text(str(descripcion)) == target:
-                    return prov_id
+            prov_id = get_reference_catalog(db_name, 'provincias_integracion').id_by_descripcion(value_str)
+            if prov_id is not None:
+                return prov_id
         except Error as e:
             logger.warning(f"Error resolviendo provincia (id) {value_str}: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
         return value_str
 
     def resolve_nacionalidad_codigo(self, nacionalidad_value: Optional[Any]) -> Optional[Any]:
         """
-        Resuelve nacionalidad usando acceso.paises (pais -> codpais).
+        Resuelve nacionalidad usando acceso.paises (cca3 -> codpais, catálogo en memoria).
         """
         if nacionalidad_value is None:
             return None
@@ -635,31 +783,18 @@ class EmployeeModificationsAdapter:
         if not value_str:
             return None
 
-        connection = None
-        cursor = None
         try:
-            connection = self._get_connection_acceso()
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT codpais FROM paises WHERE cca3 = %s LIMIT 1",
-                (value_str,)
-            )
-            row = cursor.fetchone()
-            if row:
-                return row[0]
+            codpais = get_reference_catalog(self._database_acceso, 'paises').codpais_by_cca3(value_str)
+            if codpais is not None:
+                return codpais
         except Error as e:
             logger.warning(f"Error resolviendo nacionalidad {value_str}: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
         return value_str
 
     def resolve_nacionalidad_cca3(self, nacionalidad_value: Optional[Any]) -> Optional[Any]:
         """
-        Resuelve nacionalidad usando acceso.paises (codpais -> cca3).
+        Resuelve nacionalidad usando acceso.paises (codpais -> cca3, catálogo en memoria).
         """
         if nacionalidad_value is None:
             return None
@@ -671,25 +806,12 @@ class EmployeeModificationsAdapter:
         if not value_str.isdigit():
             return value_str
 
-        connection = None
-        cursor = None
         try:
-            connection = self._get_connection_acceso()
-            cursor = connection.cursor()
-            cursor.execute(
-                "SELECT cca3 FROM paises WHERE codpais = %s LIMIT 1",
-                (value_str,)
-            )
-            row = cursor.fetchone()
-            if row:
-                return row[0]
+            cca3 = get_reference_catalog(self._database_acceso, 'paises').cca3_by_codpais(value_str)
+            if cca3 is not None:
+                return cca3
         except Error as e:
             logger.warning(f"Error resolviendo nacionalidad (cca3) {value_str}: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
         return value_str
 
@@ -700,7 +822,7 @@ class EmployeeModificationsAdapter:
         table_name: str
     ) -> Optional[Dict[str, Any]]:
         """
-        Busca en lista_puestos/lista_subpuestos por codiemp y concepto LIKE.
+        Busca en lista_puestos/lista_subpuestos por codiemp y concepto contenido (catálogo en memoria).
         """
         if table_name not in self._puestos_tables:
             raise ValueError(f"Tabla no soportada: {table_name}")
@@ -712,30 +834,10 @@ class EmployeeModificationsAdapter:
         if not value_str:
             return None
 
-        connection = None
-        cursor = None
         try:
-            connection = self._get_connection_e03800()
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(
-                f"""
-                SELECT codpuesto, concepto
-                FROM {table_name}
-                WHERE codiemp = %s
-                  AND concepto LIKE %s
-                ORDER BY codpuesto
-                LIMIT 1
-                """,
-                (codiemp, f"%{value_str}%")
-            )
-            return cursor.fetchone()
+            return get_reference_catalog(self._database_e03800, table_name).find_by_concepto(codiemp, value_str)
         except Error as e:
             logger.warning(f"Error buscando {table_name} para {codiemp}: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
         return None
 
@@ -772,31 +874,10 @@ class EmployeeModificationsAdapter:
         if not codpuesto_str:
             return None
 
-        connection = None
-        cursor = None
         try:
-            connection = self._get_connection_e03800()
-            cursor = connection.cursor()
-            cursor.execute(
-                f"""
-                SELECT concepto
-                FROM {table_name}
-                WHERE codiemp = %s
-                  AND codpuesto = %s
-                LIMIT 1
-                """,
-                (codiemp, codpuesto_str)
-            )
-            row = cursor.fetchone()
-            if row:
-                return row[0]
+            return get_reference_catalog(self._database_e03800, table_name).concepto_by_codpuesto(codiemp, codpuesto_str)
         except Error as e:
             logger.warning(f"Error resolviendo concepto {table_name} {codiemp}: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if connection:
-                connection.close()
 
         return None
 
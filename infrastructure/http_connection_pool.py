@@ -0,0 +1,227 @@
+"""
+Pool de conexiones HTTPS persistentes (keep-alive) compartido por los adaptadores HTTP.
+Evita un handshake TCP+TLS por petición contra Dynamics 365 y Azure AD.
+"""
+import http.client
+import logging
+import select
+import threading
+import time
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Errores que indican que una conexión reutilizada fue cerrada por el servidor
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    http.client.CannotSendRequest,
+    http.client.ResponseNotReady,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+# Errores al enviar la petición que garantizan que el servidor no la procesó
+_UNSENT_REQUEST_ERRORS = (
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+)
+
+# Métodos que pueden repetirse sin riesgo si la conexión se cae tras enviarlos
+_IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+
+class PooledResponse(NamedTuple):
+    """Respuesta HTTP ya leída por completo."""
+    status: int
+    reason: str
+    headers: http.client.HTTPMessage
+    body: str
+
+
+class HTTPSConnectionPool:
+    """
+    Pool thread-safe de conexiones HTTPS agrupadas por host.
+
+    Reutiliza conexiones keep-alive, reconecta si el socket reutilizado está
+    caducado y limita el número de conexiones inactivas por host. Las
+    conexiones inactivas más tiempo que `keepalive_seconds` (por debajo del
+    timeout de inactividad del servidor) o cuyo socket ya ha recibido el
+    cierre del servidor se descartan antes de reutilizarlas.
+    """
+
+    def __init__(self, max_size: int = 10, timeout: Optional[float] = None, keepalive_seconds: float = 30):
+        self._max_size = max_size
+        self._timeout = timeout
+        self._keepalive_seconds = keepalive_seconds
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[Tuple[http.client.HTTPSConnection, float]]] = {}
+        self._hits = 0
+        self._misses = 0
+        self._reconnects = 0
+        self._discarded = 0
+        self._expired = 0
+
+    @staticmethod
+    def _is_closed_by_server(conn: http.client.HTTPSConnection) -> bool:
+        """
+        Comprueba sin bloquear si el servidor ha cerrado una conexión inactiva.
+
+        Un socket keep-alive inactivo no debe tener nada que leer: si select lo
+        marca como legible es que ha llegado el EOF (o datos inesperados) y la
+        conexión no puede reutilizarse.
+        """
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _acquire(self, host: str) -> Tuple[http.client.HTTPSConnection, bool]:
+        """Obtiene una conexión inactiva y viva del host o crea una nueva."""
+        while True:
+            with self._lock:
+                idle = self._idle.get(host)
+                if not idle:
+                    self._misses += 1
+                    break
+                conn, released_at = idle.pop()
+            if time.monotonic() - released_at > self._keepalive_seconds or self._is_closed_by_server(conn):
+                conn.close()
+                with self._lock:
+                    self._expired += 1
+                continue
+            with self._lock:
+                self._hits += 1
+            return conn, True
+        return http.client.HTTPSConnection(host, timeout=self._timeout), False
+
+    def _release(self, host: str, conn: http.client.HTTPSConnection) -> None:
+        """Devuelve una conexión al pool o la cierra si el pool está lleno."""
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if len(idle) < self._max_size:
+                idle.append((conn, time.monotonic()))
+                return
+            self._discarded += 1
+        conn.close()
+
+    def request(
+        self,
+        host: str,
+        method: str,
+        url: str,
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> PooledResponse:
+        """
+        Realiza una petición reutilizando una conexión del pool.
+
+        Si la conexión reutilizada resulta estar cerrada por el servidor se
+        descarta y la petición se repite sobre una conexión nueva, pero solo
+        si es idempotente o si falló antes de terminar de enviarse: un POST
+        o PATCH cuya respuesta se pierde puede haberse aplicado ya en el
+        servidor y repetirlo duplicaría el registro, así que el error llega
+        al llamante.
+
+        Args:
+            host: Host de destino
+            method: Verbo HTTP
+            url: Path + query de la petición
+            body: Cuerpo de la petición
+            headers: Cabeceras HTTP
+
+        Returns:
+            PooledResponse con estado, cabeceras y cuerpo decodificado
+        """
+        headers = headers or {}
+        conn, reused = self._acquire(host)
+
+        retry_after_send = method.upper() in _IDEMPOTENT_METHODS
+
+        while True:
+            sent = False
+            try:
+                conn.request(method, url, body, headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except _STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                unsent = not sent and isinstance(e, _UNSENT_REQUEST_ERRORS)
+                if not reused or not (retry_after_send or unsent):
+                    raise
+                logger.debug(f"Conexión keep-alive caducada con {host} ({e}), reconectando")
+                with self._lock:
+                    self._reconnects += 1
+                conn, reused = http.client.HTTPSConnection(host, timeout=self._timeout), False
+                continue
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(host, conn)
+
+        return PooledResponse(
+            status=response.status,
+            reason=response.reason,
+            headers=response.msg,
+            body=data.decode("utf-8")
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Devuelve los contadores del pool.
+
+        Returns:
+            Diccionario con hits, misses, reconnects, discarded, expired e idle
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'reconnects': self._reconnects,
+                'discarded': self._discarded,
+                'expired': self._expired,
+                'idle': sum(len(conns) for conns in self._idle.values())
+            }
+
+    def close_all(self) -> None:
+        """Cierra todas las conexiones inactivas del pool."""
+        with self._lock:
+            connections = [conn for conns in self._idle.values() for conn, _ in conns]
+            self._idle.clear()
+        for conn in connections:
+            conn.close()
+
+
+_shared_pool: Optional[HTTPSConnectionPool] = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_https_pool() -> HTTPSConnectionPool:
+    """
+    Devuelve el pool HTTPS compartido por todo el proceso.
+
+    Returns:
+        Instancia única de HTTPSConnectionPool
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = HTTPSConnectionPool(
+                max_size=settings.http_pool_max_size,
+                timeout=settings.http_timeout_seconds or None,
+                keepalive_seconds=settings.http_keepalive_seconds
+            )
+        return _shared_pool
@@ -0,0 +1,276 @@
+"""
+Registro de pools de conexiones MySQL compartido por todos los adaptadores.
+Un pool por esquema (interbus_365, e03800, acceso) y opciones de conexión,
+con límite de tamaño y desbordamiento, comprobación de salud al prestar
+la conexión y métricas de espera.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+import mysql.connector
+from mysql.connector import Error
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PooledMySQLConnection:
+    """
+    Conexión prestada por un MySQLConnectionPool.
+
+    Delega todo en la conexión real salvo close(), que la devuelve al pool
+    en lugar de cerrarla; así los adaptadores mantienen su patrón
+    try/finally connection.close().
+    """
+
+    def __init__(self, pool: "MySQLConnectionPool", connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name: str) -> Any:
+        if self._connection is None:
+            raise Error("La conexión ya fue devuelta al pool")
+        return getattr(self._connection, name)
+
+    def close(self) -> None:
+        """Devuelve la conexión al pool (llamadas repetidas no tienen efecto)."""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool._release(connection)
+
+
+class MySQLConnectionPool:
+    """
+    Pool thread-safe de conexiones MySQL a un esquema.
+
+    Mantiene hasta `size` conexiones inactivas y permite `max_overflow`
+    conexiones adicionales bajo carga, que se cierran al devolverse. Si se
+    alcanza el límite, la petición espera hasta `timeout` segundos.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        size: int = 5,
+        max_overflow: int = 5,
+        timeout: float = 30,
+        ping_after_seconds: float = 30,
+        **connect_options: Any
+    ):
+        self._database = database
+        self._size = max(1, size)
+        self._max_overflow = max(0, max_overflow)
+        self._timeout = timeout
+        self._ping_after_seconds = ping_after_seconds
+        self._connect_options = {'autocommit': False, **connect_options}
+        self._condition = threading.Condition()
+        # Conexiones inactivas con el instante en que se devolvieron
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'reused': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def get_connection(self) -> PooledMySQLConnection:
+        """
+        Presta una conexión del pool.
+
+        Returns:
+            PooledMySQLConnection; close() la devuelve al pool
+
+        Raises:
+            Error: Si no hay conexión disponible tras `timeout` segundos o falla la conexión
+        """
+        started = time.monotonic()
+        connection = None
+        reserved = False
+
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._open < self._size + self._max_overflow:
+                    self._open += 1
+                    reserved = True
+                    break
+                remaining = self._timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise Error(f"Tiempo de espera agotado obteniendo conexión MySQL a {self._database}")
+                self._condition.wait(remaining)
+
+            waited = time.monotonic() - started
+            self._stats['checkouts'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+        if connection is not None and not self._is_healthy(connection, released_at):
+            with self._condition:
+                self._stats['health_check_failures'] += 1
+            self._close_quietly(connection)
+            connection = None
+            reserved = True
+
+        if connection is None:
+            try:
+                connection = self._connect()
+            except Exception:
+                if reserved:
+                    self._discard_slot()
+                raise
+        else:
+            with self._condition:
+                self._stats['reused'] += 1
+
+        return PooledMySQLConnection(self, connection)
+
+    def _connect(self):
+        """Abre una conexión nueva al esquema del pool."""
+        try:
+            connection = mysql.connector.connect(
+                host=settings.db_host,
+                port=settings.db_port,
+                user=settings.db_user,
+                password=settings.db_password,
+                database=self._database,
+                **self._connect_options
+            )
+        except Error as e:
+            logger.error(f"Error conectando a MySQL {self._database}: {e}")
+            raise
+        with self._condition:
+            self._stats['created'] += 1
+        return connection
+
+    def _is_healthy(self, connection, released_at: float) -> bool:
+        """Comprueba con un ping las conexiones que llevan tiempo inactivas."""
+        if time.monotonic() - released_at < self._ping_after_seconds:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception as e:
+            logger.debug(f"Conexión MySQL inactiva a {self._database} descartada: {e}")
+            return False
+
+    def _release(self, connection) -> None:
+        """Deshace la transacción pendiente y devuelve la conexión al pool."""
+        try:
+            if not self._connect_options.get('autocommit'):
+                connection.rollback()
+        except Exception:
+            self._close_quietly(connection)
+            self._discard_slot()
+            return
+
+        with self._condition:
+            if len(self._idle) < self._size:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+                return
+        # Conexión de desbordamiento: se cierra
+        self._close_quietly(connection)
+        self._discard_slot()
+
+    def _discard_slot(self) -> None:
+        """Libera el hueco de una conexión cerrada."""
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_quietly(connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve las métricas del pool.
+
+        Returns:
+            Diccionario con préstamos, conexiones creadas y reutilizadas,
+            fallos de salud, esperas agotadas y tiempos de espera
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+        return stats
+
+    def close_all(self) -> None:
+        """Cierra todas las conexiones inactivas del pool."""
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+
+_pools: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], MySQLConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_mysql_pool(database: str, **connect_options: Any) -> MySQLConnectionPool:
+    """
+    Devuelve el pool compartido del esquema y opciones indicados.
+
+    Las conexiones con opciones de sesión distintas (p.ej. autocommit o
+    time_zone) van en pools separados para no mezclar estado de sesión.
+
+    Args:
+        database: Esquema MySQL (interbus_365, e03800, acceso...)
+        **connect_options: Opciones adicionales de mysql.connector.connect
+
+    Returns:
+        Instancia única de MySQLConnectionPool para esa combinación
+    """
+    key = (database, tuple(sorted(connect_options.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = MySQLConnectionPool(
+                database,
+                size=settings.mysql_pool_size,
+                max_overflow=settings.mysql_pool_max_overflow,
+                timeout=settings.mysql_pool_timeout_seconds,
+                ping_after_seconds=settings.mysql_pool_ping_after_seconds,
+                **connect_options
+            )
+            _pools[key] = pool
+        return pool
+
+
+def get_mysql_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Devuelve las métricas de todos los pools creados en el proceso.
+
+    Returns:
+        Diccionario esquema -> métricas (sumadas si hay varios pools por esquema)
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for (database, _), pool in pools:
+        pool_stats = pool.get_stats()
+        current = stats.setdefault(database, {})
+        for name, value in pool_stats.items():
+            if name == 'wait_seconds_max':
+                current[name] = max(current.get(name, 0.0), value)
+            else:
+                current[name] = current.get(name, 0) + value
+    return stats
+
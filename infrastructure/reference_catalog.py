@@ -0,0 +1,408 @@
+"""
+Catálogos de referencia (provincias, países y puestos) cacheados en memoria.
+Cada tabla se carga una vez por proceso con sus claves ya normalizadas y se
+recarga al vencer su TTL o cuando CHECKSUM TABLE indica que ha cambiado.
+"""
+import logging
+import threading
+import time
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from mysql.connector import Error
+from config.settings import settings
+from infrastructure.mysql_pool import get_mysql_pool
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_lookup_text(value: str) -> str:
+    """
+    Normaliza texto para comparaciones tolerantes (sin acentos y en minúsculas).
+    """
+    normalized = unicodedata.normalize("NFKD", value)
+    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return " ".join(stripped.lower().split())
+
+
+def _code_key(value: Any) -> Optional[str]:
+    """Clave de un código: texto normalizado y, si es numérico, sin ceros a la izquierda (como compara MySQL)."""
+    if value is None:
+        return None
+    text = normalize_lookup_text(str(value))
+    if not text:
+        return None
+    if text.isdigit():
+        return str(int(text))
+    return text
+
+
+class ProvinciaCatalog:
+    """provincias_integracion indexada por id y por descripción."""
+
+    def __init__(self, rows: Iterable[Tuple[Any, Any]]):
+        self._descripcion_by_id: Dict[str, Any] = {}
+        self._id_by_lower: Dict[str, Any] = {}
+        self._id_by_normalized: Dict[str, Any] = {}
+        for prov_id, descripcion in rows:
+            id_key = _code_key(prov_id)
+            if id_key is not None:
+                self._descripcion_by_id.setdefault(id_key, descripcion)
+            if not descripcion:
+                continue
+            self._id_by_lower.setdefault(str(descripcion).lower(), prov_id)
+            self._id_by_normalized.setdefault(normalize_lookup_text(str(descripcion)), prov_id)
+
+    def __len__(self) -> int:
+        return len(self._descripcion_by_id)
+
+    def descripcion_by_id(self, prov_id: Any) -> Optional[Any]:
+        return self._descripcion_by_id.get(_code_key(prov_id))
+
+    def id_by_descripcion(self, descripcion: str) -> Optional[Any]:
+        """Coincidencia exacta sin mayúsculas y, si no la hay, sin acentos ni espacios repetidos."""
+        prov_id = self._id_by_lower.get(descripcion.lower())
+        if prov_id is not None:
+            return prov_id
+        return self._id_by_normalized.get(normalize_lookup_text(descripcion))
+
+
+class PaisCatalog:
+    """acceso.paises indexada por codpais y por cca3."""
+
+    def __init__(self, rows: Iterable[Tuple[Any, Any]]):
+        self._cca3_by_codpais: Dict[str, Any] = {}
+        self._codpais_by_cca3: Dict[str, Any] = {}
+        for codpais, cca3 in rows:
+            codpais_key = _code_key(codpais)
+            cca3_key = _code_key(cca3)
+            if codpais_key is not None and cca3 is not None:
+                self._cca3_by_codpais.setdefault(codpais_key, cca3)
+            if cca3_key is not None and codpais is not None:
+                self._codpais_by_cca3.setdefault(cca3_key, codpais)
+
+    def __len__(self) -> int:
+        return len(self._cca3_by_codpais)
+
+    def codpais_by_cca3(self, cca3: str) -> Optional[Any]:
+        return self._codpais_by_cca3.get(_code_key(cca3))
+
+    def cca3_by_codpais(self, codpais: str) -> Optional[Any]:
+        return self._cca3_by_codpais.get(_code_key(codpais))
+
+
+# Longitud de los n-gramas del índice de subcadenas de PuestoCatalog
+PUESTO_NGRAM_SIZE = 3
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + PUESTO_NGRAM_SIZE] for i in range(len(text) - PUESTO_NGRAM_SIZE + 1)}
+
+
+class _CompanyPuestos:
+    """
+    Puestos de una empresa en orden de codpuesto con un índice de trigramas.
+
+    Cada trigrama apunta a las posiciones (ascendentes) de los conceptos que
+    lo contienen; una búsqueda recorre la lista más corta de los trigramas
+    del término y confirma la subcadena, de modo que la primera coincidencia
+    es la de menor codpuesto. Los resultados se memorizan por término.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[str, Dict[str, Any]]] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._results: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def add(self, concepto_key: str, entry: Dict[str, Any]) -> None:
+        position = len(self.entries)
+        self.entries.append((concepto_key, entry))
+        for gram in _ngrams(concepto_key):
+            self._postings.setdefault(gram, []).append(position)
+
+    def find(self, target: str, memoize: bool = True) -> Optional[Dict[str, Any]]:
+        if not memoize:
+            return self._find(target)
+        if target in self._results:
+            return self._results[target]
+        entry = self._find(target)
+        self._results[target] = entry
+        return entry
+
+    def _find(self, target: str) -> Optional[Dict[str, Any]]:
+        if len(target) < PUESTO_NGRAM_SIZE:
+            candidates: Iterable[int] = range(len(self.entries))
+        else:
+            postings = [self._postings.get(gram) for gram in _ngrams(target)]
+            if not all(postings):
+                return None
+            candidates = min(postings, key=len)
+        for position in candidates:
+            concepto_key, entry = self.entries[position]
+            if target in concepto_key:
+                return entry
+        return None
+
+
+class PuestoCatalog:
+    """
+    lista_puestos / lista_subpuestos / lista_categorias agrupada por empresa.
+
+    find_by_concepto equivale a `concepto LIKE '%texto%' ORDER BY codpuesto
+    LIMIT 1`, comparando con normalize_lookup_text, y se resuelve con un
+    índice de trigramas por empresa en lugar de recorrer todos los conceptos.
+    codiemp y codpuesto se comparan con _code_key, como MySQL en columnas
+    numéricas ('01' = 1).
+    """
+
+    def __init__(self, rows: Iterable[Tuple[Any, Any, Any]]):
+        """
+        Args:
+            rows: Filas (codiemp, codpuesto, concepto) ordenadas por codiemp y codpuesto
+        """
+        self._companies: Dict[str, _CompanyPuestos] = {}
+        self._concepto_by_codpuesto: Dict[Tuple[str, str], Any] = {}
+        self._size = 0
+        for codiemp, codpuesto, concepto in rows:
+            codiemp_key = _code_key(codiemp)
+            if codiemp_key is None:
+                continue
+            self._size += 1
+            entry = {'codpuesto': codpuesto, 'concepto': concepto}
+            codpuesto_key = _code_key(codpuesto)
+            if codpuesto_key is not None:
+                self._concepto_by_codpuesto.setdefault((codiemp_key, codpuesto_key), concepto)
+            if concepto is None:
+                continue
+            company = self._companies.get(codiemp_key)
+            if company is None:
+                company = self._companies[codiemp_key] = _CompanyPuestos()
+            company.add(normalize_lookup_text(str(concepto)), entry)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def find_by_concepto(self, codiemp: str, search_value: str, memoize: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Primer puesto (por codpuesto) de la empresa cuyo concepto contiene el texto.
+
+        Con memoize=False no se consulta ni se guarda el resultado memorizado
+        del término (para medir el índice).
+        """
+        company = self._companies.get(_code_key(codiemp))
+        target = normalize_lookup_text(search_value)
+        if company is None or not target:
+            return None
+        entry = company.find(target, memoize=memoize)
+        return dict(entry) if entry is not None else None
+
+    def scan_by_concepto(self, codiemp: str, search_value: str) -> Optional[Dict[str, Any]]:
+        """Igual que find_by_concepto pero recorriendo todos los conceptos (referencia para comparar)."""
+        company = self._companies.get(_code_key(codiemp))
+        target = normalize_lookup_text(search_value)
+        if company is None or not target:
+            return None
+        for concepto_key, entry in company.entries:
+            if target in concepto_key:
+                return dict(entry)
+        return None
+
+    def concepto_by_codpuesto(self, codiemp: str, codpuesto: str) -> Optional[Any]:
+        return self._concepto_by_codpuesto.get((_code_key(codiemp), _code_key(codpuesto)))
+
+
+class ReferenceTable:
+    """
+    Copia en memoria de una tabla de referencia, construida con `build`.
+
+    La copia se recarga al pasar `ttl_seconds` y, entre recargas, cada
+    `checksum_seconds` se compara CHECKSUM TABLE con el de la carga para
+    recoger cambios antes (un checksum NULL, p.ej. de una vista, se trata
+    como desconocido y se deja al TTL). Las consultas se hacen fuera del
+    lock y por un solo hilo a la vez: el resto sigue usando la copia
+    vigente y solo espera la primera carga. Si una recarga falla se sigue
+    usando la copia anterior.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        table: str,
+        query: str,
+        build: Callable[[List[Tuple]], Any],
+        ttl_seconds: float,
+        checksum_seconds: float
+    ):
+        self._database = database
+        self._table = table
+        self._query = query
+        self._build = build
+        self._ttl_seconds = ttl_seconds
+        self._checksum_seconds = checksum_seconds
+        self._condition = threading.Condition()
+        self._refreshing = False
+        self._catalog: Any = None
+        self._checksum: Optional[int] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def get(self) -> Any:
+        """
+        Devuelve el catálogo, cargándolo o recargándolo si corresponde.
+
+        Raises:
+            Error: Si no hay copia previa y la tabla no se puede leer
+        """
+        with self._condition:
+            while self._catalog is None and self._refreshing:
+                self._condition.wait()
+            catalog = self._catalog
+            now = time.monotonic()
+            expired = catalog is None or now - self._loaded_at >= self._ttl_seconds
+            check_due = self._checksum_seconds > 0 and now - self._checked_at >= self._checksum_seconds
+            if catalog is not None and (self._refreshing or not (expired or check_due)):
+                return catalog
+            self._refreshing = True
+            self._checked_at = now
+
+        try:
+            if not expired and not self._has_changed():
+                return catalog
+            return self._reload(catalog)
+        finally:
+            with self._condition:
+                self._refreshing = False
+                self._condition.notify_all()
+
+    def invalidate(self) -> None:
+        """Fuerza la recarga en el siguiente acceso."""
+        with self._condition:
+            self._loaded_at = float('-inf')
+
+    def _has_changed(self) -> bool:
+        """Compara CHECKSUM TABLE con el de la última carga (sin checksum conocido se asume que no)."""
+        try:
+            checksum = self._read_checksum()
+        except Error as e:
+            logger.warning(f"No se pudo comprobar CHECKSUM de {self._database}.{self._table}: {e}")
+            return False
+        if checksum is None or self._checksum is None or checksum == self._checksum:
+            return False
+        logger.info(f"{self._database}.{self._table} ha cambiado; recargando catálogo")
+        return True
+
+    def _read_checksum(self, cursor=None) -> Optional[int]:
+        if cursor is not None:
+            cursor.execute(f"CHECKSUM TABLE {self._table}")
+            row = cursor.fetchone()
+            return row[1] if row else None
+
+        connection = None
+        cursor = None
+        try:
+            connection = get_mysql_pool(self._database).get_connection()
+            cursor = connection.cursor()
+            return self._read_checksum(cursor)
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def _reload(self, previous: Any) -> Any:
+        connection = None
+        cursor = None
+        try:
+            connection = get_mysql_pool(self._database).get_connection()
+            cursor = connection.cursor()
+            # El checksum se lee antes que las filas: un cambio entre ambas lecturas provoca otra recarga
+            try:
+                checksum = self._read_checksum(cursor)
+            except Error as e:
+                logger.warning(f"No se pudo leer CHECKSUM de {self._database}.{self._table}: {e}")
+                checksum = None
+            cursor.execute(self._query)
+            catalog = self._build(cursor.fetchall() or [])
+        except Error as e:
+            if previous is None:
+                raise
+            logger.warning(f"Error recargando {self._database}.{self._table}, se mantiene la copia anterior: {e}")
+            with self._condition:
+                self._loaded_at = time.monotonic()
+            return previous
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+        with self._condition:
+            self._catalog = catalog
+            self._checksum = checksum
+            self._loaded_at = self._checked_at = time.monotonic()
+        logger.info(f"Catálogo {self._database}.{self._table} cargado: {len(catalog)} filas")
+        return catalog
+
+
+# Tabla -> (consulta, constructor del catálogo)
+_CATALOG_DEFINITIONS: Dict[str, Tuple[str, Callable[[List[Tuple]], Any]]] = {
+    'provincias_integracion': ("SELECT id, descripcion FROM provincias_integracion", ProvinciaCatalog),
+    'paises': ("SELECT codpais, cca3 FROM paises", PaisCatalog),
+    'lista_puestos': (
+        "SELECT codiemp, codpuesto, concepto FROM lista_puestos ORDER BY codiemp, codpuesto",
+        PuestoCatalog
+    ),
+    'lista_subpuestos': (
+        "SELECT codiemp, codpuesto, concepto FROM lista_subpuestos ORDER BY codiemp, codpuesto",
+        PuestoCatalog
+    ),
+    'lista_categorias': (
+        "SELECT codiemp, codpuesto, concepto FROM lista_categorias ORDER BY codiemp, codpuesto",
+        PuestoCatalog
+    ),
+}
+
+_tables: Dict[Tuple[str, str], ReferenceTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_reference_catalog(database: str, table: str) -> Any:
+    """
+    Devuelve el catálogo en memoria de una tabla de referencia, compartido por todo el proceso.
+
+    Args:
+        database: Esquema MySQL (p.ej. 'acceso', 'e03800')
+        table: Tabla de _CATALOG_DEFINITIONS
+
+    Returns:
+        ProvinciaCatalog, PaisCatalog o PuestoCatalog
+
+    Raises:
+        ValueError: Si la tabla no tiene catálogo
+        Error: Si la tabla no se puede cargar
+    """
+    if table not in _CATALOG_DEFINITIONS:
+        raise ValueError(f"Tabla no soportada: {table}")
+
+    key = (database, table)
+    with _tables_lock:
+        reference_table = _tables.get(key)
+        if reference_table is None:
+            query, build = _CATALOG_DEFINITIONS[table]
+            reference_table = ReferenceTable(
+                database,
+                table,
+                query,
+                build,
+                ttl_seconds=settings.reference_cache_ttl_seconds,
+                checksum_seconds=settings.reference_cache_checksum_seconds
+            )
+            _tables[key] = reference_table
+    return reference_table.get()
+
+
+def invalidate_reference_catalogs() -> None:
+    """Fuerza la recarga de todos los catálogos en su siguiente uso."""
+    with _tables_lock:
+        tables = list(_tables.values())
+    for reference_table in tables:
+        reference_table.invalidate()
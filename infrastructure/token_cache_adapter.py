@@ -0,0 +1,142 @@
+"""
+Adaptador para la tabla token_cache de MySQL.
+Comparte el token de Azure AD entre procesos (CLI, API, cron).
+"""
+import hashlib
+from mysql.connector import Error
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+from config.settings import settings
+from infrastructure.mysql_pool import get_mysql_pool
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombre del bloqueo con nombre de MySQL que serializa la renovación entre procesos
+REFRESH_LOCK_NAME = "interbus_365_token_refresh"
+
+
+def token_cache_key(tenant_id: str, client_id: str, resource: str) -> str:
+    """
+    Clave de token_cache para unas credenciales: hash SHA-256 de tenant, cliente y recurso.
+
+    Procesos con otra configuración sobre el mismo esquema no deben
+    reutilizar un token emitido para otro tenant, cliente o recurso.
+    """
+    return hashlib.sha256(f"{tenant_id}|{client_id}|{resource}".encode("utf-8")).hexdigest()
+
+
+class MySQLTokenCacheAdapter:
+    """
+    Lectura y escritura del token en la tabla token_cache.
+
+    Las fechas se manejan en UTC: la sesión se fija a '+00:00' para que
+    expires_at (TIMESTAMP) no dependa de la zona horaria del servidor.
+    """
+
+    def __init__(self):
+        self._database = settings.db_name
+
+    def _get_connection(self):
+        """Obtiene una conexión del pool compartido con la sesión en UTC."""
+        try:
+            # Pool propio: autocommit y zona horaria no deben filtrarse a otros adaptadores
+            return get_mysql_pool(self._database, autocommit=True, time_zone='+00:00').get_connection()
+        except Error as e:
+            logger.error(f"Error conectando a MySQL: {e}")
+            raise
+
+    def get_valid_token(self, cache_key: str, valid_until: datetime) -> Optional[Tuple[str, datetime]]:
+        """
+        Obtiene el token más reciente de las credenciales que siga vigente en la fecha indicada.
+
+        Args:
+            cache_key: Clave de las credenciales (ver token_cache_key)
+            valid_until: Fecha UTC (naive) hasta la que el token debe ser válido
+
+        Returns:
+            Tupla (token, expires_at) o None si no hay token vigente
+        """
+        connection = None
+        cursor = None
+
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            cursor.execute(
+                """
+                SELECT token, expires_at
+                FROM token_cache
+                WHERE cache_key = %s
+                  AND expires_at > %s
+                ORDER BY expires_at DESC
+                LIMIT 1
+                """,
+                (cache_key, valid_until)
+            )
+            row = cursor.fetchone()
+            return (row[0], row[1]) if row else None
+
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def save_token(self, cache_key: str, token: str, expires_at: datetime) -> None:
+        """
+        Guarda un token nuevo y elimina los caducados.
+
+        Args:
+            cache_key: Clave de las credenciales (ver token_cache_key)
+            token: Token de acceso
+            expires_at: Fecha UTC (naive) de caducidad
+        """
+        connection = None
+        cursor = None
+
+        try:
+            connection = self._get_connection()
+            cursor = connection.cursor()
+            cursor.execute(
+                "INSERT INTO token_cache (cache_key, token, expires_at) VALUES (%s, %s, %s)",
+                (cache_key, token, expires_at)
+            )
+            cursor.execute("DELETE FROM token_cache WHERE expires_at <= UTC_TIMESTAMP()")
+
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    @contextmanager
+    def refresh_lock(self, timeout_seconds: int) -> Iterator[bool]:
+        """
+        Bloqueo entre procesos para que solo uno renueve el token.
+
+        Usa GET_LOCK de MySQL, que se libera también si la conexión se cae.
+
+        Args:
+            timeout_seconds: Segundos máximos de espera por el bloqueo
+
+        Yields:
+            True si se obtuvo el bloqueo, False si venció la espera
+        """
+        connection = self._get_connection()
+        cursor = connection.cursor()
+        acquired = False
+
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (REFRESH_LOCK_NAME, timeout_seconds))
+            acquired = cursor.fetchone()[0] == 1
+            yield acquired
+        finally:
+            try:
+                if acquired:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (REFRESH_LOCK_NAME,))
+                    cursor.fetchone()
+            finally:
+                cursor.close()
+                connection.close()
@@ -1,29 +1,169 @@
 """
 Servicio para obtener tokens de Azure AD.
 Implementa el puerto TokenRepository.
+
+Los tokens se cachean en dos niveles: memoria del proceso y la tabla
+token_cache de MySQL (compartida entre procesos). Se renuevan en segundo
+plano poco antes de caducar y una sola petición de renovación está en
+vuelo a la vez.
 """
-import http.client
+import json
+import logging
+import threading
 import urllib.parse
-from typing import Dict, Any
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+from mysql.connector import Error
 from config.settings import settings
+from infrastructure.http_connection_pool import get_https_pool
+from infrastructure.token_cache_adapter import MySQLTokenCacheAdapter, token_cache_key
+
+logger = logging.getLogger(__name__)
 
 
 class AzureADTokenService:
     """Implementa la obtención de tokens de Azure AD."""
-    
+
+    # Caché en memoria compartida por todas las instancias del proceso:
+    # (tenant, client, resource) -> (token, expires_at UTC)
+    _memory_cache: Dict[Tuple[str, str, str], Tuple[str, datetime]] = {}
+    _refresh_timers: Dict[Tuple[str, str, str], threading.Timer] = {}
+    _cache_lock = threading.Lock()
+    _refresh_lock = threading.Lock()
+
     def __init__(self):
         self._tenant_id = settings.azure_ad_tenant_id
         self._client_id = settings.azure_ad_client_id
         self._client_secret = settings.azure_ad_client_secret
         self._resource = settings.azure_ad_resource
-    
+        self._pool = get_https_pool()
+        self._cache_key = (self._tenant_id, self._client_id, self._resource)
+        self._db_cache_key = token_cache_key(self._tenant_id, self._client_id, self._resource)
+        self._refresh_margin = timedelta(seconds=settings.token_refresh_margin_seconds)
+        self._db_cache = MySQLTokenCacheAdapter() if settings.token_db_cache_enabled else None
+
     def get_access_token(self) -> str:
         """
         Obtiene un token de acceso de Azure AD usando el flujo client credentials.
-        
+
+        Devuelve el token cacheado mientras le quede más vida que el margen
+        de renovación; si no, lo renueva (una sola vez aunque haya varias
+        llamadas concurrentes).
+
+        Returns:
+            str: Token de acceso
+
+        Raises:
+            Exception: Si falla la autenticación
+        """
+        token = self._get_memory_token()
+        if token:
+            return token
+
+        with self._refresh_lock:
+            # Otro hilo pudo renovarlo mientras esperábamos el bloqueo
+            token = self._get_memory_token()
+            if token:
+                return token
+            return self._refresh_token()
+
+    def _get_memory_token(self) -> Optional[str]:
+        """Devuelve el token en memoria si sigue vigente más allá del margen."""
+        with self._cache_lock:
+            cached = self._memory_cache.get(self._cache_key)
+        if cached and cached[1] - self._refresh_margin > datetime.utcnow():
+            return cached[0]
+        return None
+
+    def _refresh_token(self, force: bool = False) -> str:
+        """
+        Obtiene un token vigente de la tabla token_cache o de Azure AD.
+
+        Debe llamarse con _refresh_lock adquirido. Si MySQL no está
+        disponible se solicita el token directamente a Azure AD.
+
+        Args:
+            force: Ignorar el token vigente de la tabla (renovación proactiva)
+
         Returns:
             str: Token de acceso
-            
+        """
+        cached = None
+        if self._db_cache is not None:
+            try:
+                cached = self._refresh_shared_token(force)
+            except Error as e:
+                logger.warning(f"Caché de tokens en MySQL no disponible ({e}), solicitando token a Azure AD")
+
+        token, expires_at = cached or self._request_token()
+        self._store(token, expires_at)
+        return token
+
+    def _refresh_shared_token(self, force: bool) -> Tuple[str, datetime]:
+        """
+        Renueva el token coordinándose con otros procesos a través de token_cache.
+
+        Solo el proceso que obtiene el bloqueo de MySQL llama a Azure AD; el
+        resto reutiliza el token que ese proceso guarda en la tabla.
+        """
+        if not force:
+            cached = self._get_db_token()
+            if cached:
+                return cached
+
+        with self._db_cache.refresh_lock(settings.token_db_lock_timeout_seconds) as acquired:
+            if not acquired:
+                logger.warning("No se obtuvo el bloqueo de renovación de token, renovando sin él")
+
+            # Otro proceso pudo renovarlo mientras esperábamos el bloqueo
+            cached = self._get_db_token(self._refresh_margin * 2 if force else None)
+            if cached:
+                return cached
+
+            token, expires_at = self._request_token()
+            try:
+                self._db_cache.save_token(self._db_cache_key, token, expires_at)
+            except Error as e:
+                logger.warning(f"No se pudo guardar el token en MySQL: {e}")
+            return token, expires_at
+
+    def _get_db_token(self, min_remaining: Optional[timedelta] = None) -> Optional[Tuple[str, datetime]]:
+        """Lee de token_cache un token con más vida por delante que min_remaining (por defecto, el margen)."""
+        valid_until = datetime.utcnow() + (min_remaining or self._refresh_margin)
+        return self._db_cache.get_valid_token(self._db_cache_key, valid_until)
+
+    def _store(self, token: str, expires_at: datetime) -> None:
+        """Guarda el token en memoria y programa su renovación en segundo plano."""
+        with self._cache_lock:
+            self._memory_cache[self._cache_key] = (token, expires_at)
+            previous = self._refresh_timers.pop(self._cache_key, None)
+            if previous:
+                previous.cancel()
+
+            delay = (expires_at - self._refresh_margin - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                timer = threading.Timer(delay, self._background_refresh)
+                timer.daemon = True
+                timer.start()
+                self._refresh_timers[self._cache_key] = timer
+
+    def _background_refresh(self) -> None:
+        """Renueva el token antes de que caduque sin bloquear a los llamantes."""
+        try:
+            with self._refresh_lock:
+                self._refresh_token(force=True)
+            logger.debug("Token de Azure AD renovado en segundo plano")
+        except Exception as e:
+            # La siguiente llamada a get_access_token lo renovará de forma síncrona
+            logger.warning(f"Error renovando el token de Azure AD en segundo plano: {e}")
+
+    def _request_token(self) -> Tuple[str, datetime]:
+        """
+        Solicita un token nuevo a Azure AD.
+
+        Returns:
+            Tupla (token, expires_at UTC)
+
         Raises:
             Exception: Si falla la autenticación
         """
@@ -35,34 +175,32 @@ class AzureADTokenService:
             'resource': self._resource
         }
         payload = urllib.parse.urlencode(payload_data)
-        
+
         # Headers
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded'
         }
-        
+
         # Realizar petición
-        conn = http.client.HTTPSConnection("login.microsoftonline.com")
-        conn.request(
+        requested_at = datetime.utcnow()
+        response = self._pool.request(
+            "login.microsoftonline.com",
             "POST",
             f"/{self._tenant_id}/oauth2/token",
             payload,
             headers
         )
-        
-        response = conn.getresponse()
-        data = response.read().decode("utf-8")
-        
+        data = response.body
+
         if response.status != 200:
             raise Exception(f"Error obteniendo token: {data}")
-        
+
         # Parsear respuesta JSON
-        import json
-        token_data = json.loads(data)
-        
+        token_data: Dict[str, Any] = json.loads(data)
+
         if 'access_token' not in token_data:
             raise Exception(f"Token no encontrado en respuesta: {data}")
-        
-        return token_data['access_token']
-
 
+        # expires_in llega como cadena en el endpoint v1; se mide desde el envío
+        expires_in = int(token_data.get('expires_in', 3599))
+        return token_data['access_token'], requested_at + timedelta(seconds=expires_in)
@@ -0,0 +1,224 @@
+"""
+Índice en memoria de la tabla trabajadores de e03800.
+Resuelve las búsquedas de trabajador de EmployeeModifications (por nombre,
+NASS o NIF) sin una consulta por registro.
+"""
+import logging
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Campos de cada registro devuelto, iguales a los de las consultas individuales
+TRABAJADOR_FIELDS = ('coditraba', 'fechaalta', 'fechabaja', 'telefono', 'numeross', 'nif')
+
+# Intercalación supuesta si no se conoce la de la columna (la de los scripts de database/)
+DEFAULT_COLLATION = 'utf8mb4_unicode_ci'
+
+# Tipos de columna que MySQL compara como número ('0001' = 1)
+_NUMERIC_DATA_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint', 'decimal', 'numeric'}
+
+
+def normalize_trabajador_key(value: Any, collation: Optional[str] = None) -> Optional[str]:
+    """
+    Normaliza un valor de búsqueda imitando una intercalación de MySQL.
+
+    - Las intercalaciones PAD SPACE (todas salvo las _0900_) desprecian los
+      espacios finales.
+    - _bin y _cs distinguen mayúsculas y acentos; _as_ci solo acentos.
+    - El resto no distinguen mayúsculas ni acentos. La ñ solo se mantiene
+      distinta de la n en las intercalaciones españolas (_spanish_,
+      _spanish2_, _es_); en utf8mb4_unicode_ci o _general_ci ñ = n.
+
+    Args:
+        value: Valor a normalizar
+        collation: COLLATION_NAME de la columna (None = DEFAULT_COLLATION)
+
+    Returns:
+        Valor normalizado, o None para NULL (que nunca coincide)
+    """
+    if value is None:
+        return None
+    name = (collation or DEFAULT_COLLATION).lower()
+    text = str(value)
+    if '_0900_' not in name:
+        text = text.rstrip(' ')
+    if name.endswith('_bin') or '_cs' in name:
+        return text
+    text = text.casefold()
+    if '_as_' in name:
+        return text
+    keep_enye = '_spanish' in name or '_es_' in name
+    if keep_enye:
+        text = text.replace('ñ', '\0')
+    decomposed = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return text.replace('\0', 'ñ') if keep_enye else text
+
+
+def column_key_normalizer(collation: Optional[str], data_type: Optional[str]) -> Callable[[Any], Optional[str]]:
+    """
+    Devuelve la normalización que corresponde a una columna según information_schema.COLUMNS.
+
+    Las columnas numéricas comparan por valor ('0001' = '1'); las de texto,
+    según su intercalación (ver normalize_trabajador_key).
+    """
+    if (data_type or '').lower() in _NUMERIC_DATA_TYPES:
+        def numeric_key(value: Any) -> Optional[str]:
+            if value is None:
+                return None
+            text = str(value).strip()
+            try:
+                return str(int(text))
+            except ValueError:
+                return text
+        return numeric_key
+
+    return lambda value: normalize_trabajador_key(value, collation)
+
+
+class TrabajadorIndex:
+    """
+    Registros de trabajadores de un conjunto de empresas indexados en memoria.
+
+    Expone los mismos métodos de búsqueda que E03800DatabaseAdapter y
+    devuelve los mismos resultados (registros ordenados por fechaalta
+    descendente), de modo que puede usarse en su lugar.
+
+    Las claves se normalizan con la intercalación y el tipo de cada columna
+    (`columns`). Como una diferencia de intercalación haría pasar a un
+    trabajador existente por un alta nueva, las búsquedas sin resultado se
+    confirman con `fallback` (el adaptador) si se indica.
+    """
+
+    def __init__(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        columns: Optional[Mapping[str, Tuple[Optional[str], Optional[str]]]] = None,
+        fallback: Any = None
+    ):
+        """
+        Args:
+            rows: Filas de trabajadores ordenadas por fechaalta DESC, con codiemp,
+                nombre, apellido1, apellido2 y TRABAJADOR_FIELDS
+            columns: Columna -> (COLLATION_NAME, DATA_TYPE) de trabajadores
+            fallback: Objeto con los mismos métodos de búsqueda para confirmar los fallos
+        """
+        columns = columns or {}
+        self._normalizers: Dict[str, Callable[[Any], Optional[str]]] = {
+            column: column_key_normalizer(*columns.get(column, (None, None)))
+            for column in ('codiemp', 'nombre', 'apellido1', 'apellido2', 'numeross', 'nif')
+        }
+        self._fallback = fallback
+        self._fallback_hits = 0
+        self._by_name: Dict[Tuple, List[Dict[str, Any]]] = {}
+        self._by_nass: Dict[Tuple, List[Dict[str, Any]]] = {}
+        self._by_nif: Dict[Tuple, List[Dict[str, Any]]] = {}
+        self._size = 0
+
+        for row in rows:
+            self._size += 1
+            record = {field: row.get(field) for field in TRABAJADOR_FIELDS}
+            name_key = self._name_key(row.get('codiemp'), row.get('nombre'), row.get('apellido1'), row.get('apellido2'))
+            if None not in name_key:
+                self._by_name.setdefault(name_key, []).append(record)
+            nass_key = self._nass_key(row.get('codiemp'), record['numeross'])
+            if None not in nass_key:
+                self._by_nass.setdefault(nass_key, []).append(record)
+            nif_key = self._nif_key(row.get('codiemp'), record['nif'])
+            if None not in nif_key:
+                self._by_nif.setdefault(nif_key, []).append(record)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def fallback_hits(self) -> int:
+        """Búsquedas que el índice no encontró y la consulta SQL sí (deberían ser 0)."""
+        return self._fallback_hits
+
+    def _name_key(self, codiemp: Any, nombre: Any, apellido1: Any, apellido2: Any) -> Tuple:
+        normalize = self._normalizers
+        return (
+            normalize['codiemp'](codiemp),
+            normalize['nombre'](nombre),
+            normalize['apellido1'](apellido1),
+            normalize['apellido2'](apellido2)
+        )
+
+    def _nass_key(self, codiemp: Any, nass: Any) -> Tuple:
+        return (self._normalizers['codiemp'](codiemp), self._normalizers['numeross'](nass))
+
+    def _nif_key(self, codiemp: Any, nif: Any) -> Tuple:
+        return (self._normalizers['codiemp'](codiemp), self._normalizers['nif'](nif))
+
+    def _confirm_miss(self, method: str, *args: Any) -> Optional[Any]:
+        """Repite con el adaptador una búsqueda que el índice no encontró."""
+        if self._fallback is None:
+            return None
+        result = getattr(self._fallback, method)(*args)
+        if result is not None:
+            self._fallback_hits += 1
+            logger.warning(
+                f"Índice de trabajadores: {method} (empresa {args[0]}) no encontrado en memoria pero sí en e03800; "
+                f"revisar la intercalación de trabajadores"
+            )
+        return result
+
+    @staticmethod
+    def _build_info(records: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Mismo resultado que E03800DatabaseAdapter._build_trabajador_info."""
+        if not records:
+            return None
+
+        active_record = next(
+            (record for record in records if record.get('fechabaja') is None or record.get('fechabaja') == ''),
+            None
+        )
+        return {
+            'exists': True,
+            'has_active': active_record is not None,
+            'active_record': active_record,
+            'all_records': list(records)
+        }
+
+    @staticmethod
+    def _last_fechabaja(records: List[Dict[str, Any]]) -> Optional[Any]:
+        fechas = [record['fechabaja'] for record in records if record.get('fechabaja') not in (None, '')]
+        return max(fechas) if fechas else None
+
+    def find_trabajador(self, codiemp: str, nombre: str, apellido1: str, apellido2: str) -> Optional[Dict[str, Any]]:
+        records = self._by_name.get(self._name_key(codiemp, nombre, apellido1, apellido2))
+        if not records:
+            return self._confirm_miss('find_trabajador', codiemp, nombre, apellido1, apellido2)
+        return self._build_info(records)
+
+    def find_trabajador_by_nass(self, codiemp: str, nass: str) -> Optional[Dict[str, Any]]:
+        records = self._by_nass.get(self._nass_key(codiemp, nass))
+        if not records:
+            return self._confirm_miss('find_trabajador_by_nass', codiemp, nass)
+        return self._build_info(records)
+
+    def find_trabajador_by_nif(self, codiemp: str, nif: str) -> Optional[Dict[str, Any]]:
+        records = self._by_nif.get(self._nif_key(codiemp, nif))
+        if not records:
+            return self._confirm_miss('find_trabajador_by_nif', codiemp, nif)
+        return self._build_info(records)
+
+    def get_last_fechabaja(self, codiemp: str, nombre: str, apellido1: str, apellido2: str) -> Optional[Any]:
+        records = self._by_name.get(self._name_key(codiemp, nombre, apellido1, apellido2))
+        if not records:
+            return self._confirm_miss('get_last_fechabaja', codiemp, nombre, apellido1, apellido2)
+        return self._last_fechabaja(records)
+
+    def get_last_fechabaja_by_nass(self, codiemp: str, nass: str) -> Optional[Any]:
+        records = self._by_nass.get(self._nass_key(codiemp, nass))
+        if not records:
+            return self._confirm_miss('get_last_fechabaja_by_nass', codiemp, nass)
+        return self._last_fechabaja(records)
+
+    def get_last_fechabaja_by_nif(self, codiemp: str, nif: str) -> Optional[Any]:
+        records = self._by_nif.get(self._nif_key(codiemp, nif))
+        if not records:
+            return self._confirm_miss('get_last_fechabaja_by_nif', codiemp, nif)
+        return self._last_fechabaja(records)
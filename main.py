@@ -10,15 +10,19 @@ import json
 from config.settings import settings
 from config.logging_config import setup_logging
 from domain.ports import TokenRepository, DynamicsAPIAdapter, DatabaseAdapter
-from domain.constants import ENTITIES
+from domain.constants import ENTITIES, BIDIRECTIONAL_ENTITIES, ENTITY_DEPENDENCIES
 from infrastructure.token_service import AzureADTokenService
 from infrastructure.dynamics_api_adapter import DynamicsAPIAdapter
 from infrastructure.database_adapter import MySQLDatabaseAdapter
 from application.use_cases import SyncAllEntitiesUseCase, SyncDynamicsEntityUseCase
 from application.bidirectional_sync_use_case import BidirectionalSyncUseCase
+from application.sync_context import SyncContext
+from application.entity_scheduler import EntityScheduler
 from application.employee_modifications_use_case import SyncEmployeeModificationsUseCase
 from infrastructure.employee_modifications_adapter import EmployeeModificationsAdapter
 from infrastructure.e03800_database_adapter import E03800DatabaseAdapter
+from infrastructure.http_connection_pool import get_https_pool
+from infrastructure.mysql_pool import get_mysql_pool_stats
 from utils.validators import validate_config, validate_entity_name
 
 
@@ -46,6 +50,46 @@ def setup_dependencies() -> tuple:
     return token_service, dynamics_api, database_adapter
 
 
+def log_bidirectional_result(result: dict) -> None:
+    """
+    Muestra el resultado de la sincronización bidireccional de una entidad.
+
+    Args:
+        result: Resultado devuelto por BidirectionalSyncUseCase.execute
+    """
+    if result['success']:
+        logger.info(f"✓ {result['entity']}: Sincronización bidireccional completada")
+        logger.info(f"  - e03800: {result['e03800_count']} registros")
+        logger.info(f"  - Dynamics antes: {result['dynamics_initial_count']} registros")
+        logger.info(f"  - Dynamics después: {result['dynamics_final_count']} registros")
+        logger.info(f"  - Creados: {len(result['actions_taken']['created'])}")
+        logger.info(f"  - Eliminados: {len(result['actions_taken']['deleted'])}")
+        logger.info(f"  - Sin cambios: {len(result['actions_taken']['unchanged'])}")
+    else:
+        logger.error(f"✗ {result['entity']}: Error - {result.get('error', 'Desconocido')}")
+
+
+def log_schedule_report(report: dict) -> None:
+    """
+    Muestra los tiempos por entidad y la ruta crítica de una ejecución planificada.
+
+    Args:
+        report: Resultado de EntityScheduler.run
+    """
+    logger.info("Tiempos de sincronización bidireccional:")
+    for entity, seconds in sorted(report['timings'].items(), key=lambda item: -item[1]):
+        logger.info(f"  - {entity}: {seconds:.1f}s")
+    logger.info(
+        f"  Total: {report['elapsed_seconds']:.1f}s "
+        f"(suma por entidad {sum(report['timings'].values()):.1f}s)"
+    )
+    if report['critical_path']:
+        logger.info(
+            f"  Ruta crítica: {' -> '.join(report['critical_path'])} "
+            f"({report['critical_path_seconds']:.1f}s)"
+        )
+
+
 def main():
     """Función principal."""
     logger.info("="*60)
@@ -67,50 +111,37 @@ def main():
         logger.info("Inicializando base de datos...")
         database_adapter.initialize_database()
         
-        # Entidades con sincronización bidireccional especial
-        # El orden es IMPORTANTE: WorkerPlaces debe ir antes que ContributionAccountCodeCCs
-        BIDIRECTIONAL_ENTITIES = [
-            'CompanyATISAs', 
-            'WorkerPlaces', 
-            'ContributionAccountCodeCCs', 
-            'HolidaysAbsencesGroupATISAs', 
-            'VacationBalances',
-            'IncidentGroupATISAs', 
-            'AdvanceGroupATISAs', 
-            'LibrariesGroupATISAs', 
-            'LeaveGroupATISAs', 
-            'HighsLowsChanges', 
-            'VacationCalenders'
-        ]
-
         # Separar entidades con lógica especial
         standard_entities = [e for e in ENTITIES_TO_SYNC if e not in BIDIRECTIONAL_ENTITIES]
+        bidirectional_entities = [e for e in BIDIRECTIONAL_ENTITIES if e in ENTITIES_TO_SYNC]
 
         # 1. Sincronización bidireccional para entidades especiales
-        for entity in BIDIRECTIONAL_ENTITIES:
-            if entity in ENTITIES_TO_SYNC:
-                logger.info("\n" + "="*60)
-                logger.info(f"SINCRONIZACIÓN BIDIRECCIONAL ({entity})")
-                logger.info("="*60)
-
+        # El contexto comparte empresas, DBF y lecturas de Dynamics entre entidades
+        # y se vacía al terminar la ejecución. El planificador ejecuta en paralelo
+        # las entidades independientes (WorkerPlaces siempre antes que
+        # ContributionAccountCodeCCs)
+        with SyncContext("sincronización bidireccional") as context:
+            def sync_bidirectional(entity: str) -> dict:
+                logger.info(f"→ Sincronización bidireccional de {entity}")
                 bidirectional_use_case = BidirectionalSyncUseCase(
                     token_service,
                     dynamics_api,
-                    database_adapter
+                    database_adapter,
+                    context=context
                 )
-
                 result = bidirectional_use_case.execute(entity)
+                log_bidirectional_result(result)
+                return result
 
-                if result['success']:
-                    logger.info(f"✓ {result['entity']}: Sincronización bidireccional completada")
-                    logger.info(f"  - e03800: {result['e03800_count']} registros")
-                    logger.info(f"  - Dynamics antes: {result['dynamics_initial_count']} registros")
-                    logger.info(f"  - Dynamics después: {result['dynamics_final_count']} registros")
-                    logger.info(f"  - Creados: {len(result['actions_taken']['created'])}")
-                    logger.info(f"  - Eliminados: {len(result['actions_taken']['deleted'])}")
-                    logger.info(f"  - Sin cambios: {len(result['actions_taken']['unchanged'])}")
-                else:
-                    logger.error(f"✗ {result['entity']}: Error - {result.get('error', 'Desconocido')}")
+            scheduler = EntityScheduler(settings.sync_max_parallel_entities, ENTITY_DEPENDENCIES)
+            logger.info("\n" + "="*60)
+            logger.info(
+                f"SINCRONIZACIÓN BIDIRECCIONAL ({len(bidirectional_entities)} entidades, "
+                f"{settings.sync_max_parallel_entities} en paralelo)"
+            )
+            logger.info("="*60)
+            report = scheduler.run(bidirectional_entities, sync_bidirectional)
+            log_schedule_report(report)
         
         # 2. Sincronización estándar para el resto de entidades
         if standard_entities:
@@ -143,6 +174,18 @@ def main():
                         f"✗ {result['entity']}: Error - {result.get('error', 'Desconocido')}"
                     )
         
+        pool_stats = get_https_pool().get_stats()
+        logger.info(
+            f"Pool HTTPS: {pool_stats['hits']} reutilizadas, {pool_stats['misses']} nuevas, "
+            f"{pool_stats['reconnects']} reconexiones, {pool_stats['expired']} caducadas"
+        )
+        for database, mysql_stats in get_mysql_pool_stats().items():
+            logger.info(
+                f"Pool MySQL {database}: {mysql_stats['checkouts']} préstamos, "
+                f"{mysql_stats['created']} conexiones abiertas, "
+                f"espera máx. {mysql_stats['wait_seconds_max']:.3f}s"
+            )
+        
         logger.info("\n" + "="*60)
         logger.info("SINCRONIZACIÓN COMPLETADA")
         logger.info("="*60)
@@ -236,12 +279,13 @@ def test_employee_modifications():
         sys.exit(1)
 
 
-def sync_employee_modifications(limit: int = None):
+def sync_employee_modifications(limit: int = None, full_reconcile: bool = False):
     """
     Sincroniza registros de EmployeeModifications desde Dynamics 365.
     
     Args:
         limit: Límite de registros a procesar (None para todos)
+        full_reconcile: Descargar la entidad completa aunque haya marcas de agua
     """
     logger.info("="*60)
     logger.info("SINCRONIZACIÓN DE EMPLOYEE MODIFICATIONS")
@@ -282,12 +326,13 @@ def sync_employee_modifications(limit: int = None):
         if limit:
             logger.info(f"Procesando solo los primeros {limit} registros")
         
-        stats = use_case.sync(access_token, limit)
+        stats = use_case.sync(access_token, limit, full_reconcile=full_reconcile)
         
         # Mostrar resultados
         logger.info("\n" + "="*60)
         logger.info("RESULTADOS DE LA SINCRONIZACIÓN")
         logger.info("="*60)
+        logger.info(f"Modo: {stats.get('mode', 'full')}")
         logger.info(f"Total de registros: {stats['total']}")
         logger.info(f"✓ Procesados exitosamente: {stats['processed']}")
         logger.info(f"⊘ Omitidos: {stats['skipped']}")
@@ -320,21 +365,6 @@ def sync_single_entity(entity_name: str):
         # Inicializar base de datos
         database_adapter.initialize_database()
         
-        # Entidades con sincronización bidireccional
-        BIDIRECTIONAL_ENTITIES = [
-            'CompanyATISAs', 
-            'WorkerPlaces', 
-            'ContributionAccountCodeCCs', 
-            'HolidaysAbsencesGroupATISAs', 
-            'VacationBalances',
-            'IncidentGroupATISAs', 
-            'AdvanceGroupATISAs', 
-            'LibrariesGroupATISAs', 
-            'LeaveGroupATISAs', 
-            'HighsLowsChanges', 
-            'VacationCalenders'
-        ]
-        
         # Decidir qué caso de uso usar
         if entity_name in BIDIRECTIONAL_ENTITIES:
             logger.info("Usando sincronización bidireccional...")
@@ -385,14 +415,17 @@ if __name__ == "__main__":
             test_employee_modifications()
         # Comando para sincronizar EmployeeModifications
         elif command == "sync-employee-modifications":
-            # Opcional: segundo argumento es el límite de registros
+            # Opcional: límite de registros y --full para forzar la reconciliación completa
+            args = sys.argv[2:]
+            full_reconcile = '--full' in args
+            args = [arg for arg in args if arg != '--full']
             limit = None
-            if len(sys.argv) > 2:
+            if args:
                 try:
-                    limit = int(sys.argv[2])
+                    limit = int(args[0])
                 except ValueError:
-                    logger.warning(f"Límite inválido: {sys.argv[2]}. Procesando todos los registros.")
-            sync_employee_modifications(limit)
+                    logger.warning(f"Límite inválido: {args[0]}. Procesando todos los registros.")
+            sync_employee_modifications(limit, full_reconcile)
         else:
             # Sincronizar una entidad específica
             entity_name = command
@@ -0,0 +1,142 @@
+"""
+Compara la resolución de puestos por concepto: consulta SQL LIKE '%texto%'
+frente al catálogo en memoria (índice de trigramas y recorrido completo).
+El índice se mide sin la memoria de resultados por término; el camino
+memorizado, que es el que usa la sincronización, se informa aparte.
+
+Uso: python scripts/benchmark_puesto_lookup.py [tabla] [búsquedas] [búsquedas_sql]
+     tabla: lista_puestos | lista_subpuestos | lista_categorias (por defecto lista_puestos)
+"""
+import sys
+import os
+import logging
+import random
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from infrastructure.mysql_pool import get_mysql_pool
+from infrastructure.reference_catalog import get_reference_catalog
+
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+DATABASE = "e03800"
+
+
+def load_samples(table_name, count):
+    """Términos de búsqueda: fragmentos de conceptos reales de cada empresa y algunos inexistentes."""
+    connection = get_mysql_pool(DATABASE).get_connection()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT codiemp, concepto FROM {table_name} WHERE concepto IS NOT NULL")
+        rows = [(str(codiemp), str(concepto)) for codiemp, concepto in cursor.fetchall() if str(concepto).strip()]
+    finally:
+        cursor.close()
+        connection.close()
+
+    if not rows:
+        return []
+
+    rng = random.Random(42)
+    samples = []
+    for position in range(count):
+        codiemp, concepto = rng.choice(rows)
+        if rng.random() < 0.1:
+            samples.append((codiemp, f"zzqx{position}"))
+            continue
+        concepto = concepto.strip()
+        length = rng.randint(1, min(12, len(concepto)))
+        start = rng.randint(0, len(concepto) - length)
+        term = concepto[start:start + length].strip() or concepto
+        samples.append((codiemp, term))
+    return samples
+
+
+def sql_lookup(cursor, table_name, codiemp, term):
+    cursor.execute(
+        f"""
+        SELECT codpuesto, concepto
+        FROM {table_name}
+        WHERE codiemp = %s
+          AND concepto LIKE %s
+        ORDER BY codpuesto
+        LIMIT 1
+        """,
+        (codiemp, f"%{term}%")
+    )
+    return cursor.fetchone()
+
+
+def timed(label, samples, lookup):
+    start = time.perf_counter()
+    results = [lookup(codiemp, term) for codiemp, term in samples]
+    elapsed = time.perf_counter() - start
+    per_query_ms = elapsed / len(samples) * 1000 if samples else 0.0
+    logger.info(f"  {label:<22} {len(samples):>7} búsquedas  {elapsed:9.3f} s  {per_query_ms:9.4f} ms/búsqueda")
+    return results
+
+
+def codpuesto_of(entry):
+    if entry is None:
+        return None
+    if isinstance(entry, dict):
+        return entry.get('codpuesto')
+    return entry[0]
+
+
+def main():
+    table_name = sys.argv[1] if len(sys.argv) > 1 else "lista_puestos"
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    sql_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    logger.info(f"Cargando catálogo {DATABASE}.{table_name}...")
+    start = time.perf_counter()
+    catalog = get_reference_catalog(DATABASE, table_name)
+    logger.info(f"  {len(catalog)} filas en {time.perf_counter() - start:.3f} s")
+
+    samples = load_samples(table_name, queries)
+    if not samples:
+        logger.warning("La tabla no tiene conceptos")
+        return
+
+    logger.info(f"{len(set(samples))} términos distintos de {len(samples)} búsquedas")
+    logger.info("Resultados:")
+    indexed = timed(
+        "índice de trigramas",
+        samples,
+        lambda codiemp, term: catalog.find_by_concepto(codiemp, term, memoize=False)
+    )
+    scanned = timed("recorrido en memoria", samples, catalog.scan_by_concepto)
+    timed("índice + memoria", samples, catalog.find_by_concepto)
+
+    mismatches = sum(1 for a, b in zip(indexed, scanned) if codpuesto_of(a) != codpuesto_of(b))
+    logger.info(f"  Diferencias índice/recorrido: {mismatches}")
+
+    sql_samples = samples[:sql_queries]
+    connection = get_mysql_pool(DATABASE).get_connection()
+    cursor = connection.cursor()
+    try:
+        from_sql = timed(
+            "SQL LIKE",
+            sql_samples,
+            lambda codiemp, term: sql_lookup(cursor, table_name, codiemp, term)
+        )
+    finally:
+        cursor.close()
+        connection.close()
+
+    # La intercalación de MySQL y normalize_lookup_text pueden diferir (p.ej. espacios repetidos)
+    sql_mismatches = [
+        (codiemp, term, codpuesto_of(a), codpuesto_of(b))
+        for (codiemp, term), a, b in zip(sql_samples, indexed, from_sql)
+        if codpuesto_of(a) != codpuesto_of(b)
+    ]
+    logger.info(f"  Diferencias índice/SQL: {len(sql_mismatches)} de {len(sql_samples)}")
+    for codiemp, term, ours, theirs in sql_mismatches[:10]:
+        logger.info(f"    {codiemp} '{term}': índice={ours} SQL={theirs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Configuración común de las pruebas.
+
+config.settings exige un .env en el directorio de trabajo y las credenciales
+obligatorias; para las pruebas se usan valores ficticios.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+for name in (
+    "AZURE_AD_CLIENT_ID",
+    "AZURE_AD_CLIENT_SECRET",
+    "AZURE_AD_TENANT_ID",
+    "AZURE_AD_RESOURCE",
+    "DB_HOST",
+    "DB_USER",
+    "DB_PASSWORD",
+    "DB_NAME",
+    "API_BASE_URL",
+):
+    os.environ.setdefault(name, "test")
+
+if not os.path.exists(".env"):
+    _cwd = os.getcwd()
+    _env_dir = tempfile.mkdtemp()
+    Path(_env_dir, ".env").touch()
+    os.chdir(_env_dir)
+    try:
+        import config.settings  # noqa: F401
+    finally:
+        os.chdir(_cwd)
@@ -0,0 +1,111 @@
+"""
+El decodificador columnar (NumPy) y el lector por bloques deben devolver
+exactamente lo mismo, incluidos los campos binarios de Visual FoxPro.
+"""
+import datetime
+import struct
+
+import pytest
+
+from config.settings import settings
+from infrastructure import dbf_reader
+
+np = pytest.importorskip("numpy")
+
+# (nombre, tipo, longitud, decimales)
+FIELDS = [
+    ("CODIGO", "C", 3, 0),
+    ("NOMBRE", "C", 10, 0),
+    ("CANTIDAD", "I", 4, 0),
+    ("IMPORTE", "B", 8, 2),
+    ("ALTA", "T", 8, 0),
+]
+
+
+def _julian(moment: datetime.datetime) -> bytes:
+    day = moment.toordinal() + 1721425
+    millis = (moment.hour * 3600 + moment.minute * 60 + moment.second) * 1000
+    return struct.pack("<ii", day, millis)
+
+
+ROWS = [
+    # Enteros con bytes NUL finales (256 = 00 01 00 00) y double 0.0 (todo NUL)
+    (b" ", b"123", b"Ana", struct.pack("<i", 256), struct.pack("<d", 0.0), _julian(datetime.datetime(2024, 1, 2, 3, 4, 5))),
+    (b" ", b"456", b"Luis", struct.pack("<i", 1), struct.pack("<d", 12.5), _julian(datetime.datetime(2023, 6, 30))),
+    (b"*", b"123", b"Borrado", struct.pack("<i", 7), struct.pack("<d", 1.0), _julian(datetime.datetime(2022, 1, 1))),
+    (b" ", b"12", b"Eva", struct.pack("<i", -3), struct.pack("<d", -2.25), _julian(datetime.datetime(2020, 2, 29, 23, 59, 59))),
+]
+
+
+def _write_dbf(path):
+    record_length = 1 + sum(length for _, _, length, _ in FIELDS)
+    header_length = 32 + 32 * len(FIELDS) + 1 + 263
+    header = struct.pack(
+        "<BBBBIHH20x", 0x30, 124, 1, 1, len(ROWS), header_length, record_length
+    )
+    descriptors = b""
+    displacement = 1
+    for name, field_type, length, decimals in FIELDS:
+        descriptors += struct.pack(
+            "<11scIBB14x", name.encode("ascii"), field_type.encode("ascii"), displacement, length, decimals
+        )
+        displacement += length
+    body = b""
+    for flag, codigo, nombre, cantidad, importe, alta in ROWS:
+        body += flag + codigo.ljust(3) + nombre.ljust(10) + cantidad + importe + alta
+    path.write_bytes(header + descriptors + b"\r" + b"\0" * 263 + body + b"\x1a")
+    # dbfread exige el archivo de memo cuando hay campos B, aunque sean double
+    path.with_suffix(".fpt").write_bytes(struct.pack(">I2xH", 8, 64) + b"\0" * 504)
+    return path
+
+
+@pytest.fixture
+def dbf_path(tmp_path):
+    return _write_dbf(tmp_path / "prueba.dbf")
+
+
+def _read(path, monkeypatch, numpy_enabled, fields, where=None):
+    monkeypatch.setattr(settings, "dbf_numpy_enabled", numpy_enabled)
+    return list(dbf_reader.iter_dbf_records(path, fields, where))
+
+
+@pytest.mark.parametrize("where", [None, {"CODIGO": {"123"}}, {"CODIGO": {"12", "456"}}])
+def test_columnar_matches_block_reader_with_binary_fields(dbf_path, monkeypatch, where):
+    fields = ["CODIGO", "NOMBRE", "CANTIDAD", "IMPORTE", "ALTA"]
+
+    block = _read(dbf_path, monkeypatch, False, fields, where)
+    columnar = _read(dbf_path, monkeypatch, True, fields, where)
+
+    assert columnar == block
+    assert block
+
+
+def test_binary_fields_keep_trailing_nul_bytes(dbf_path, monkeypatch):
+    records = _read(dbf_path, monkeypatch, True, ["CANTIDAD", "IMPORTE", "ALTA"])
+
+    assert records[0] == {
+        "CANTIDAD": 256,
+        "IMPORTE": 0.0,
+        "ALTA": datetime.datetime(2024, 1, 2, 3, 4, 5),
+    }
+
+
+def test_filter_values_longer_than_field_do_not_match(dbf_path, monkeypatch):
+    where = {"CODIGO": {"1234"}}
+
+    assert _read(dbf_path, monkeypatch, False, ["CODIGO"], where) == []
+    assert _read(dbf_path, monkeypatch, True, ["CODIGO"], where) == []
+
+
+def test_parallel_read_uses_spawned_workers(dbf_path, monkeypatch):
+    # Los procesos "spawn" cargan config.settings de nuevo desde el directorio de trabajo
+    (dbf_path.parent / ".env").touch()
+    monkeypatch.chdir(dbf_path.parent)
+    monkeypatch.setattr(settings, "dbf_scan_workers", 2)
+    monkeypatch.setattr(settings, "dbf_parallel_min_records", 1)
+    fields = ["CODIGO", "NOMBRE", "CANTIDAD"]
+
+    parallel = dbf_reader.read_dbf_records(dbf_path, fields, {"CODIGO": ["123", "12"]})
+
+    assert parallel == _read(dbf_path, monkeypatch, True, fields, {"CODIGO": {"123", "12"}})
+    assert [record["NOMBRE"] for record in parallel] == ["Ana", "Eva"]